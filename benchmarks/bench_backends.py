@@ -0,0 +1,89 @@
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+from typing import Dict, List, Tuple, Union
+
+from common import example_path, timed, find_cxx, write_lexer, compile_driver, run_driver, synthetic_test1_program
+
+from jellycc.parser.ll.codegen import CodegenLH
+from jellycc.parser.lr.codegen import CodegenLR
+from jellycc.parser.run import Backends, BackendLR
+from jellycc.project.parser import parse_project
+from jellycc.project.project import Project
+from jellycc.utils.source import source_file
+
+
+def load_project(path: str) -> Project:
+	project = parse_project(source_file(path))
+	project.process()
+	return project
+
+
+def generate(path: str, backend: str, out_dir: str) -> Tuple[Project, Union[CodegenLH, CodegenLR]]:
+	# tables and source of one backend for a freshly processed grammar, the builders may annotate it
+	project = load_project(path)
+	generator = project.parser_generator
+	grammar = generator.grammar
+	grammar.core_header_path = os.path.join(out_dir, f"parser_{backend}.h")
+	grammar.core_source_path = os.path.join(out_dir, f"parser_{backend}.cpp")
+	with contextlib.redirect_stdout(io.StringIO()):
+		if backend == BackendLR:
+			codegen = CodegenLR(grammar, *generator.build_lr_table())
+		else:
+			codegen = CodegenLH(grammar, generator.build_lh_table(), generator.lh_dispatch)
+		codegen.run()
+	return project, codegen
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description="Compare the LH and LR parser backends on the same grammar")
+	parser.add_argument('--grammars', nargs='*', default=[example_path("test1.jcc")], help='grammars to generate both backends for')
+	parser.add_argument('--statements', type=int, default=200000, help='statements in the synthetic test1 program')
+	parser.add_argument('--repeat', type=int, default=5)
+	parser.add_argument('--cxx', default=None, help='C++ compiler for the throughput drivers, $CXX or c++ by default')
+	parser.add_argument('--no-compile', dest='compile', action='store_false', help='only report table sizes and generation time')
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as out_dir:
+		print(f"{'grammar':<16} {'backend':<8} {'bytes':>10} {'generation':>13}")
+		for path in args.grammars:
+			name = os.path.splitext(os.path.basename(path))[0]
+			for backend in Backends:
+				(_, codegen), seconds = timed(lambda: generate(path, backend, out_dir), args.repeat)
+				print(f"{name:<16} {backend:<8} {codegen.table_size():>10} {seconds * 1000:10.1f} ms")
+
+		if not args.compile:
+			return
+		cxx = find_cxx(args.cxx)
+		if cxx is None:
+			print("no C++ compiler found, skipping throughput")
+			return
+
+		# the synthetic program is valid test1 input, so the LR backend never needs error recovery
+		test1 = example_path("test1.jcc")
+		input_path = os.path.join(out_dir, "test1.input")
+		with open(input_path, 'w') as fp:
+			fp.write(synthetic_test1_program(args.statements))
+		lexer = write_lexer(load_project(test1), out_dir, "test1")
+
+		print()
+		print(f"{'backend':<8} {'tokens':>10} {'core':>13} {'vm':>13} {'Mtok/s':>8}")
+		results: List[Dict[str, str]] = []
+		for backend in Backends:
+			project, codegen = generate(test1, backend, out_dir)
+			binary = compile_driver(
+				cxx, os.path.join(out_dir, f"driver_{backend}"), lexer, codegen.grammar.core_source_path,
+				project.grammar.term_eof.value
+			)
+			result = run_driver(binary, input_path, args.repeat)
+			results.append(result)
+			tokens, core, vm = int(result["parsed_tokens"]), float(result["core"]), float(result["vm"])
+			print(f"{backend:<8} {tokens:>10} {core * 1000:10.2f} ms {vm * 1000:10.2f} ms {tokens / (core + vm) / 1e6:8.2f}")
+		if any(result["digest"] != results[0]["digest"] for result in results):
+			raise RuntimeError("parser backends disagree")
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,97 @@
+import argparse
+import os
+import tempfile
+from typing import List, Tuple
+
+from common import example_path, timed, find_cxx, write_lexer, compile_driver, run_driver, synthetic_test1_program, \
+	RecoveryInputPath
+
+from jellycc.parser.ll.codegen import CodegenLH, DispatchLayouts, DispatchDense
+from jellycc.parser.ll.lhtable import LHTable
+from jellycc.project.parser import parse_project
+from jellycc.project.project import Project
+from jellycc.utils.source import source_file
+
+
+def load_project() -> Project:
+	project = parse_project(source_file(example_path("test1.jcc")))
+	project.process()
+	return project
+
+
+def table_sizes(codegen: CodegenLH) -> Tuple[int, int]:
+	# bytes taken by the dispatch and sync dispatch arrays in the generated source
+	width = codegen.terminal_table_size
+	if codegen.dispatch == DispatchDense:
+		return (len(codegen.states) + 1) * width, len(codegen.sync_table.sync_rows) * width
+	assert codegen.dispatch_comb is not None and codegen.sync_dispatch_comb is not None
+	return codegen.dispatch_comb.byte_size(), codegen.sync_dispatch_comb.byte_size()
+
+
+def build_drivers(cxx: str, project: Project, table: LHTable, out_dir: str) -> List[str]:
+	lexer = write_lexer(project, out_dir, "test1")
+	grammar = project.parser_generator.grammar
+	binaries: List[str] = []
+	for layout in DispatchLayouts:
+		grammar.core_header_path = os.path.join(out_dir, f"parser_{layout}.h")
+		grammar.core_source_path = os.path.join(out_dir, f"parser_{layout}.cpp")
+		CodegenLH(grammar, table, layout).run()
+		binaries.append(compile_driver(
+			cxx, os.path.join(out_dir, f"driver_{layout}"), lexer, grammar.core_source_path, project.grammar.term_eof.value
+		))
+	return binaries
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description="Compare dense and comb-packed LH parser dispatch tables")
+	parser.add_argument('--statements', type=int, default=100000, help='size of the synthetic program parsed by the drivers')
+	parser.add_argument('--recovery-copies', type=int, default=5, help='copies of the error recovery test parsed by the drivers')
+	parser.add_argument('--repeat', type=int, default=5)
+	parser.add_argument('--cxx', default=None, help='C++ compiler for the throughput drivers, $CXX or c++ by default')
+	parser.add_argument('--no-compile', dest='compile', action='store_false', help='only report table sizes')
+	args = parser.parse_args()
+
+	project = load_project()
+	table = project.parser_generator.build_lh_table()
+
+	print(f"{'layout':<8} {'dispatch':>10} {'sync':>10} {'total':>10} {'codegen':>13}")
+	for layout in DispatchLayouts:
+		codegen = CodegenLH(project.parser_generator.grammar, table, layout)
+		_, seconds = timed(codegen.compute, 1)
+		dispatch, sync = table_sizes(codegen)
+		print(f"{layout:<8} {dispatch:>10} {sync:>10} {dispatch + sync:>10} {seconds * 1000:10.1f} ms")
+
+	if not args.compile:
+		return
+	cxx = find_cxx(args.cxx)
+	if cxx is None:
+		print("no C++ compiler found, skipping throughput")
+		return
+
+	with tempfile.TemporaryDirectory() as out_dir:
+		binaries = build_drivers(cxx, project, table, out_dir)
+		inputs = os.path.join(out_dir, "valid.test")
+		with open(inputs, 'w') as fp:
+			fp.write(synthetic_test1_program(args.statements))
+		recovery = os.path.join(out_dir, "recovery.test")
+		with open(RecoveryInputPath, 'r') as fp:
+			recovery_text = fp.read()
+		with open(recovery, 'w') as fp:
+			fp.write(recovery_text * args.recovery_copies)
+
+		print()
+		print(f"{'input':<10} {'layout':<8} {'tokens':>10} {'parse':>13} {'Mtok/s':>8}")
+		for name, path in (("valid", inputs), ("recovery", recovery)):
+			results: List[Tuple[str, ...]] = []
+			for layout, binary in zip(DispatchLayouts, binaries):
+				result = run_driver(binary, path, args.repeat)
+				results.append((result["parsed_tokens"], result["corrections"], result["variables"], result["digest"]))
+				tokens = int(result["parsed_tokens"])
+				seconds = sum(float(result.get(stage, 0)) for stage in ("core", "vm", "recovery"))
+				print(f"{name:<10} {layout:<8} {tokens:>10} {seconds * 1000:10.1f} ms {tokens / seconds / 1e6:8.2f}")
+			if any(result != results[0] for result in results):
+				raise RuntimeError(f"{name}: layouts disagree: {results}")
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,84 @@
+import argparse
+import contextlib
+import io
+from typing import Optional, List, Dict, Tuple, Any
+
+from common import example_path, timed, synthetic_parser_grammar
+
+from jellycc.parser.grammar import ParserGrammar
+from jellycc.parser.lr.lalr import LALRBuilder, LookaheadEngines, LookaheadsPropagate, LRTable
+from jellycc.parser.lr.lr1 import Shift
+from jellycc.parser.lr.recovery import RecoveryBuilder
+from jellycc.project.parser import parse_project
+from jellycc.utils.source import source_file
+
+
+def action_maps(table: LRTable) -> List[Dict[str, Tuple[Any, ...]]]:
+	# states of different builds are distinct objects, shifts are compared by state index
+	index = {id(state): idx for idx, state in enumerate(table.states)}
+	maps = []
+	for state in table.states:
+		actions: Dict[str, Tuple[Any, ...]] = dict()
+		for terminal, action in state.actions.items():
+			if isinstance(action, Shift):
+				actions[terminal.terminal.name] = ("shift", index[id(action.state)])
+			else:
+				actions[terminal.terminal.name] = ("action", action)
+		maps.append(actions)
+	return maps
+
+
+def run_case(name: str, grammar: ParserGrammar, repeat: int, skip_propagate_above: int) -> None:
+	items = sum(len(prod.symbols) + 1 for nt in grammar.nonterminals for prod in nt.prods)
+
+	def construct() -> LALRBuilder:
+		builder = LALRBuilder(grammar)
+		builder.find_nullables()
+		builder.find_first()
+		builder.construct_sets()
+		return builder
+
+	builder, lr0_time = timed(construct, repeat)
+	times = []
+	table: Optional[LRTable] = None
+	tables: List[LRTable] = []
+	for engine in LookaheadEngines:
+		if engine == LookaheadsPropagate and items > skip_propagate_above:
+			times.append(f"{'-':>13}")
+			continue
+		# conflicts are reported on stderr, they are not the point here
+		with contextlib.redirect_stderr(io.StringIO()):
+			table, seconds = timed(lambda: LALRBuilder(grammar, engine).build(), repeat)
+		tables.append(table)
+		times.append(f"{seconds * 1000:10.1f} ms")
+	if any(action_maps(other) != action_maps(tables[0]) for other in tables[1:]):
+		raise RuntimeError("lookahead engines disagree")
+
+	def recovery() -> RecoveryBuilder:
+		with contextlib.redirect_stdout(io.StringIO()):
+			recovery = RecoveryBuilder(grammar, table)
+			recovery.build()
+		return recovery
+
+	recovery_builder, recovery_time = timed(recovery, repeat)
+	times.append(f"{recovery_builder.node_count:>10} {recovery_time * 1000:10.1f} ms")
+	print(f"{name:<24} {items:>8} {len(builder.states):>8} {lr0_time * 1000:10.1f} ms {' '.join(times)}", flush=True)
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description="Measure LALR(1) table construction")
+	parser.add_argument('--statements', type=int, nargs='*', default=[50, 200], help='statement kinds of the synthetic grammars')
+	parser.add_argument('--repeat', type=int, default=1)
+	parser.add_argument('--skip-propagate-above', type=int, default=2000, help='skip the propagate lookahead engine for grammars with more items')
+	args = parser.parse_args()
+
+	print(f"{'grammar':<24} {'items':>8} {'states':>8} {'lr(0)':>13} {' '.join(f'{engine:>13}' for engine in LookaheadEngines)} {'nodes':>10} {'recovery':>13}", flush=True)
+	project = parse_project(source_file(example_path("test1.jcc")))
+	project.process()
+	run_case("examples/test1.jcc", project.parser_generator.grammar, args.repeat, args.skip_propagate_above)
+	for count in args.statements:
+		run_case(f"synthetic {count}", synthetic_parser_grammar(count), args.repeat, args.skip_propagate_above)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,59 @@
+import argparse
+import os
+import tempfile
+from typing import Dict, List, Sequence, Tuple
+
+from common import example_path, find_cxx, write_lexer, compile_driver, run_driver, synthetic_jellyscript_source, \
+	synthetic_jellyscript_runs
+
+from jellycc.lexer.grammar import LoopModes
+from jellycc.project.parser import parse_project
+from jellycc.utils.source import source_file
+
+
+def build_driver(cxx: str, out_dir: str, loop: str, flags: Sequence[str]) -> str:
+	project = parse_project(source_file(example_path("jellyscript.jcc")))
+	project.process(parser=False)
+	project.lexer_generator.lexer_grammar.loop = loop
+	lexer = write_lexer(project, out_dir, f"jellyscript_{loop}")
+	return compile_driver(cxx, os.path.join(out_dir, f"driver_{loop}"), lexer, flags=flags)
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description="Compare the generated lexer loop variants")
+	parser.add_argument('--mb', type=float, default=32, help='size of every synthetic input in megabytes')
+	parser.add_argument('--repeat', type=int, default=5)
+	parser.add_argument('--cxx', default=None, help='C++ compiler, $CXX or c++ by default')
+	parser.add_argument('--cxxflags', default='', help='extra compiler flags, e.g. -mavx2 for the AVX2 scanners of the simd loop')
+	args = parser.parse_args()
+
+	cxx = find_cxx(args.cxx)
+	if cxx is None:
+		print("no C++ compiler found")
+		return
+
+	with tempfile.TemporaryDirectory() as out_dir:
+		drivers = [(loop, build_driver(cxx, out_dir, loop, args.cxxflags.split())) for loop in LoopModes]
+
+		inputs: List[Tuple[str, str]] = []
+		size = int(args.mb * 1e6)
+		for name, text in (("tokens", synthetic_jellyscript_source(size)), ("runs", synthetic_jellyscript_runs(size))):
+			path = os.path.join(out_dir, f"{name}.input")
+			with open(path, 'w') as fp:
+				fp.write(text)
+			inputs.append((name, path))
+
+		print(f"{'input':<8} {'loop':<10} {'bytes':>10} {'tokens':>10} {'time':>13} {'MB/s':>8}")
+		for name, path in inputs:
+			results: List[Dict[str, str]] = []
+			for loop, binary in drivers:
+				result = run_driver(binary, path, args.repeat)
+				results.append(result)
+				size, tokens, seconds = int(result["bytes"]), int(result["tokens"]), float(result["lexer"])
+				print(f"{name:<8} {loop:<10} {size:>10} {tokens:>10} {seconds * 1000:10.2f} ms {size / seconds / 1e6:8.1f}")
+			if any(result["lexer_digest"] != results[0]["lexer_digest"] for result in results):
+				raise RuntimeError(f"{name}: loop variants disagree")
+
+
+if __name__ == '__main__':
+	main()
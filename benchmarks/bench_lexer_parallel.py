@@ -0,0 +1,78 @@
+import argparse
+import os
+import tempfile
+from typing import Dict, List, Optional, Tuple
+
+from common import example_path, timed, find_cxx, write_lexer, compile_driver, run_driver, build_lexer_tables, \
+	synthetic_jellyscript_source
+
+from jellycc.lexer.runtime import Lexer
+from jellycc.project.parser import parse_project
+from jellycc.utils.source import source_file
+
+
+def build_driver(cxx: str, out_dir: str, threads: Optional[int]) -> str:
+	project = parse_project(source_file(example_path("jellyscript.jcc")))
+	project.process(parser=False)
+	project.lexer_generator.lexer_grammar.parallel = True
+	name = f"threads_{threads}" if threads is not None else "serial"
+	lexer = write_lexer(project, out_dir, f"jellyscript_{name}")
+	flags = ["-pthread"]
+	if threads is not None:
+		flags.append(f"-DLEXER_THREADS={threads}")
+	return compile_driver(cxx, os.path.join(out_dir, f"driver_{name}"), lexer, flags=flags)
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description="Measure chunked parallel lexing against the sequential lexer")
+	parser.add_argument('--mb', type=float, default=64, help='size of the synthetic input for the generated lexer in megabytes')
+	parser.add_argument('--py-mb', type=float, default=4, help='size of the synthetic input for the Python lexer in megabytes')
+	parser.add_argument('--threads', default='1,2,4,8', help='comma separated thread counts')
+	parser.add_argument('--repeat', type=int, default=5)
+	parser.add_argument('--cxx', default=None, help='C++ compiler, $CXX or c++ by default')
+	args = parser.parse_args()
+	thread_counts = [int(count) for count in args.threads.split(',')]
+	print(f"{os.cpu_count()} cores")
+
+	project = parse_project(source_file(example_path("jellyscript.jcc")))
+	project.process(parser=False)
+	lexer = Lexer(build_lexer_tables(project))
+	data = synthetic_jellyscript_source(int(args.py_mb * 1e6)).encode()
+	print(f"{'python':<10} {'workers':>8} {'bytes':>10} {'tokens':>10} {'time':>13} {'MB/s':>8}")
+	expected, seconds = timed(lambda: lexer.tokenize(data), args.repeat)
+	print(f"{'serial':<10} {1:>8} {len(data):>10} {len(expected[0]):>10} {seconds * 1000:10.1f} ms {len(data) / seconds / 1e6:8.2f}")
+	for workers in thread_counts:
+		for name, processes in (("processes", True), ("threads", False)):
+			result, seconds = timed(lambda: lexer.tokenize_parallel(data, workers, processes), args.repeat)
+			print(f"{name:<10} {workers:>8} {len(data):>10} {len(result[0]):>10} {seconds * 1000:10.1f} ms {len(data) / seconds / 1e6:8.2f}")
+			if result != expected:
+				raise RuntimeError(f"{name} with {workers} workers disagree with the serial lexer")
+
+	cxx = find_cxx(args.cxx)
+	if cxx is None:
+		print("no C++ compiler found")
+		return
+
+	with tempfile.TemporaryDirectory() as out_dir:
+		path = os.path.join(out_dir, "jellyscript.input")
+		with open(path, 'w') as fp:
+			fp.write(synthetic_jellyscript_source(int(args.mb * 1e6)))
+
+		drivers: List[Tuple[str, Optional[int], str]] = [("run", None, build_driver(cxx, out_dir, None))]
+		for threads in thread_counts:
+			drivers.append(("parallel", threads, build_driver(cxx, out_dir, threads)))
+
+		print()
+		print(f"{'c++':<10} {'threads':>8} {'bytes':>10} {'tokens':>10} {'time':>13} {'MB/s':>8}")
+		results: List[Dict[str, str]] = []
+		for name, threads, binary in drivers:
+			result = run_driver(binary, path, args.repeat)
+			results.append(result)
+			size, tokens, seconds = int(result["bytes"]), int(result["tokens"]), float(result["lexer"])
+			print(f"{name:<10} {threads or 1:>8} {size:>10} {tokens:>10} {seconds * 1000:10.2f} ms {size / seconds / 1e6:8.1f}")
+		if any(result["lexer_digest"] != results[0]["lexer_digest"] for result in results):
+			raise RuntimeError("parallel lexing disagrees with the sequential lexer")
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,78 @@
+import argparse
+import os
+import tempfile
+from typing import Dict, List, Tuple
+
+from common import example_path, synthetic_keyword_grammar, find_cxx, write_lexer, compile_driver, run_driver, synthetic_jellyscript_source
+
+from jellycc.lexer.codegen import Codegen
+from jellycc.lexer.grammar import TableLayouts
+from jellycc.project.parser import parse_project
+from jellycc.project.project import Project
+from jellycc.utils.source import source_file, SourceInput
+
+
+def load_project(input: SourceInput) -> Project:
+	project = parse_project(input)
+	project.process(parser=False)
+	return project
+
+
+def table_sizes(name: str, project: Project) -> None:
+	generator = project.lexer_generator
+	dfa = generator.build_dfa()
+	for layout in TableLayouts:
+		generator.lexer_grammar.table_layout = layout
+		codegen = Codegen(generator.lexer_grammar, dfa)
+		codegen.compute()
+		print(f"{name:<16} {layout:<6} {dfa.num_states:>8} {dfa.num_classes:>8} {codegen.state_size * 8:>6} {codegen.table_size():>10}")
+
+
+def build_driver(cxx: str, out_dir: str, layout: str) -> str:
+	project = load_project(source_file(example_path("jellyscript.jcc")))
+	project.lexer_generator.lexer_grammar.table_layout = layout
+	lexer = write_lexer(project, out_dir, f"jellyscript_{layout}")
+	return compile_driver(cxx, os.path.join(out_dir, f"driver_{layout}"), lexer)
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description="Compare size and speed of the lexer table layouts")
+	parser.add_argument('--keywords', type=int, default=2000, help='keywords in the synthetic keyword grammar')
+	parser.add_argument('--mb', type=float, default=32, help='size of the synthetic jellyscript input in megabytes')
+	parser.add_argument('--repeat', type=int, default=5)
+	parser.add_argument('--cxx', default=None, help='C++ compiler, $CXX or c++ by default')
+	args = parser.parse_args()
+
+	print(f"{'grammar':<16} {'layout':<6} {'states':>8} {'classes':>8} {'bits':>6} {'bytes':>10}")
+	grammars: List[Tuple[str, Project]] = [
+		("jellyscript", load_project(source_file(example_path("jellyscript.jcc")))),
+		("test1", load_project(source_file(example_path("test1.jcc")))),
+		(f"keywords {args.keywords}", load_project(synthetic_keyword_grammar(args.keywords)))
+	]
+	for name, project in grammars:
+		table_sizes(name, project)
+
+	cxx = find_cxx(args.cxx)
+	if cxx is None:
+		print("no C++ compiler found")
+		return
+
+	with tempfile.TemporaryDirectory() as out_dir:
+		path = os.path.join(out_dir, "jellyscript.input")
+		with open(path, 'w') as fp:
+			fp.write(synthetic_jellyscript_source(int(args.mb * 1e6)))
+
+		print()
+		print(f"{'layout':<6} {'bytes':>10} {'tokens':>10} {'time':>13} {'MB/s':>8}")
+		results: List[Dict[str, str]] = []
+		for layout in TableLayouts:
+			result = run_driver(build_driver(cxx, out_dir, layout), path, args.repeat)
+			results.append(result)
+			size, tokens, seconds = int(result["bytes"]), int(result["tokens"]), float(result["lexer"])
+			print(f"{layout:<6} {size:>10} {tokens:>10} {seconds * 1000:10.2f} ms {size / seconds / 1e6:8.1f}")
+		if any(result["lexer_digest"] != results[0]["lexer_digest"] for result in results):
+			raise RuntimeError("table layouts disagree")
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,67 @@
+import argparse
+import contextlib
+import io
+import time
+
+from common import example_path, timed, synthetic_parser_grammar, synthetic_expression_grammar
+
+from jellycc.parser.grammar import ParserGrammar
+from jellycc.parser.ll.builder import LLBuilder
+from jellycc.project.parser import parse_project
+from jellycc.utils.source import source_file
+
+
+class TimedLLBuilder(LLBuilder):
+	def __init__(self, grammar: ParserGrammar):
+		super().__init__(grammar)
+		self.factor_seconds: float = 0.0
+		self.merge_seconds: float = 0.0
+
+	def left_factor(self) -> None:
+		start = time.perf_counter()
+		super().left_factor()
+		self.factor_seconds += time.perf_counter() - start
+
+	def merge_states(self) -> None:
+		start = time.perf_counter()
+		super().merge_states()
+		self.merge_seconds += time.perf_counter() - start
+
+
+def run_case(name: str, grammar: ParserGrammar, repeat: int) -> None:
+	prods = sum(len(nt.prods) for nt in grammar.nonterminals)
+
+	def build() -> TimedLLBuilder:
+		builder = TimedLLBuilder(grammar)
+		with contextlib.redirect_stdout(io.StringIO()):
+			builder.build()
+		return builder
+
+	builder, seconds = timed(build, repeat)
+	print(
+		f"{name:<24} {prods:>8} {len(builder.states):>8} {builder.factor_seconds * 1000:10.1f} ms "
+		f"{builder.merge_seconds * 1000:10.1f} ms {seconds * 1000:10.1f} ms"
+	)
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description="Measure LL state construction")
+	parser.add_argument('--statements', type=int, nargs='*', default=[100, 1000], help='statement kinds of the synthetic grammars')
+	parser.add_argument('--levels', type=int, nargs='*', default=[8, 16, 32], help='operator levels of the synthetic expression grammars')
+	parser.add_argument('--operators', type=int, default=4, help='operators per level of the synthetic expression grammars')
+	parser.add_argument('--repeat', type=int, default=1)
+	args = parser.parse_args()
+
+	# left factoring and merging times are of the last build, the total is the best of the repeats
+	print(f"{'grammar':<24} {'prods':>8} {'states':>8} {'left factor':>13} {'merge':>13} {'total':>13}")
+	project = parse_project(source_file(example_path("test1.jcc")))
+	project.process()
+	run_case("examples/test1.jcc", project.parser_generator.grammar, args.repeat)
+	for count in args.statements:
+		run_case(f"synthetic {count}", synthetic_parser_grammar(count), args.repeat)
+	for levels in args.levels:
+		run_case(f"expression {levels}x{args.operators}", synthetic_expression_grammar(levels, args.operators), args.repeat)
+
+
+if __name__ == '__main__':
+	main()
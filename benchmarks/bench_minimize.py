@@ -0,0 +1,45 @@
+import argparse
+
+from common import load_example_lexer, load_lexer_project, synthetic_keyword_grammar, build_dfa, timed
+
+from jellycc.lexer.dfa_minimize import MinimizeDFA, HopcroftMinimizeDFA
+from jellycc.project.project import Project
+
+
+def run_case(name: str, project: Project, repeat: int, legacy: bool) -> None:
+	dfa = build_dfa(project)
+	states = dfa.num_states
+
+	hopcroft, hopcroft_time = timed(lambda: HopcroftMinimizeDFA().run(dfa), repeat)
+	hopcroft_states = hopcroft.num_states
+
+	if legacy:
+		pairwise, pairwise_time = timed(lambda: MinimizeDFA().run(dfa), repeat)
+		pairwise_states = pairwise.num_states
+		if pairwise_states != hopcroft_states:
+			raise RuntimeError(f"{name}: state count mismatch {pairwise_states} != {hopcroft_states}")
+		legacy_str = f"{pairwise_time * 1000:10.1f} ms"
+	else:
+		legacy_str = f"{'-':>13}"
+
+	print(f"{name:<32} {states:>8} {hopcroft_states:>8} {legacy_str} {hopcroft_time * 1000:10.1f} ms")
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description="Compare lexer DFA minimization engines")
+	parser.add_argument('--keywords', type=int, nargs='*', default=[500, 2000, 5000])
+	parser.add_argument('--repeat', type=int, default=3)
+	parser.add_argument('--skip-legacy-above', type=int, default=5000, help='skip the pairwise minimizer for larger DFAs')
+	args = parser.parse_args()
+
+	print(f"{'grammar':<32} {'dfa':>8} {'min dfa':>8} {'pairwise':>13} {'hopcroft':>13}")
+	run_case("examples/jellyscript.jcc", load_example_lexer("jellyscript.jcc"), args.repeat, True)
+	run_case("examples/test1.jcc", load_example_lexer("test1.jcc"), args.repeat, True)
+	for count in args.keywords:
+		project = load_lexer_project(synthetic_keyword_grammar(count))
+		dfa_states = build_dfa(project).num_states
+		run_case(f"synthetic {count} keywords", project, args.repeat, dfa_states <= args.skip_legacy_above)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,46 @@
+import argparse
+from typing import List
+
+from common import example_path, timed, synthetic_jellyscript_source, build_lexer_tables
+
+from jellycc.lexer.runtime import Lexer, numpy
+from jellycc.project.parser import parse_project
+from jellycc.utils.source import source_file
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description="Measure the Python lexer runtime on the jellyscript lexer tables")
+	parser.add_argument('--mb', type=float, default=2, help='size of the single synthetic input in megabytes')
+	parser.add_argument('--batch', type=int, default=2000, help='number of small inputs lexed as a batch')
+	parser.add_argument('--batch-size', type=int, default=200, help='bytes in every small input')
+	parser.add_argument('--repeat', type=int, default=3)
+	args = parser.parse_args()
+
+	project = parse_project(source_file(example_path("jellyscript.jcc")))
+	project.process(parser=False)
+	lexer = Lexer(build_lexer_tables(project))
+	data = synthetic_jellyscript_source(int(args.mb * 1e6)).encode()
+	small: List[bytes] = [
+		synthetic_jellyscript_source(args.batch_size, seed=idx).encode()[:args.batch_size] for idx in range(args.batch)
+	]
+	small_bytes = sum(len(item) for item in small)
+
+	print(f"{'mode':<12} {'bytes':>10} {'tokens':>10} {'time':>13} {'MB/s':>8}")
+	(tokens, offsets), seconds = timed(lambda: lexer.tokenize(data), args.repeat)
+	print(f"{'single':<12} {len(data):>10} {len(tokens):>10} {seconds * 1000:10.1f} ms {len(data) / seconds / 1e6:8.2f}")
+
+	modes = [("batch", False)]
+	if numpy is not None:
+		modes.append(("batch numpy", True))
+	results = []
+	for name, vectorized in modes:
+		streams, seconds = timed(lambda: lexer.tokenize_many(small, vectorized), args.repeat)
+		count = sum(len(stream[0]) for stream in streams)
+		print(f"{name:<12} {small_bytes:>10} {count:>10} {seconds * 1000:10.1f} ms {small_bytes / seconds / 1e6:8.2f}")
+		results.append(streams)
+	if any(streams != results[0] for streams in results):
+		raise RuntimeError("batch modes disagree")
+
+
+if __name__ == '__main__':
+	main()
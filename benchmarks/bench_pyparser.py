@@ -0,0 +1,51 @@
+import argparse
+from array import array
+from typing import List, Tuple
+
+from common import example_path, timed, synthetic_test1_program, build_lexer_tables
+
+from jellycc.lexer.runtime import Lexer
+from jellycc.parser.ll.codegen import CodegenLH, DispatchLayouts
+from jellycc.parser.ll.runtime import Parser, ParserTables
+from jellycc.project.parser import parse_project
+from jellycc.utils.source import source_file
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description="Measure the Python LH parser runtime on the test1 parser tables")
+	parser.add_argument('--statements', type=int, default=20000, help='statements in the synthetic test1 program')
+	parser.add_argument('--repeat', type=int, default=3)
+	args = parser.parse_args()
+
+	project = parse_project(source_file(example_path("test1.jcc")))
+	project.process()
+	lexer = Lexer(build_lexer_tables(project))
+	table = project.parser_generator.build_lh_table()
+
+	tokens, _ = lexer.tokenize(synthetic_test1_program(args.statements).encode())
+
+	print(f"{'layout':<8} {'mode':<8} {'tokens':>10} {'actions':>10} {'setup':>13} {'parse':>13} {'Mtok/s':>8}")
+	results: List[List[str]] = []
+	for layout in DispatchLayouts:
+		codegen = CodegenLH(project.parser_generator.grammar, table, layout)
+		codegen.compute()
+		tables = ParserTables.from_codegen(codegen)
+		runtime, setup = timed(lambda: Parser(tables), 1)
+		input = runtime.filter_tokens(tokens)
+		entry = tables.entries["program"]
+		modes: List[Tuple[str, array, float]] = []
+		output, seconds = timed(lambda: runtime.run_rows(input, entry), args.repeat)
+		modes.append(("rows", output, seconds))
+		output, seconds = timed(lambda: runtime.run_tables(input, entry), args.repeat)
+		modes.append(("tables", output, seconds))
+		for mode, output, seconds in modes:
+			rate = len(input) / seconds / 1e6
+			print(f"{layout:<8} {mode:<8} {len(input):>10} {len(output):>10} {setup * 1000:10.1f} ms {seconds * 1000:10.1f} ms {rate:8.2f}")
+			# every layout and mode must produce the same actions
+			results.append([tables.megaactions[action] for action in output])
+	if any(result != results[0] for result in results):
+		raise RuntimeError("layouts disagree")
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,100 @@
+import argparse
+import os
+import tempfile
+from typing import Dict, List, Tuple
+
+from common import example_path, find_cxx, write_lexer, compile_driver, run_driver, synthetic_test1_program, \
+	synthetic_jellyscript_source, RecoveryInputPath
+
+from jellycc.project.parser import parse_project
+from jellycc.project.project import Project
+from jellycc.utils.source import source_file
+
+
+Stages = ("lexer", "core", "vm", "recovery")
+
+
+def load_project(name: str, parser: bool) -> Project:
+	project = parse_project(source_file(example_path(name)))
+	project.process(parser=parser)
+	return project
+
+
+def build_jellyscript(cxx: str, out_dir: str) -> str:
+	# the jellyscript parser grammar is still a stub, only its lexer is measured
+	project = load_project("jellyscript.jcc", False)
+	lexer = write_lexer(project, out_dir, "jellyscript")
+	return compile_driver(cxx, os.path.join(out_dir, "driver_jellyscript"), lexer)
+
+
+def build_test1(cxx: str, out_dir: str) -> str:
+	project = load_project("test1.jcc", True)
+	lexer = write_lexer(project, out_dir, "test1")
+	grammar = project.parser_generator.grammar
+	grammar.core_header_path = os.path.join(out_dir, "test1_parser.h")
+	grammar.core_source_path = os.path.join(out_dir, "test1_parser.cpp")
+	project.parser_generator.run_lh()
+	return compile_driver(
+		cxx, os.path.join(out_dir, "driver_test1"), lexer, grammar.core_source_path, project.grammar.term_eof.value
+	)
+
+
+def report(name: str, result: Dict[str, str]) -> None:
+	size = int(result["bytes"])
+	for stage in Stages:
+		if stage not in result:
+			continue
+		seconds = float(result[stage])
+		# parser stages see the tokens left after skipping, the lexer sees all of them
+		tokens = int(result["tokens"] if stage == "lexer" else result["parsed_tokens"])
+		if seconds > 0:
+			rates = f"{size / seconds / 1e6:10.1f} {tokens / seconds / 1e6:10.2f}"
+		else:
+			rates = f"{'-':>10} {'-':>10}"
+		print(f"{name:<22} {stage:<9} {tokens:>10} {seconds * 1000:10.2f} ms {rates}")
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description="Measure throughput of the generated lexer and parser runtime")
+	parser.add_argument('--lexer-mb', type=float, default=32, help='size of the synthetic jellyscript input in megabytes')
+	parser.add_argument('--statements', type=int, default=200000, help='statements in the synthetic test1 program')
+	parser.add_argument('--recovery-copies', type=int, default=5, help='copies of the error recovery test')
+	parser.add_argument('--repeat', type=int, default=5)
+	parser.add_argument('--cxx', default=None, help='C++ compiler, $CXX or c++ by default')
+	args = parser.parse_args()
+
+	cxx = find_cxx(args.cxx)
+	if cxx is None:
+		print("no C++ compiler found")
+		return
+
+	with tempfile.TemporaryDirectory() as out_dir:
+		jellyscript = build_jellyscript(cxx, out_dir)
+		test1 = build_test1(cxx, out_dir)
+
+		inputs: List[Tuple[str, str, str]] = []
+
+		path = os.path.join(out_dir, "jellyscript.input")
+		with open(path, 'w') as fp:
+			fp.write(synthetic_jellyscript_source(int(args.lexer_mb * 1e6)))
+		inputs.append(("jellyscript", jellyscript, path))
+
+		path = os.path.join(out_dir, "test1.input")
+		with open(path, 'w') as fp:
+			fp.write(synthetic_test1_program(args.statements))
+		inputs.append(("test1", test1, path))
+
+		path = os.path.join(out_dir, "recovery.input")
+		with open(RecoveryInputPath, 'r') as fp:
+			recovery_text = fp.read()
+		with open(path, 'w') as fp:
+			fp.write(recovery_text * args.recovery_copies)
+		inputs.append(("test1 recovery", test1, path))
+
+		print(f"{'input':<22} {'stage':<9} {'tokens':>10} {'time':>13} {'MB/s':>10} {'Mtok/s':>10}")
+		for name, binary, path in inputs:
+			report(name, run_driver(binary, path, args.repeat))
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,319 @@
+import os
+import random
+import shutil
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, TypeVar
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from jellycc.lexer.codegen import Codegen
+from jellycc.lexer.dfa import Builder, DFA
+from jellycc.lexer.runtime import LexerTables
+from jellycc.parser.grammar import ParserGrammar, SymbolTerminal, SymbolNonTerminal
+from jellycc.project.grammar import SharedGrammar, Terminal
+from jellycc.project.parser import parse_project
+from jellycc.project.project import Project
+from jellycc.utils.source import SourceInput, SrcLoc, source_file
+
+
+T = TypeVar('T')
+
+ExamplesDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples")
+DriverPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), "runtime_driver.cpp")
+RecoveryInputPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "parsertest", "test", "test1.test")
+
+
+def example_path(name: str) -> str:
+	return os.path.join(ExamplesDir, name)
+
+
+def load_lexer_project(input: SourceInput) -> Project:
+	# only the lexer part of the project is constructed, so grammars with unfinished parsers can be measured too
+	project = parse_project(input)
+	project.process(parser=False)
+	return project
+
+
+def load_example_lexer(name: str) -> Project:
+	return load_lexer_project(source_file(example_path(name)))
+
+
+def synthetic_keywords(count: int, seed: int = 0x600D5EED) -> List[str]:
+	rng = random.Random(seed)
+	alphabet = "abcdefghijklmnopqrstuvwxyz"
+	keywords: List[str] = []
+	seen = set()
+	while len(keywords) < count:
+		length = rng.randint(2, 10)
+		keyword = ''.join(rng.choice(alphabet) for i in range(length))
+		if keyword not in seen:
+			seen.add(keyword)
+			keywords.append(keyword)
+	return keywords
+
+
+def synthetic_keyword_grammar(count: int) -> SourceInput:
+	lines: List[str] = ["[terminals]", ""]
+	keywords = synthetic_keywords(count)
+	for idx, keyword in enumerate(keywords):
+		lines.append(f'"{keyword}": K_{idx};')
+	lines.extend((
+		"identifier: Identifier;",
+		"decimal_lit: Decimal;",
+		"space: \"Space\" {skip};",
+		"eof: \"EoF\" {eof};",
+		"error: \"Error\" {error};",
+		"",
+		"[lexer.grammar]",
+		""
+	))
+	for keyword in keywords:
+		lines.append(f'"{keyword}";')
+	lines.extend((
+		"identifier: [a-zA-Z_] [a-zA-Z0-9_]*;",
+		"decimal_lit: [0-9]+;",
+		"space: [ \\t\\r\\n]+;",
+		""
+	))
+	return SourceInput(f"<synthetic {count} keywords>", '\n'.join(lines))
+
+
+def synthetic_parser_grammar(statements: int, levels: int = 8) -> ParserGrammar:
+	# a conflict free LALR(1) grammar: a statement kind per keyword over a chain of binary operator levels
+	grammar = ParserGrammar(SharedGrammar())
+
+	def terminal(name: str) -> SymbolTerminal:
+		return grammar.add_terminal(SymbolTerminal(Terminal(SrcLoc("<synthetic>", 0, 0), name, name)))
+
+	def nonterminal(name: str) -> SymbolNonTerminal:
+		nt = SymbolNonTerminal(name)
+		grammar.add_nonterminal(nt)
+		return nt
+
+	eof, ident, number, semi, assign, lparen, rparen, lbrace, rbrace = map(
+		terminal, ("eof", "id", "num", ";", "=", "(", ")", "{", "}")
+	)
+	grammar.eof = eof
+	program = nonterminal("Program")
+	program.exported = True
+	grammar.exports[program.name] = program
+	grammar.keep.add(program)
+	stmts = nonterminal("Stmts")
+	stmt = nonterminal("Stmt")
+	block = nonterminal("Block")
+	exprs = [nonterminal(f"E{level}") for level in range(levels + 1)]
+	program.add_rule([stmts], None)
+	stmts.add_rule([stmts, stmt], None)
+	stmts.add_rule([], None)
+	block.add_rule([lbrace, stmts, rbrace], None)
+	for level in range(levels):
+		exprs[level].add_rule([exprs[level], terminal(f"op{level}"), exprs[level + 1]], None)
+		exprs[level].add_rule([exprs[level + 1]], None)
+	exprs[levels].add_rule([ident], None)
+	exprs[levels].add_rule([number], None)
+	exprs[levels].add_rule([lparen, exprs[0], rparen], None)
+	for idx in range(statements):
+		keyword = terminal(f"k{idx}")
+		kind = nonterminal(f"S{idx}")
+		kind.add_rule([keyword, exprs[idx % levels], semi], None)
+		kind.add_rule([keyword, block], None)
+		kind.add_rule([keyword, ident, assign, exprs[0], semi], None)
+		stmt.add_rule([kind], None)
+	return grammar
+
+
+def synthetic_expression_grammar(levels: int, operators: int) -> ParserGrammar:
+	# a statement is an expression or an assignment to an identifier, the LL builder left factors every
+	# statement start through all operator levels down to the identifier
+	grammar = ParserGrammar(SharedGrammar())
+
+	def terminal(name: str) -> SymbolTerminal:
+		return grammar.add_terminal(SymbolTerminal(Terminal(SrcLoc("<synthetic>", 0, 0), name, name)))
+
+	def nonterminal(name: str) -> SymbolNonTerminal:
+		nt = SymbolNonTerminal(name)
+		grammar.add_nonterminal(nt)
+		return nt
+
+	eof, ident, number, semi, assign, lparen, rparen = map(terminal, ("eof", "id", "num", ";", "=", "(", ")"))
+	grammar.eof = eof
+	program = nonterminal("Program")
+	program.exported = True
+	grammar.exports[program.name] = program
+	grammar.keep.add(program)
+	stmts = nonterminal("Stmts")
+	stmt = nonterminal("Stmt")
+	exprs = [nonterminal(f"E{level}") for level in range(levels + 1)]
+	program.add_rule([stmts], None)
+	stmts.add_rule([stmts, stmt], None)
+	stmts.add_rule([], None)
+	stmt.add_rule([exprs[0], semi], None)
+	stmt.add_rule([ident, assign, exprs[0], semi], None)
+	for level in range(levels):
+		for op in range(operators):
+			exprs[level].add_rule([exprs[level], terminal(f"op{level}_{op}"), exprs[level + 1]], None)
+		exprs[level].add_rule([exprs[level + 1]], None)
+	exprs[levels].add_rule([ident], None)
+	exprs[levels].add_rule([number], None)
+	exprs[levels].add_rule([ident, lparen, exprs[0], rparen], None)
+	exprs[levels].add_rule([lparen, exprs[0], rparen], None)
+	return grammar
+
+
+def build_dfa(project: Project) -> DFA:
+	generator = project.lexer_generator
+	assert generator.shared.term_error is not None
+	builder = Builder(generator.shared.term_error, generator.nfa_rules, 0)
+	return builder.build(generator.nfa_init)
+
+
+def build_lexer_tables(project: Project) -> LexerTables:
+	# the tables of the generated lexer, for the Python runtime; the project must be processed but not built yet
+	generator = project.lexer_generator
+	codegen = Codegen(generator.lexer_grammar, generator.build_dfa())
+	codegen.compute()
+	return LexerTables.from_codegen(codegen)
+
+
+def timed(fn: Callable[[], T], repeat: int = 1) -> Tuple[T, float]:
+	best = float("inf")
+	result = None
+	for i in range(repeat):
+		start = time.perf_counter()
+		result = fn()
+		best = min(best, time.perf_counter() - start)
+	return result, best
+
+
+def find_cxx(name: Optional[str] = None) -> Optional[str]:
+	return shutil.which(name or os.environ.get("CXX", "c++"))
+
+
+def write_lexer(project: Project, out_dir: str, name: str) -> Tuple[str, str]:
+	project.grammar.base_dir = out_dir
+	lexer_grammar = project.lexer_generator.lexer_grammar
+	lexer_grammar.header_path = os.path.join(out_dir, f"{name}_lexer.h")
+	lexer_grammar.source_path = os.path.join(out_dir, f"{name}_lexer.cpp")
+	project.lexer_generator.run()
+	return lexer_grammar.header_path, lexer_grammar.source_path
+
+
+def compile_driver(
+	cxx: str, binary: str, lexer: Tuple[str, str], parser_source: Optional[str] = None, token_eof: int = 0,
+	flags: Sequence[str] = ()
+) -> str:
+	# runtime_driver.cpp includes the parser source itself, only the lexer source is compiled separately
+	header, source = lexer
+	command = [cxx, "-std=c++17", "-O2", *flags, f'-DLEXER_H="{header}"']
+	if parser_source is not None:
+		command.extend((f'-DPARSER_SOURCE="{parser_source}"', f"-DTOKEN_EOF={token_eof}"))
+	command.extend(("-o", binary, DriverPath, source))
+	subprocess.run(command, check=True)
+	return binary
+
+
+def run_driver(binary: str, input_path: str, repeat: int) -> Dict[str, str]:
+	output = subprocess.run(
+		[binary, input_path, str(repeat)], check=True, stdout=subprocess.PIPE, universal_newlines=True
+	).stdout
+	return dict(line.split(' ', 1) for line in output.splitlines() if line)
+
+
+def synthetic_test1_program(statements: int, seed: int = 0x0D15BA7C) -> str:
+	# a valid examples/test1.jcc program, parsing it never enters recovery
+	rng = random.Random(seed)
+	names = [f"v{i}" for i in range(64)]
+
+	def expr(depth: int) -> str:
+		choice = rng.randint(0, 9 if depth > 0 else 2)
+		if choice == 0:
+			return str(rng.randint(0, 1000))
+		if choice == 1:
+			return f"{rng.randint(0, 1000)}.{rng.randint(0, 99)}"
+		if choice == 2:
+			return rng.choice(names)
+		if choice == 3:
+			return f"({expr(depth - 1)})"
+		if choice == 4:
+			return f"-({expr(depth - 1)})"
+		if choice == 5:
+			args = ", ".join(expr(depth - 1) for i in range(rng.randint(0, 3)))
+			return f"{rng.choice(names)}({args})"
+		op = rng.choice(("+", "-", "*", "/", "<", ">=", "==", "&&", "||"))
+		return f"{expr(depth - 1)} {op} {expr(depth - 1)}"
+
+	lines: List[str] = []
+	for i in range(statements):
+		if rng.randint(0, 15) == 0:
+			lines.append(f'import "m{i}" as {rng.choice(names)} {{{rng.choice(names)}, {rng.choice(names)} as {rng.choice(names)}}};')
+		else:
+			lines.append(f"{rng.choice(names)} = {expr(4)};")
+	return '\n'.join(lines) + '\n'
+
+
+def synthetic_jellyscript_runs(size: int, seed: int = 0x0A11C0DE) -> str:
+	# examples/jellyscript.jcc source dominated by long identifiers, comments, strings and indentation
+	rng = random.Random(seed)
+	words = [''.join(rng.choice("abcdefghijklmnopqrstuvwxyz") for i in range(rng.randint(2, 10))) for j in range(256)]
+
+	def text(count: int) -> str:
+		return ' '.join(rng.choice(words) for i in range(count))
+
+	parts: List[str] = []
+	length = 0
+	while length < size:
+		choice = rng.randint(0, 4)
+		if choice == 0:
+			part = "// " + text(rng.randint(5, 30)) + "\n"
+		elif choice == 1:
+			part = "/* " + text(rng.randint(20, 80)) + " */\n"
+		elif choice == 2:
+			part = '"' + text(rng.randint(5, 40)) + '";\n'
+		elif choice == 3:
+			part = ' ' * rng.randint(4, 32) + '_'.join(rng.choice(words) for i in range(rng.randint(2, 6))) + " = "
+		else:
+			part = '_'.join(rng.choice(words) for i in range(rng.randint(2, 6))) + "(" + str(rng.randint(0, 1 << 20)) + ");\n"
+		parts.append(part)
+		length += len(part)
+	return ''.join(parts)
+
+
+def synthetic_jellyscript_source(size: int, seed: int = 0x5C819700) -> str:
+	# token soup covering every examples/jellyscript.jcc terminal class, about size bytes long
+	rng = random.Random(seed)
+	names = [''.join(rng.choice("abcdefghijklmnopqrstuvwxyz_") for i in range(rng.randint(1, 12))) for j in range(256)]
+	operators = (
+		"(", ")", "[", "]", "{", "}", "#", "=", "+=", "-=", "*=", "/=", "%=", "&=", "|=", "^=", "<<=", ">>=", ">>>=",
+		"++", "--", "+", "-", "*", "/", "%", "~", "&", "|", "||", "&&", "^", "<<", ">>", ">>>",
+		"==", "!=", "<", ">", "<=", ">=", "->", ".", ",", ":", ";", "?"
+	)
+	parts: List[str] = []
+	length = 0
+	while length < size:
+		choice = rng.randint(0, 19)
+		if choice < 6:
+			part = rng.choice(names)
+		elif choice < 12:
+			part = rng.choice(operators)
+		elif choice == 12:
+			part = str(rng.randint(0, 1 << 20))
+		elif choice == 13:
+			part = f"{rng.randint(0, 9999)}.{rng.randint(0, 9999)}e{rng.randint(-9, 9)}"
+		elif choice == 14:
+			part = f"0x{rng.randint(0, 1 << 32):x}"
+		elif choice == 15:
+			part = f"0b{rng.randint(0, 1 << 16):b}"
+		elif choice == 16:
+			part = '"' + ' '.join(rng.choice(names) for i in range(rng.randint(0, 6))) + '\\n"'
+		elif choice == 17:
+			part = "// " + ' '.join(rng.choice(names) for i in range(rng.randint(0, 10))) + "\n"
+		elif choice == 18:
+			part = "/* " + ' '.join(rng.choice(names) for i in range(rng.randint(0, 10))) + " */"
+		else:
+			part = "import"
+		parts.append(part)
+		parts.append(rng.choice((" ", " ", " ", "\n", "\t")))
+		length += len(part) + 1
+	return ''.join(parts)
@@ -0,0 +1,265 @@
+// Lexes (and parses) an input with generated code and reports the time spent in each runtime stage.
+// LEXER_H names the generated lexer header. When PARSER_SOURCE names a generated test1 parser source
+// the tokens are parsed too; the source is included here so the stage hooks below are compiled into it,
+// and TOKEN_EOF is the value of the eof terminal. With LEXER_THREADS the input is lexed by run_parallel
+// on that many threads, the lexer must be generated with the parallel option.
+#include <chrono>
+#include <cmath>
+#include <cstdio>
+#include <cstdlib>
+#include <limits>
+#include <map>
+#include <string>
+#include <vector>
+
+namespace bench {
+
+enum Stage {
+	lexer,
+	core,
+	vm,
+	recovery,
+	StageCount
+};
+
+static const char* StageNames[StageCount] = {"lexer", "core", "vm", "recovery"};
+
+using Clock = std::chrono::steady_clock;
+
+static double Seconds[StageCount];
+static int Stack[16];
+static int Depth = 0;
+static Clock::time_point Mark;
+
+// time is charged to the innermost open stage only, so nested stages are not counted twice
+static void charge() {
+	Clock::time_point now = Clock::now();
+	if (Depth > 0) {
+		Seconds[Stack[Depth - 1]] += std::chrono::duration<double>(now - Mark).count();
+	}
+	Mark = now;
+}
+
+static void enter(Stage stage) {
+	charge();
+	Stack[Depth++] = stage;
+}
+
+static void leave() {
+	charge();
+	Depth--;
+}
+
+}
+
+#define JELLYCC_STAGE_ENTER(stage) bench::enter(bench::stage)
+#define JELLYCC_STAGE_LEAVE(stage) bench::leave()
+
+#include LEXER_H
+#ifdef PARSER_SOURCE
+#include PARSER_SOURCE
+#endif
+
+static std::string Source;
+static std::vector<uint16_t> Tokens;
+static std::vector<ll::LexerOffset> Offsets;
+
+static uint16_t TokenBuffer[16384];
+static ll::LexerOffset OffsetBuffer[16384];
+
+static void run_lexer() {
+	Tokens.clear();
+	Offsets.clear();
+	Offsets.push_back(0);
+#ifdef LEXER_THREADS
+	ll::run_parallel(
+#else
+	ll::run(
+#endif
+		{
+			nullptr,
+			[](void* ud, uint16_t* tokens, ll::LexerOffset* offsets, size_t count) {
+				Tokens.insert(Tokens.end(), tokens, tokens + count);
+				Offsets.insert(Offsets.end(), offsets, offsets + count);
+			},
+			[](void* ud, uint16_t** tokens, ll::LexerOffset** offsets, size_t* count) {
+				*tokens = TokenBuffer;
+				*offsets = OffsetBuffer;
+				*count = sizeof(TokenBuffer) / sizeof(TokenBuffer[0]);
+			}
+		},
+		(const uint8_t*)Source.data(),
+		Source.size()
+#ifdef LEXER_THREADS
+		, LEXER_THREADS
+#endif
+	);
+}
+
+#ifdef PARSER_SOURCE
+static uint32_t EmptyToken;
+static uint64_t Corrections;
+
+static std::string token_text(uint32_t pos) {
+	return Source.substr(Offsets[pos], Offsets[pos + 1] - Offsets[pos]);
+}
+
+static void insert_token(uint32_t*& tokid) {
+	Corrections++;
+	tokid--;
+	*tokid = EmptyToken;
+}
+
+static const CBData Callbacks = {
+	nullptr,
+	[](void*, uint32_t pos) -> std::string {
+		return token_text(pos);
+	},
+	[](void*, uint32_t pos) -> double {
+		try {
+			return std::stod(token_text(pos));
+		} catch (...) {
+			return std::numeric_limits<double>::quiet_NaN();
+		}
+	},
+	[](void*, const std::string& fname, DoubleList* args) -> double {
+		double sum = (double)fname.size();
+		for (; args; args = args->next) {
+			sum += args->val;
+		}
+		return sum;
+	},
+	[](void*, uint32_t*& tokid, size_t num) -> void {
+		Corrections += num;
+		tokid += num;
+	},
+	[](void*, uint32_t*& tokid, uint16_t terminal) -> void {
+		insert_token(tokid);
+	},
+	[](void*, uint32_t*& tokid, uint16_t terminal) -> void {
+		insert_token(tokid);
+	},
+	[](void*, uint32_t*& tokid) -> void {
+		Corrections++;
+		tokid++;
+	},
+	[](void*, uint32_t*& tokid, uint16_t terminal) -> void {
+		Corrections++;
+		*tokid = EmptyToken;
+	}
+};
+
+static void run_parser(int repeat, double* best) {
+	// inserted tokens refer to an empty token past the end of the input
+	EmptyToken = (uint32_t)Offsets.size();
+	Offsets.push_back(Offsets.back());
+	Offsets.push_back(Offsets.back());
+
+	std::vector<uint16_t> input;
+	std::vector<uint32_t> ids;
+	ids.push_back(0);
+	for (size_t i = 0; i < Tokens.size(); i++) {
+		if (!pp::skippable_flag[Tokens[i]]) {
+			ids.push_back((uint32_t)i);
+			input.push_back(Tokens[i]);
+		}
+	}
+	input.push_back(TOKEN_EOF);
+	ids.push_back(EmptyToken);
+
+	pp::ParserState* parser = pp::parser_create({
+		nullptr,
+		[](void* ud, size_t size) -> uint8_t* {
+			return (uint8_t*)malloc(size);
+		},
+		[](void* ud, uint8_t* ptr, size_t old_size, size_t new_size) -> uint8_t* {
+			return (uint8_t*)realloc(ptr, new_size);
+		},
+		[](void* ud, uint8_t* ptr, size_t size) {
+			free(ptr);
+		}
+	}, pp::DefaultConfig);
+
+	VarMap vars;
+	pp::ParseResult result = pp::ParseResult::OK;
+	for (int i = 0; i < repeat; i++) {
+		// recovery rewrites consumed token ids, every run starts from a fresh copy
+		std::vector<uint32_t> tokids = ids;
+		vars.clear();
+		Corrections = 0;
+		for (int stage = bench::core; stage < bench::StageCount; stage++) {
+			bench::Seconds[stage] = 0;
+		}
+		result = pp::parser_run(parser, pp::NonTerminal::program, input.data(), input.data() + input.size() - 1, &vars, tokids.data() + 1, Callbacks);
+		for (int stage = bench::core; stage < bench::StageCount; stage++) {
+			best[stage] = std::min(best[stage], bench::Seconds[stage]);
+		}
+	}
+	pp::parser_destroy(parser);
+
+	// a digest of the parse results, parsers generated with different options must agree on it
+	std::map<std::string, double> sorted(vars.begin(), vars.end());
+	double digest = 0;
+	for (auto& kv : sorted) {
+		if (!std::isnan(kv.second)) {
+			digest = digest * 31 + kv.second + (double)kv.first.size();
+		}
+	}
+	printf("parse_result %d\n", (int)result);
+	printf("parsed_tokens %zu\n", input.size());
+	printf("corrections %llu\n", (unsigned long long)Corrections);
+	printf("variables %zu\n", sorted.size());
+	printf("digest %.17g\n", digest);
+}
+#endif
+
+int main(int argc, char** argv) {
+	if (argc < 3) {
+		fprintf(stderr, "usage: %s input repeat\n", argv[0]);
+		return 2;
+	}
+	FILE* fp = fopen(argv[1], "rb");
+	if (!fp) {
+		fprintf(stderr, "cannot open %s\n", argv[1]);
+		return 2;
+	}
+	char buf[65536];
+	size_t n;
+	while ((n = fread(buf, 1, sizeof(buf), fp)) > 0) {
+		Source.append(buf, n);
+	}
+	fclose(fp);
+	int repeat = std::max(1, atoi(argv[2]));
+
+	double best[bench::StageCount];
+	for (int stage = 0; stage < bench::StageCount; stage++) {
+		best[stage] = std::numeric_limits<double>::infinity();
+	}
+	for (int i = 0; i < repeat; i++) {
+		bench::Seconds[bench::lexer] = 0;
+		bench::enter(bench::lexer);
+		run_lexer();
+		bench::leave();
+		best[bench::lexer] = std::min(best[bench::lexer], bench::Seconds[bench::lexer]);
+	}
+	printf("bytes %zu\n", Source.size());
+	printf("tokens %zu\n", Tokens.size());
+	// FNV-1a over the token stream, lexers generated with different options must agree on it
+	uint64_t lexer_digest = 14695981039346656037ull;
+	for (size_t i = 0; i < Tokens.size(); i++) {
+		lexer_digest = (lexer_digest ^ Tokens[i]) * 1099511628211ull;
+		lexer_digest = (lexer_digest ^ (uint64_t)Offsets[i + 1]) * 1099511628211ull;
+	}
+	printf("lexer_digest %016llx\n", (unsigned long long)lexer_digest);
+
+#ifdef PARSER_SOURCE
+	run_parser(repeat, best);
+#endif
+
+	for (int stage = 0; stage < bench::StageCount; stage++) {
+		if (best[stage] < std::numeric_limits<double>::infinity()) {
+			printf("%s %.9f\n", bench::StageNames[stage], best[stage]);
+		}
+	}
+	return 0;
+}
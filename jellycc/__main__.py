@@ -1,2 +1,6 @@
-import jellycc.run
+from jellycc.run import main
 
+
+# the guard keeps worker processes that re-import the main module from running the generator again
+if __name__ == '__main__':
+	main()
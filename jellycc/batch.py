@@ -0,0 +1,168 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Dict, Any, Optional, cast
+
+from jellycc.lexer.grammar import OffsetWidths, LoopModes, TableLayouts
+from jellycc.parser.ll.codegen import DispatchLayouts
+from jellycc.parser.lr.lalr import LookaheadEngines
+from jellycc.parser.run import Backends
+from jellycc.project.target import BuildTarget, build_target
+from jellycc.utils.error import CCError
+
+
+# manifest keys that hold paths, resolved relative to the manifest location
+PathKeys = ("input", "lexer_header", "lexer_source", "lexer_tables", "parser_header", "parser_source", "parser_tables", "base_dir", "cache_dir")
+NameKeys = ("lexer_ns", "lexer_prefix", "lexer_loop", "lexer_layout", "parser_ns", "parser_prefix", "parser_dispatch", "parser_backend", "lalr_lookaheads")
+
+
+class BatchResult:
+	def __init__(self, input: str, ok: bool, seconds: float, output: str, error: str) -> None:
+		self.input: str = input
+		self.ok: bool = ok
+		self.seconds: float = seconds
+		self.output: str = output
+		self.error: str = error
+
+
+def load_manifest(path: str) -> List[BuildTarget]:
+	with open(path, 'r', encoding='utf-8') as fp:
+		try:
+			manifest = json.load(fp)
+		except ValueError as e:
+			raise CCError(None, f"{path}: malformed manifest: {e}")
+	if isinstance(manifest, dict):
+		defaults = {key: value for key, value in manifest.items() if key != "grammars"}
+		entries = manifest.get("grammars", [])
+	else:
+		defaults = dict()
+		entries = manifest
+	if not isinstance(entries, list):
+		raise CCError(None, f"{path}: expected a list of grammars")
+	manifest_dir = os.path.dirname(os.path.abspath(path))
+	targets: List[BuildTarget] = []
+	for idx, entry in enumerate(entries):
+		if not isinstance(entry, dict):
+			raise CCError(None, f"{path}: grammar #{idx} must be an object")
+		options: Dict[str, Any] = dict(defaults)
+		options.update(entry)
+		if "input" not in options:
+			raise CCError(None, f"{path}: grammar #{idx} has no input")
+		target = BuildTarget(os.path.join(manifest_dir, options.pop("input")))
+		for key, value in options.items():
+			if key in PathKeys:
+				setattr(target, key, os.path.join(manifest_dir, value))
+			elif key == "lexer_offsets":
+				if value not in OffsetWidths:
+					raise CCError(None, f"{path}: grammar #{idx} has unsupported lexer offsets width '{value}'")
+				target.lexer_offsets = value
+			elif key == "lexer_loop" and value not in LoopModes:
+				raise CCError(None, f"{path}: grammar #{idx} has unknown lexer loop '{value}'")
+			elif key == "lexer_layout" and value not in TableLayouts:
+				raise CCError(None, f"{path}: grammar #{idx} has unknown lexer table layout '{value}'")
+			elif key == "lexer_parallel":
+				if not isinstance(value, bool):
+					raise CCError(None, f"{path}: grammar #{idx} option 'lexer_parallel' must be true or false")
+				target.lexer_parallel = value
+			elif key == "parser_dispatch" and value not in DispatchLayouts:
+				raise CCError(None, f"{path}: grammar #{idx} has unknown parser dispatch '{value}'")
+			elif key == "parser_backend" and value not in Backends:
+				raise CCError(None, f"{path}: grammar #{idx} has unknown parser backend '{value}'")
+			elif key == "lalr_lookaheads" and value not in LookaheadEngines:
+				raise CCError(None, f"{path}: grammar #{idx} has unknown lalr lookahead engine '{value}'")
+			elif key in NameKeys:
+				setattr(target, key, value)
+			else:
+				raise CCError(None, f"{path}: grammar #{idx} has unknown option '{key}'")
+		targets.append(target)
+	return targets
+
+
+def run_target(target: BuildTarget) -> BatchResult:
+	# generator progress is printed per grammar, keep it together instead of interleaving workers
+	output = io.StringIO()
+	begin = time.perf_counter()
+	error = ""
+	with contextlib.redirect_stdout(output):
+		try:
+			build_target(target)
+		except CCError as e:
+			error = str(e)
+		except Exception:
+			error = traceback.format_exc()
+	return BatchResult(target.input, not error, time.perf_counter() - begin, output.getvalue(), error)
+
+
+def run_batch(targets: List[BuildTarget], jobs: int) -> List[BatchResult]:
+	if jobs <= 1:
+		return [report(run_target(target)) for target in targets]
+	results: List[Optional[BatchResult]] = [None] * len(targets)
+	with ProcessPoolExecutor(max_workers=jobs) as executor:
+		futures = {executor.submit(run_target, target): idx for idx, target in enumerate(targets)}
+		for future in as_completed(futures):
+			results[futures[future]] = report(future.result())
+	return cast(List[BatchResult], results)
+
+
+def report(result: BatchResult) -> BatchResult:
+	status = "ok" if result.ok else "FAILED"
+	print(f"[{status}] {result.input} ({result.seconds:.3f}s)")
+	if not result.ok:
+		sys.stdout.write(result.output)
+		print(result.error)
+	sys.stdout.flush()
+	return result
+
+
+def main(argv: List[str]) -> int:
+	parser = argparse.ArgumentParser(
+		description="Generate lexers and parsers for every grammar listed in a manifest"
+	)
+	parser.add_argument('--jobs', '-j', dest='jobs', type=int, default=os.cpu_count() or 1, help='number of worker processes')
+	parser.add_argument('--cache-dir', dest='cache_dir', nargs=1, help='reuse lexer and parser tables stored in this directory')
+	parser.add_argument('--report', dest='report', nargs=1, help='write per-grammar timings as JSON, - for stdout')
+	parser.add_argument('manifest', metavar='manifest', type=str, nargs=1, help='JSON list of grammars and their outputs')
+	args = parser.parse_args(argv)
+
+	try:
+		targets = load_manifest(args.manifest[0])
+	except (CCError, OSError) as e:
+		print(e)
+		return 2
+	if args.cache_dir:
+		for target in targets:
+			target.cache_dir = args.cache_dir[0]
+
+	begin = time.perf_counter()
+	results = run_batch(targets, min(args.jobs, len(targets)))
+	total = time.perf_counter() - begin
+
+	failed = sum(1 for result in results if not result.ok)
+	print(f"{len(results) - failed} built, {failed} failed in {total:.3f}s")
+
+	if args.report:
+		text = json.dumps({
+			"total_seconds": total,
+			"grammars": [
+				{"input": result.input, "ok": result.ok, "seconds": result.seconds, "error": result.error}
+				for result in results
+			]
+		}, indent='\t')
+		if args.report[0] == '-':
+			print(text)
+		else:
+			with open(args.report[0], 'w') as fp:
+				fp.write(text)
+				fp.write('\n')
+
+	return 1 if failed else 0
+
+
+if __name__ == '__main__':
+	sys.exit(main(sys.argv[1:]))
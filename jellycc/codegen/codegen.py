@@ -61,7 +61,7 @@ class Template:
 
 
 Spaces = frozenset(" \t")
-ReSubst = re.compile("\\$\\{([:.a-zA-Z0-9_]*)}")
+ReSubst = re.compile("\\$\\{([:./a-zA-Z0-9_]*)}")
 
 
 def parse_template(path: str) -> Template:
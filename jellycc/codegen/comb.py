@@ -0,0 +1,119 @@
+import re
+from collections import Counter
+from typing import List, Dict, Tuple
+
+
+def uint_size(max_value: int) -> int:
+	# bytes of the narrowest unsigned C type that holds max_value
+	for size in (1, 2, 4):
+		if max_value < 1 << (size * 8):
+			return size
+	return 8
+
+
+def uint_type(max_value: int) -> str:
+	return f"uint{uint_size(max_value) * 8}_t"
+
+
+class CombTable:
+	# row-displacement packing of a sparse rows x width matrix, identical rows share one class:
+	#   cls = classes[row]
+	#   value(row, col) = values[base[cls] + col] if check[base[cls] + col] == cls else defaults[cls]
+	def __init__(self, width: int) -> None:
+		self.width: int = width
+		# check value of slots that belong to no class, the largest value of the check type
+		self.no_row: int = 0xff
+		self.classes: List[int] = []
+		self.class_map: Dict[Tuple[int, Tuple[Tuple[int, int], ...]], int] = dict()
+		self.defaults: List[int] = []
+		self.rows: List[Dict[int, int]] = []
+		self.base: List[int] = []
+		self.check: List[int] = []
+		self.values: List[int] = []
+
+	def add_row(self, default: int, entries: Dict[int, int]) -> int:
+		key = (default, tuple(sorted(entries.items())))
+		cls = self.class_map.get(key, None)
+		if cls is None:
+			cls = len(self.rows)
+			self.class_map[key] = cls
+			self.defaults.append(default)
+			self.rows.append(entries)
+		self.classes.append(cls)
+		return len(self.classes) - 1
+
+	def add_dense_row(self, values: List[int]) -> int:
+		# the most common value becomes the row default, only the remaining columns take slots
+		default = Counter(values).most_common(1)[0][0] if values else 0
+		return self.add_row(default, {col: value for col, value in enumerate(values) if value != default})
+
+	def pack(self) -> None:
+		self.base = [0] * len(self.rows)
+		occupied: bytearray = bytearray()
+		first_free = 0
+		# dense rows first, sparse rows then fill the gaps between them
+		order = sorted(range(len(self.rows)), key=lambda cls: (-len(self.rows[cls]), cls))
+		for cls in order:
+			columns = sorted(self.rows[cls])
+			if len(columns) == 0:
+				continue
+			# first fit: the lowest base from first_free on where every column of the row is free, the regex
+			# scans for the row's hole pattern in C instead of testing every base in Python
+			span = columns[-1] - columns[0] + 1
+			start = max(first_free, columns[0])
+			if len(occupied) < start + span:
+				occupied.extend(bytes(start + span - len(occupied)))
+			pattern = bytearray(b'.' * span)
+			for col in columns:
+				pattern[col - columns[0]] = 0
+			match = re.compile(bytes(pattern), re.DOTALL).search(occupied + bytes(span), start)
+			assert match is not None
+			base = match.start() - columns[0]
+			end = base + columns[-1] + 1
+			if len(occupied) < end:
+				occupied.extend(bytes(end - len(occupied)))
+			self.base[cls] = base
+			for col in columns:
+				occupied[base + col] = 1
+			while first_free < len(occupied) and occupied[first_free]:
+				first_free += 1
+
+		# every (row, col) lookup must stay in bounds, including rows that have no entries
+		size = max([base + self.width for base in self.base], default=0)
+		self.no_row = 0xff
+		while self.no_row <= len(self.rows):
+			self.no_row = (self.no_row << (uint_size(self.no_row) * 8)) | self.no_row
+		self.check = [self.no_row] * size
+		self.values = [0] * size
+		for cls, entries in enumerate(self.rows):
+			base = self.base[cls]
+			for col, value in entries.items():
+				self.check[base + col] = cls
+				self.values[base + col] = value
+
+	def check_type(self) -> str:
+		return uint_type(self.no_row)
+
+	def base_type(self) -> str:
+		return uint_type(max(self.base, default=0))
+
+	def value_type(self) -> str:
+		return uint_type(max(self.values + self.defaults, default=0))
+
+	def byte_size(self) -> int:
+		# class, default, base, check and value arrays as emitted in the generated source
+		check_size = uint_size(self.no_row)
+		base_size = uint_size(max(self.base, default=0))
+		values_size = uint_size(max(self.values + self.defaults, default=0))
+		return (
+			check_size * (len(self.classes) + len(self.check)) +
+			values_size * (len(self.defaults) + len(self.values)) +
+			base_size * len(self.base)
+		)
+
+	def get(self, row: int, col: int) -> int:
+		cls = self.classes[row]
+		idx = self.base[cls] + col
+		if self.check[idx] == cls:
+			return self.values[idx]
+		return self.defaults[cls]
@@ -1,17 +1,36 @@
 import json
-from typing import List, Dict, Set, Tuple, TextIO, Optional
+from typing import List, TextIO, Optional, Tuple, Dict
 
 from jellycc.codegen.codegen import CodePrinter, parse_template
-from jellycc.lexer.dfa import DFAState
-from jellycc.lexer.grammar import LexerGrammar
+from jellycc.codegen.comb import CombTable, uint_size, uint_type
+from jellycc.lexer.dfa import DFA, NoState
+from jellycc.lexer.grammar import LexerGrammar, LoopRuns, LoopSimd, TableComb
 
 import os
 
 from jellycc.project.grammar import Terminal
-from jellycc.utils.helpers import head
+from jellycc.utils.helpers import chunked
 
 AcceptBit = 1
 
+# byte ranges a vector scanner tests against, states needing more are left to the scalar loop
+MaxScannerRanges = 4
+
+ByteRange = Tuple[int, int]
+
+
+def byte_ranges(members: List[bool]) -> List[ByteRange]:
+	# inclusive ranges of the bytes set in members
+	ranges: List[ByteRange] = []
+	start: Optional[int] = None
+	for byte, member in enumerate(members + [False]):
+		if member and start is None:
+			start = byte
+		elif not member and start is not None:
+			ranges.append((start, byte - 1))
+			start = None
+	return ranges
+
 
 class PHFState:
 	def __init__(self, ch: Optional[int], token: Optional[Terminal], end_offset: int):
@@ -20,15 +39,29 @@ class PHFState:
 		self.end_offset: int = end_offset
 
 
+class SkipScanner:
+	# matches the bytes a state loops on: the bytes within ranges, or with stop set the bytes outside of them
+	def __init__(self, stop: bool, ranges: Tuple[ByteRange, ...]):
+		self.stop: bool = stop
+		self.ranges: Tuple[ByteRange, ...] = ranges
+
+
 class Codegen:
-	def __init__(self, grammar: LexerGrammar, dfa: DFAState) -> None:
+	def __init__(self, grammar: LexerGrammar, dfa: DFA) -> None:
 		self.grammar: LexerGrammar = grammar
-		self.initial_dfa: DFAState = dfa
-		self.all_states: List[DFAState] = []
-		self.state_idx: Dict[DFAState, int] = dict()
-		self.state_accepts: Dict[DFAState, int] = dict()
-		self.eq_classes: List[int] = [0] * 256
-		self.classes: List[Set[int]] = [set(range(256))]
+		self.dfa: DFA = dfa
+		self.state_accepts: List[int] = []
+		self.state_finals: List[int] = []
+		# next_state << 1 | AcceptBit, independent of the state width of the generated tables
+		self.transitions: List[int] = []
+		# bytes per state table entry, states are stored as byte offsets into the tables
+		self.state_size: int = 2
+		# bit of a table entry that marks emitting transitions
+		self.emit_bit: int = AcceptBit
+		self.comb: Optional[CombTable] = None
+		# scanners of the simd loop, state_scanners holds 1 + scanner index for every state, 0 for none
+		self.skip_scanners: List[SkipScanner] = []
+		self.state_scanners: List[int] = []
 		self.phf_data: List[PHFState] = []
 
 	def write(self, path: str) -> TextIO:
@@ -50,8 +83,32 @@ class Codegen:
 			with self.write(source_path) as fp:
 				parse_template(os.path.join(module_dir, "lexer.cpp")).run(self.grammar.shared.base_dir, source_path, fp, self.subst)
 
-	def state_to_value(self, state: DFAState) -> int:
-		return (self.state_idx[state]) * 2
+	def state_to_value(self, state: int) -> int:
+		return state * self.state_size
+
+	def transition_to_value(self, transition: int) -> int:
+		return self.state_to_value(transition >> 1) | (self.emit_bit if transition & AcceptBit else 0)
+
+	def equiv_values(self) -> List[int]:
+		if self.comb is not None:
+			return self.dfa.class_of.tolist()
+		return [self.state_to_value(klass * self.dfa.num_states) for klass in self.dfa.class_of]
+
+	def table_size(self) -> int:
+		# bytes of the generated equivalence, transition, accept and final tables
+		size = 256 * uint_size(max(self.equiv_values())) + 2 * self.dfa.num_states * self.state_size
+		comb = self.comb
+		if comb is not None:
+			# comb_default and comb_value hold states, the other arrays take the narrowest type
+			return (
+				size + uint_size(comb.no_row) * (len(comb.classes) + len(comb.check)) +
+				uint_size(max(comb.base, default=0)) * len(comb.base) +
+				self.state_size * (len(comb.defaults) + len(comb.values))
+			)
+		return size + len(self.transitions) * self.state_size
+
+	def equiv_type(self) -> str:
+		return uint_type(max(self.equiv_values()))
 
 	def subst(self, printer: CodePrinter, name: str) -> None:
 		if name == "lexer_prefix":
@@ -59,35 +116,76 @@ class Codegen:
 		elif name == "lexer_namespace":
 			printer.write(self.grammar.namespace)
 		elif name == "equiv_table":
-			for klass in self.eq_classes:
-				printer.write(f"{klass * 2 * len(self.all_states)},")
+			for value in self.equiv_values():
+				printer.write(f"{value},")
 		elif name == "equiv_stride":
-			printer.write(f"{len(self.all_states) * 2}")
+			printer.write(f"{self.state_to_value(self.dfa.num_states)}")
+		elif name == "lexer_equiv_type":
+			printer.write(self.equiv_type())
+		elif name == "lexer_emit_shift":
+			printer.write(str(self.emit_bit.bit_length() - 1))
+		elif name == "lexer_comb":
+			printer.write('1' if self.comb is not None else '0')
+		elif name == "lexer_comb_check_type":
+			if self.comb is not None:
+				printer.write(self.comb.check_type())
+		elif name == "lexer_comb_base_type":
+			if self.comb is not None:
+				printer.write(self.comb.base_type())
+		elif name == "lexer_comb_class_data":
+			if self.comb is not None:
+				self.write_data(printer, self.comb.classes)
+		elif name == "lexer_comb_default_data":
+			if self.comb is not None:
+				self.write_data(printer, self.comb.defaults)
+		elif name == "lexer_comb_base_data":
+			if self.comb is not None:
+				self.write_data(printer, self.comb.base)
+		elif name == "lexer_comb_check_data":
+			if self.comb is not None:
+				self.write_data(printer, self.comb.check)
+		elif name == "lexer_comb_value_data":
+			if self.comb is not None:
+				self.write_data(printer, self.comb.values)
+		elif name == "lexer_state_type":
+			printer.write(f"uint{self.state_size * 8}_t")
+		elif name == "lexer_offset_type":
+			printer.write(f"uint{self.grammar.offset_width}_t")
 		elif name == "lexer_unroll_count":
 			printer.write("8")
+		elif name == "lexer_skip_runs":
+			printer.write('1' if self.grammar.loop in (LoopRuns, LoopSimd) else '0')
+		elif name == "lexer_parallel":
+			printer.write('1' if self.grammar.parallel else '0')
+		elif name == "lexer_simd":
+			printer.write('1' if self.grammar.loop == LoopSimd else '0')
+		elif name == "skip_scanner_data":
+			for scanner in self.skip_scanners:
+				lows = [low for low, high in scanner.ranges]
+				widths = [high - low for low, high in scanner.ranges]
+				lows += [0] * (MaxScannerRanges - len(lows))
+				widths += [0] * (MaxScannerRanges - len(widths))
+				printer.writeln(
+					f"{{{1 if scanner.stop else 0}, {len(scanner.ranges)}, "
+					f"{{{', '.join(map(str, lows))}}}, {{{', '.join(map(str, widths))}}}}},"
+				)
+		elif name == "skip_state_data":
+			for chunk in chunked(self.state_scanners, 32):
+				printer.write(','.join(map(str, chunk)))
+				printer.writeln(',')
 		elif name == "fin_trans_table":
-			for state in self.all_states:
-				if state.accepts is not None:
-					val = AcceptBit
-				else:
-					val = 0
-				printer.write(f"{val}u, ")
+			for val in self.state_finals:
+				printer.write(f"{self.emit_bit if val & AcceptBit else 0}u, ")
 		elif name == "accept_table":
-			for state in self.all_states:
-				val = self.state_accepts[state]
+			for val in self.state_accepts:
 				printer.write(f"{val}u, ")
 		elif name == "trans_table":
-			for class_set in self.classes:
-				class_repr = head(class_set)
-				for state in self.all_states:
-					transition = state.trans[class_repr]
-					if transition is None:
-						initial_trans = self.initial_dfa.trans[class_repr]
-						assert initial_trans is not None
-						val: int = self.state_to_value(initial_trans) | AcceptBit
-					else:
-						val = self.state_to_value(transition)
-					printer.write(f"{val}u, ")
+			if self.comb is not None:
+				return
+			num_states = self.dfa.num_states
+			for klass in range(self.dfa.num_classes):
+				for val in self.transitions[klass * num_states:(klass + 1) * num_states]:
+					printer.write(f"{self.transition_to_value(val)}u, ")
 				printer.writeln("")
 		elif name == "lexer_terminals":
 			printer.writeln(f"#define {self.grammar.prefix}_TOKENS(X) \\")
@@ -99,52 +197,93 @@ class Codegen:
 			raise RuntimeError(f"INTERNAL ERROR: unresolved substitution '{name}'")
 
 	def compute(self) -> None:
-		def visit(state: DFAState) -> None:
-			self.state_idx[state] = len(self.all_states)
-			self.all_states.append(state)
-		self.initial_dfa.visit(visit)
 		self._build_classes()
 		self._build_accepts()
+		self._build_transitions()
+		self._choose_state_size()
+		if self.grammar.table_layout == TableComb:
+			self._build_comb()
+		if self.grammar.loop == LoopSimd:
+			self._build_scanners()
 
 	def _build_classes(self) -> None:
-		classes = self.classes
-
-		unique_refines: Set[Tuple[int, ...]] = set()
-
-		def refine(partition: Tuple[int, ...]):
-			if partition in unique_refines:
-				return
-			unique_refines.add(partition)
-			n = len(classes)
-			for idx in range(n):
-				clss = classes[idx]
-				inter = clss.intersection(partition)
-				if len(inter) == len(clss):
-					continue
-				if len(inter) == 0:
-					continue
-				clss.difference_update(inter)
-				classes.append(inter)
-
-		for state in self.all_states:
-			state_classes = dict()
-			for idx, target_state in enumerate(state.trans):
-				if target_state not in state_classes:
-					state_classes[target_state] = set()
-				state_classes[target_state].add(idx)
-			for target_state, chars in state_classes.items():
-				refine(tuple(chars))
-
-		for idx, chars in enumerate(classes):
-			for ch in chars:
-				self.eq_classes[ch] = idx
+		self.dfa = self.dfa.compact()
 
 	def _build_accepts(self) -> None:
-		for state in self.all_states:
-			if state.accepts is not None:
-				terminal_value = state.accepts.terminal.value
+		for accepts in self.dfa.accepts:
+			if accepts is not None:
+				terminal_value = accepts.terminal.value
 				assert terminal_value is not None
-				self.state_accepts[state] = terminal_value
+				self.state_accepts.append(terminal_value)
+				self.state_finals.append(AcceptBit)
 			else:
-				self.state_accepts[state] = 0
+				self.state_accepts.append(0)
+				self.state_finals.append(0)
+
+	def _build_transitions(self) -> None:
+		# class-major, a missing transition ends the token and restarts from the initial state
+		for klass in range(self.dfa.num_classes):
+			for state in range(self.dfa.num_states):
+				transition = self.dfa.get(state, klass)
+				if transition == NoState:
+					initial_trans = self.dfa.get(0, klass)
+					assert initial_trans != NoState
+					val: int = initial_trans << 1 | AcceptBit
+				else:
+					val = transition << 1
+				self.transitions.append(val)
 
+	def _choose_state_size(self) -> None:
+		# the narrowest entries that hold every state (as a byte offset) with the emit bit and every accepted
+		# token: 8-bit entries keep the emit bit in the high bit, wider ones in the low bit
+		max_state = self.dfa.num_states - 1
+		max_accept = max(self.state_accepts, default=0)
+		if max_state < 0x80 and max_accept <= 0xff:
+			self.state_size = 1
+			self.emit_bit = 0x80
+		elif (max_state * 2) | AcceptBit <= 0xffff and max_accept <= 0xffff:
+			self.state_size = 2
+			self.emit_bit = AcceptBit
+		else:
+			self.state_size = 4
+			self.emit_bit = AcceptBit
+		# class offsets into the transition table are 32-bit
+		assert self.state_to_value(self.dfa.num_classes * self.dfa.num_states) <= 0xffffffff
+
+	def _build_comb(self) -> None:
+		# rows are states, columns byte classes, each row keeps only transitions other than its most common one
+		num_states = self.dfa.num_states
+		comb = CombTable(self.dfa.num_classes)
+		for state in range(num_states):
+			comb.add_dense_row([
+				self.transition_to_value(self.transitions[klass * num_states + state])
+				for klass in range(self.dfa.num_classes)
+			])
+		comb.pack()
+		self.comb = comb
+
+	def write_data(self, printer: CodePrinter, data: List[int]) -> None:
+		for chunk in chunked(data, 32):
+			printer.write(','.join(map(str, chunk)))
+			printer.writeln(',')
+
+	def _build_scanners(self) -> None:
+		# states that loop to themselves on some bytes, the runs of such bytes are scanned a vector at a time
+		num_states = self.dfa.num_states
+		scanner_map: Dict[Tuple[bool, Tuple[ByteRange, ...]], int] = dict()
+		for state in range(num_states):
+			loops = [self.transitions[klass * num_states + state] == state << 1 for klass in self.dfa.class_of]
+			scanner = 0
+			if any(loops):
+				loop_ranges = byte_ranges(loops)
+				stop_ranges = byte_ranges([not loop for loop in loops])
+				if len(stop_ranges) < len(loop_ranges):
+					key = (True, tuple(stop_ranges))
+				else:
+					key = (False, tuple(loop_ranges))
+				if len(key[1]) <= MaxScannerRanges:
+					if key not in scanner_map:
+						scanner_map[key] = len(self.skip_scanners)
+						self.skip_scanners.append(SkipScanner(*key))
+					scanner = scanner_map[key] + 1
+			self.state_scanners.append(scanner)
@@ -1,10 +1,14 @@
-from collections import defaultdict
-from typing import Optional, List, Callable, Set, FrozenSet, Dict, Tuple, Union
+from array import array
+from itertools import repeat
+from typing import Optional, List, Set, FrozenSet, Dict, Tuple, Iterable, Iterator, Generator
 
 import sys
 
 from jellycc.lexer.nfa import NFAState, NFARule
 from jellycc.project.grammar import Terminal
+from jellycc.utils.graph import depth_first
+from jellycc.utils.profile import profiled
+from jellycc.utils.scc import topological_sort
 from jellycc.utils.source import SrcLoc
 
 
@@ -14,27 +18,101 @@ class Keyword:
 		self.strings: List[str] = []
 
 
-class DFAState:
-	def __init__(self) -> None:
-		self.trans: List[Optional[DFAState]] = [None] * 256
-		self.accepts: Optional[NFARule] = None
-		self.repr: Optional[DFAState] = None
-		self.paths: Optional[int] = 0
-
-	def visit(self, visitor: Callable[['DFAState'], None]) -> None:
-		visited: Set[DFAState] = set()
-
-		def _visit(state: Optional[DFAState]) -> None:
-			if state is None:
-				return
-			if state in visited:
-				return
-			visited.add(state)
-			visitor(state)
-			for target_state in state.trans:
-				_visit(target_state)
-
-		_visit(self)
+NoState = -1
+
+
+class DFA:
+	# states are rows of 'trans' indexed by byte class, state 0 is the initial state
+	def __init__(self, classes: List[List[int]]) -> None:
+		self.classes: List[List[int]] = classes
+		self.class_of: 'array[int]' = array('H', [0] * 256)
+		self.trans: 'array[int]' = array('i')
+		self.accepts: List[Optional[NFARule]] = []
+		for idx, chars in enumerate(classes):
+			for char in chars:
+				self.class_of[char] = idx
+
+	@property
+	def num_classes(self) -> int:
+		return len(self.classes)
+
+	@property
+	def num_states(self) -> int:
+		return len(self.accepts)
+
+	def add_state(self, accepts: Optional[NFARule] = None) -> int:
+		state = len(self.accepts)
+		self.accepts.append(accepts)
+		self.trans.extend(repeat(NoState, len(self.classes)))
+		return state
+
+	def get(self, state: int, klass: int) -> int:
+		return int(self.trans[state * len(self.classes) + klass])
+
+	def set(self, state: int, klass: int, target: int) -> None:
+		self.trans[state * len(self.classes) + klass] = target
+
+	def get_char(self, state: int, char: int) -> int:
+		return int(self.trans[state * len(self.classes) + self.class_of[char]])
+
+	def successors(self, state: int) -> Generator[int, None, None]:
+		seen: Set[int] = set()
+		for target in self.row(state):
+			if target != NoState and target not in seen:
+				seen.add(target)
+				yield target
+
+	def row(self, state: int) -> 'array[int]':
+		n = len(self.classes)
+		return self.trans[state * n:(state + 1) * n]
+
+	def compact(self) -> 'DFA':
+		# merges byte classes that have identical transitions in every state
+		n = len(self.classes)
+		columns: Dict[Tuple[int, ...], int] = dict()
+		column_map: List[int] = []
+		for klass in range(n):
+			column = tuple(self.trans[klass::n])
+			if column not in columns:
+				columns[column] = len(columns)
+			column_map.append(columns[column])
+		if len(columns) == n:
+			return self
+
+		classes: List[List[int]] = [[] for i in range(len(columns))]
+		for klass, chars in enumerate(self.classes):
+			classes[column_map[klass]].extend(chars)
+		for chars in classes:
+			chars.sort()
+
+		dfa = DFA(classes)
+		heads: List[int] = [column_map.index(idx) for idx in range(len(columns))]
+		for state in range(self.num_states):
+			base = state * n
+			dfa.accepts.append(self.accepts[state])
+			dfa.trans.extend(self.trans[base + klass] for klass in heads)
+		return dfa
+
+
+def find_alphabet_partition(char_sets: Iterable[FrozenSet[int]]) -> List[List[int]]:
+	# splits bytes into classes that no character set distinguishes
+	labels: List[int] = [0] * 256
+	next_label = 1
+	for chars in char_sets:
+		remap: Dict[int, int] = dict()
+		for char in chars:
+			label = labels[char]
+			if label not in remap:
+				remap[label] = next_label
+				next_label += 1
+			labels[char] = remap[label]
+
+	classes: Dict[int, List[int]] = dict()
+	for char, label in enumerate(labels):
+		if label not in classes:
+			classes[label] = []
+		classes[label].append(char)
+	return list(classes.values())
 
 
 class SCC:
@@ -70,122 +148,142 @@ class GraphNode:
 	def __init__(self, state: NFAState) -> None:
 		self.state: NFAState = state
 		self.scc: Optional[SCC] = None
-		self.scc_index: Optional[int] = None
-		self.scc_lowlink: Optional[int] = None
-		self.scc_onstack: bool = False
-		self.closure: Set[SCC] = set()
+		self.trans: List[Tuple[Tuple[int, ...], FrozenSet[SCC]]] = []
 
 
 class Builder:
 	def __init__(self, err: Terminal, rules: List[NFARule], keyword_threshold: int) -> None:
 		self.states: Dict[NFAState, GraphNode] = dict()
-		self.powerset: Dict[FrozenSet[SCC], DFAState] = dict()
-		self.worklist: List[Tuple[FrozenSet[SCC], DFAState]] = []
-		self.accepts: Dict[DFAState, List[NFARule]] = dict()
+		self.powerset: Dict[FrozenSet[SCC], int] = dict()
+		self.worklist: List[FrozenSet[SCC]] = []
+		self.dfa: DFA = DFA([list(range(256))])
 		self.rules: List[NFARule] = rules
 		self.keyword_threshold: int = keyword_threshold
 		self.keywords: Dict[NFARule, Keyword] = dict()
 		self.final_rule: NFARule = NFARule(-1, SrcLoc("", 0, 0), err)
 
-	def build(self, state: NFAState) -> DFAState:
+	def build(self, state: NFAState) -> DFA:
 		def pre_visit(state: NFAState) -> None:
 			self.states[state] = GraphNode(state)
 
 		state.visit(pre_visit)
 
 		self.find_scc()
+		self.build_class_transitions()
 
 		scc = self.states[state].scc
 		assert scc is not None
 		closure = scc.closure
 		assert closure is not None
-		dfa_state = self.get_dfa_for_subset(closure)
+		self.get_dfa_for_subset(closure)
 		self.process()
-		self.find_keywords(dfa_state)
-		self.resolve_accepts_from_keywords(dfa_state)
 
-		return dfa_state
+		dfa = self.dfa.compact()
+		self.find_keywords(dfa)
+		self.resolve_accepts_from_keywords(dfa)
 
-	def find_keywords(self, initial_state: DFAState) -> None:
-		initial_state.accepts = None
-		in_edges: Dict[DFAState, List[Tuple[int, DFAState]]] = defaultdict(lambda: [])
-		all_states: Set[DFAState] = set()
+		return dfa
 
-		def count_paths(initial_state: DFAState) -> None:
-			initial_state.paths = 1
+	@profiled("find_keywords")
+	def find_keywords(self, dfa: DFA) -> None:
+		dfa.accepts[0] = None
+		num_states = dfa.num_states
+		num_classes = dfa.num_classes
+		trans = dfa.trans
+		in_edges: List[List[Tuple[int, int]]] = [[] for i in range(num_states)]
+		paths: List[Optional[int]] = [0] * num_states
 
-			ins: Dict[DFAState, int] = defaultdict(lambda: 0)
-			worklist: List[DFAState] = []
+		def count_paths() -> None:
+			paths[0] = 1
 
-			def count_ins(state: DFAState) -> None:
-				for idx, target_state in enumerate(state.trans):
-					if target_state is not None:
-						ins[target_state] += 1
-						in_edges[target_state].append((idx, state))
-				all_states.add(state)
+			ins: List[int] = [0] * num_states
+			worklist: List[int] = []
 
-			initial_state.visit(count_ins)
+			for state in range(num_states):
+				base = state * num_classes
+				for klass in range(num_classes):
+					target_state = trans[base + klass]
+					if target_state != NoState:
+						ins[target_state] += 1
+						in_edges[target_state].append((klass, state))
 
-			if initial_state not in ins:
-				worklist.append(initial_state)
+			if ins[0] == 0:
+				worklist.append(0)
 
 			i = 0
 			while i < len(worklist):
 				state = worklist[i]
-				for target_state in state.trans:
-					if target_state is not None:
+				base = state * num_classes
+				for klass in range(num_classes):
+					target_state = trans[base + klass]
+					if target_state != NoState:
 						ins[target_state] -= 1
 						if ins[target_state] == 0:
 							worklist.append(target_state)
-						assert target_state.paths is not None
-						assert state.paths is not None
-						target_state.paths += state.paths
+						target_paths = paths[target_state]
+						state_paths = paths[state]
+						assert target_paths is not None
+						assert state_paths is not None
+						paths[target_state] = target_paths + state_paths * len(dfa.classes[klass])
 				i += 1
 
-			for state, count in ins.items():
+			for state, count in enumerate(ins):
 				if count > 0:
-					state.paths = None
+					paths[state] = None
 
-		count_paths(initial_state)
+		count_paths()
 
 		count_per_rule: Dict[NFARule, Optional[int]] = dict()
 
-		def visit_state(state: DFAState) -> None:
-			accept = state.accepts
+		for state in range(num_states):
+			accept = dfa.accepts[state]
 			if not accept:
-				return
+				continue
 			count = count_per_rule.get(accept, 0)
 			if count is None:
-				return
-			if state.paths is None:
+				continue
+			state_paths = paths[state]
+			if state_paths is None:
 				count_per_rule[accept] = None
 			else:
-				count_per_rule[accept] = count + state.paths
-
-		initial_state.visit(visit_state)
+				count_per_rule[accept] = count + state_paths
 
 		for rule, count in count_per_rule.items():
 			if count is not None and count <= self.keyword_threshold:
-				keyword = Keyword(rule)
-				self.keywords[rule] = keyword
+				self.keywords[rule] = Keyword(rule)
+
+		def incoming_chars(state: int) -> Generator[Tuple[int, int], None, None]:
+			for klass, from_state in in_edges[state]:
+				for char in dfa.classes[klass]:
+					yield char, from_state
+
+		def find_paths(state: int, keyword: Keyword) -> None:
+			if len(in_edges[state]) == 0:
+				keyword.strings.append('')
+				return
 
-		def find_paths(state: DFAState, keyword: Keyword) -> None:
 			path: List[int] = []
+			stack: List[Iterator[Tuple[int, int]]] = [incoming_chars(state)]
 
-			def visit(state: DFAState) -> None:
-				if state not in in_edges:
+			while len(stack) > 0:
+				edge = next(stack[-1], None)
+				if edge is None:
+					stack.pop()
+					if len(stack) > 0:
+						path.pop()
+					continue
+				char, from_state = edge
+				path.append(char)
+				if len(in_edges[from_state]) == 0:
 					keyword.strings.append(''.join(map(chr, reversed(path))))
+					path.pop()
 				else:
-					for char, from_state in in_edges[state]:
-						path.append(char)
-						visit(from_state)
-						path.pop()
-
-			visit(state)
+					stack.append(incoming_chars(from_state))
 
-		for state in all_states:
-			if state.accepts is not None:
-				keyword = self.keywords.get(state.accepts, None)
+		for state in range(num_states):
+			accept = dfa.accepts[state]
+			if accept is not None:
+				keyword = self.keywords.get(accept, None)
 				if keyword is not None:
 					find_paths(state, keyword)
 
@@ -196,81 +294,69 @@ class Builder:
 	def process(self) -> None:
 		i: int = 0
 		while i < len(self.worklist):
-			subset, dfa_state = self.worklist[i]
-			self.process_dfa_state(subset, dfa_state)
+			self.process_dfa_state(i, self.worklist[i])
 			i += 1
 
-	def process_dfa_state(self, subset: FrozenSet[SCC], dfa_state: DFAState) -> None:
-		transitions: List[Set[SCC]] = [set() for i in range(256)]
+	def build_class_transitions(self) -> None:
+		char_sets: Set[FrozenSet[int]] = set()
+		for node in self.states.values():
+			for chars, _ in node.state.trans:
+				char_sets.add(chars)
+
+		self.dfa = DFA(find_alphabet_partition(char_sets))
+
+		set_classes: Dict[FrozenSet[int], Tuple[int, ...]] = dict()
+		for chars in char_sets:
+			set_classes[chars] = tuple(sorted(set(self.dfa.class_of[char] for char in chars)))
+
+		for node in self.states.values():
+			for chars, target_state in node.state.trans:
+				target_scc = self.states[target_state].scc
+				assert target_scc is not None
+				assert target_scc.closure is not None
+				node.trans.append((set_classes[chars], target_scc.closure))
+
+	def process_dfa_state(self, dfa_state: int, subset: FrozenSet[SCC]) -> None:
+		transitions: List[List[FrozenSet[SCC]]] = [[] for i in range(self.dfa.num_classes)]
 		accepts: Set[NFARule] = set()
 
 		for scc in subset:
 			for nfa_state in scc.states:
 				if nfa_state.rule:
 					accepts.add(nfa_state.rule)
-				for chars, target_state in nfa_state.trans:
-					for char in chars:
-						target_node = self.states[target_state]
-						assert target_node.scc is not None
-						assert target_node.scc.closure is not None
-						transitions[char].update(target_node.scc.closure)
-
-		frozen_transitions: List[FrozenSet[SCC]] = list(map(lambda itr: frozenset(itr), transitions))
-		for idx, subset in enumerate(frozen_transitions):
-			if len(subset) == 0:
-				dfa_state.trans[idx] = None
-			else:
-				dfa_state.trans[idx] = self.get_dfa_for_subset(subset)
+				for classes, closure in self.states[nfa_state].trans:
+					for klass in classes:
+						transitions[klass].append(closure)
+
+		# classes reached through the same NFA transitions share the target subset
+		targets: Dict[Tuple[FrozenSet[SCC], ...], int] = dict()
+		for klass, closures in enumerate(transitions):
+			if len(closures) > 0:
+				key = tuple(closures)
+				if key not in targets:
+					targets[key] = self.get_dfa_for_subset(frozenset().union(*closures))
+				self.dfa.set(dfa_state, klass, targets[key])
 
 		if len(accepts) > 0:
-			accepts_list = list(accepts)
-			accepts_list.sort(key=lambda rule: rule.order)
-			self.accepts[dfa_state] = accepts_list
-			dfa_state.accepts = accepts_list[0]
+			self.dfa.accepts[dfa_state] = min(accepts, key=lambda rule: rule.order)
 
-	def get_dfa_for_subset(self, subset: FrozenSet[SCC]) -> DFAState:
+	def get_dfa_for_subset(self, subset: FrozenSet[SCC]) -> int:
 		if subset not in self.powerset:
-			dfa_state = DFAState()
-			self.worklist.append((subset, dfa_state))
-			self.powerset[subset] = dfa_state
+			self.powerset[subset] = self.dfa.add_state()
+			self.worklist.append(subset)
 		return self.powerset[subset]
 
 	def find_scc(self) -> None:
-		index: int = 0
-		stack: List[GraphNode] = []
-
-		def strongconnect(v: GraphNode) -> None:
-			nonlocal index
-			v.scc_index = index
-			v.scc_lowlink = index
-			index += 1
-			stack.append(v)
-			v.scc_onstack = True
-
-			for target in v.state.etrans:
-				w = self.states[target]
-				if w.scc_index is None:
-					strongconnect(w)
-					v.scc_lowlink = min(v.scc_lowlink, w.scc_lowlink)
-				elif w.scc_onstack:
-					v.scc_lowlink = min(v.scc_lowlink, w.scc_index)
-
-			if v.scc_lowlink == v.scc_index:
-				scc = SCC()
-
-				while True:
-					w = stack.pop()
-					w.scc_onstack = False
-					scc.add(w.state)
-					w.scc = scc
-					if w == v:
-						break
-
-				scc.build_closure(self)
-
-		for state in self.states.values():
-			if state.scc_index is None:
-				strongconnect(state)
+		def edges_of(node: GraphNode) -> Generator[GraphNode, None, None]:
+			for target in node.state.etrans:
+				yield self.states[target]
+
+		for nodes in topological_sort(self.states.values(), edges_of):
+			scc = SCC()
+			for node in nodes:
+				scc.add(node.state)
+				node.scc = scc
+			scc.build_closure(self)
 
 	def get_transitive_closure(self, state: NFAState) -> FrozenSet[SCC]:
 		state_node = self.states[state]
@@ -280,27 +366,17 @@ class Builder:
 		assert scc.closure is not None
 		return scc.closure
 
-	def resolve_accepts_from_keywords(self, initial_state: DFAState) -> None:
-		def find_nonkeyword_accept(state: DFAState) -> Optional[NFARule]:
-			accepts: Optional[NFARule] = None
-
-			def visit(state: DFAState) -> None:
-				nonlocal accepts
-				if accepts is not None:
-					return
-				if state.accepts is not None and state.accepts not in self.keywords:
-					accepts = state.accepts
-
-			state.visit(visit)
-			return accepts
-
-		def visit(state: DFAState) -> None:
-			if state.accepts in self.keywords:
-				state.accepts = find_nonkeyword_accept(state)
-				if state.accepts is None:
-					state.accepts = self.final_rule
-
-		initial_state.visit(visit)
-
-
-
+	def resolve_accepts_from_keywords(self, dfa: DFA) -> None:
+		def find_nonkeyword_accept(state: int) -> Optional[NFARule]:
+			for target_state in depth_first((state,), dfa.successors):
+				accepts = dfa.accepts[target_state]
+				if accepts is not None and accepts not in self.keywords:
+					return accepts
+			return None
+
+		for state in range(dfa.num_states):
+			if dfa.accepts[state] in self.keywords:
+				accepts = find_nonkeyword_accept(state)
+				if accepts is None:
+					accepts = self.final_rule
+				dfa.accepts[state] = accepts
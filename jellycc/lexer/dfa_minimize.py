@@ -1,35 +1,40 @@
 from typing import List, Set, Tuple, Dict, Callable, Optional
 
-from jellycc.lexer.dfa import DFAState
+from jellycc.lexer.dfa import DFA, NoState
 from jellycc.lexer.nfa import NFARule
 
 
+def compare_accepts(accept1: Optional[NFARule], accept2: Optional[NFARule]) -> bool:
+	if accept1 == accept2:
+		return True
+	if (accept1 is None) != (accept2 is None):
+		return False
+	assert accept1 is not None
+	assert accept2 is not None
+	return accept1.terminal == accept2.terminal
+
+
 class MinimizeDFA:
 	def __init__(self) -> None:
-		self.states: List[DFAState] = []
-		self.disjoint: Set[Tuple[DFAState, DFAState]] = set()
+		self.repr: List[int] = []
 
-	def run(self, state: DFAState) -> DFAState:
-		def pre_visit(state: DFAState) -> None:
-			self.states.append(state)
-			state.repr = None
+	def run(self, dfa: DFA) -> DFA:
+		self.repr = [0] * dfa.num_states
 
-		state.visit(pre_visit)
-
-		equivalences: List[List[DFAState]] = [self.states]
+		equivalences: List[List[int]] = [list(range(dfa.num_states))]
 		states_processed = 0
 
 		def assign_repr() -> None:
 			for sublist in equivalences:
 				for state in sublist:
-					state.repr = sublist[0]
+					self.repr[state] = sublist[0]
 
 		def refine_list(
-			states: List[DFAState],
-			refiner: Callable[[DFAState, DFAState], bool]
-		) -> Tuple[List[List[DFAState]], bool]:
+			states: List[int],
+			refiner: Callable[[int, int], bool]
+		) -> Tuple[List[List[int]], bool]:
 			nonlocal states_processed
-			out: List[List[DFAState]] = []
+			out: List[List[int]] = []
 
 			for state in states:
 				for out_list in out:
@@ -42,10 +47,10 @@ class MinimizeDFA:
 
 			return out, len(out) > 1
 
-		def refine_all(refiner: Callable[[DFAState, DFAState], bool]) -> bool:
+		def refine_all(refiner: Callable[[int, int], bool]) -> bool:
 			nonlocal equivalences, states_processed
 			states_processed = 0
-			new_equivalences: List[List[DFAState]] = []
+			new_equivalences: List[List[int]] = []
 			any_progress = False
 			for sublist in equivalences:
 				if len(sublist) > 1:
@@ -61,32 +66,19 @@ class MinimizeDFA:
 			assign_repr()
 			return any_progress
 
-		def compare_accepts(accept1: Optional[NFARule], accept2: Optional[NFARule]) -> bool:
-			if accept1 == accept2:
-				return True
-			if (accept1 is None) != (accept2 is None):
-				return False
-			assert accept1 is not None
-			assert accept2 is not None
-			return accept1.terminal == accept2.terminal
-
-		def refiner_accept(state1: DFAState, state2: DFAState) -> bool:
-			return compare_accepts(state1.accepts, state2.accepts)
+		def refiner_accept(state1: int, state2: int) -> bool:
+			return compare_accepts(dfa.accepts[state1], dfa.accepts[state2])
 
-		def is_same_class(state1: Optional[DFAState], state2: Optional[DFAState]) -> bool:
+		def is_same_class(state1: int, state2: int) -> bool:
 			if state1 == state2:
 				return True
-			if (state1 is None) != (state2 is None):
+			if (state1 == NoState) or (state2 == NoState):
 				return False
-			assert state1 is not None
-			assert state2 is not None
-			if state1.repr is state2.repr:
-				return True
-			return False
+			return self.repr[state1] == self.repr[state2]
 
-		def refiner_trans(state1: DFAState, state2: DFAState) -> bool:
-			for i in range(256):
-				if not is_same_class(state1.trans[i], state2.trans[i]):
+		def refiner_trans(state1: int, state2: int) -> bool:
+			for klass in range(dfa.num_classes):
+				if not is_same_class(dfa.get(state1, klass), dfa.get(state2, klass)):
 					return False
 			return True
 
@@ -95,31 +87,130 @@ class MinimizeDFA:
 		while refine_all(refiner_trans):
 			pass
 
-		new_states: Dict[DFAState, DFAState] = dict()
-		new_states_num: int = 0
+		new_states: Dict[int, int] = dict()
+		out_dfa = DFA(dfa.classes)
 
-		def remap_state(state: Optional[DFAState]) -> Optional[DFAState]:
-			nonlocal new_states_num
-			if state is None:
-				return None
-			state = state.repr
-			assert state is not None
+		def remap_state(state: int) -> int:
+			if state == NoState:
+				return NoState
+			state = self.repr[state]
 			if state in new_states:
 				return new_states[state]
-			new_state: DFAState = DFAState()
-			new_states_num += 1
-			new_state.accepts = state.accepts
+			new_state = out_dfa.add_state(dfa.accepts[state])
 			new_states[state] = new_state
-			for i in range(256):
-				new_state.trans[i] = remap_state(state.trans[i])
+			for klass in range(dfa.num_classes):
+				out_dfa.set(new_state, klass, remap_state(dfa.get(state, klass)))
 			return new_state
 
-		out_state = remap_state(state)
-		assert out_state is not None
+		remap_state(0)
 
-		return out_state
+		return out_dfa
 
 
-def minimize(state: DFAState) -> DFAState:
-	m = MinimizeDFA()
-	return m.run(state)
+class HopcroftMinimizeDFA:
+	def __init__(self) -> None:
+		# transitions over byte classes, the missing transition goes to the sink state (index num_states)
+		self.trans: List[List[int]] = []
+		self.block_of: List[int] = []
+		self.blocks: List[Set[int]] = []
+
+	def run(self, dfa: DFA) -> DFA:
+		self._build_transitions(dfa)
+		self._initial_partition(dfa)
+		self._refine(dfa.num_classes)
+		return self._build_dfa(dfa)
+
+	def _build_transitions(self, dfa: DFA) -> None:
+		sink = dfa.num_states
+		for state in range(dfa.num_states):
+			self.trans.append([sink if target == NoState else target for target in dfa.row(state)])
+		self.trans.append([sink] * dfa.num_classes)
+
+	def _initial_partition(self, dfa: DFA) -> None:
+		# the sink is kept in a block of its own, so states without transitions never merge into 'no transition'
+		by_terminal: Dict[object, int] = dict()
+		for accepts in dfa.accepts:
+			key = None if accepts is None else accepts.terminal
+			if key not in by_terminal:
+				by_terminal[key] = len(self.blocks)
+				self.blocks.append(set())
+			block = by_terminal[key]
+			self.blocks[block].add(len(self.block_of))
+			self.block_of.append(block)
+		self.block_of.append(len(self.blocks))
+		self.blocks.append({dfa.num_states})
+
+	def _refine(self, num_classes: int) -> None:
+		num_states = len(self.trans)
+
+		inverse: List[List[List[int]]] = [[[] for i in range(num_states)] for k in range(num_classes)]
+		for source, row in enumerate(self.trans):
+			for k, target in enumerate(row):
+				inverse[k][target].append(source)
+
+		# any single initial block may be left out of the worklist, so skip the one with the most incoming edges
+		incoming: List[int] = [0] * len(self.blocks)
+		for k in range(num_classes):
+			for target, sources in enumerate(inverse[k]):
+				incoming[self.block_of[target]] += len(sources)
+		heaviest = max(range(len(self.blocks)), key=lambda block: incoming[block])
+
+		worklist: List[int] = [block for block in range(len(self.blocks)) if block != heaviest]
+		in_worklist: Set[int] = set(worklist)
+
+		while len(worklist) > 0:
+			splitter = worklist.pop()
+			in_worklist.discard(splitter)
+			splitter_states = list(self.blocks[splitter])
+			for k in range(num_classes):
+				inverse_k = inverse[k]
+				touched: Dict[int, List[int]] = dict()
+				for target in splitter_states:
+					for source in inverse_k[target]:
+						block = self.block_of[source]
+						if block not in touched:
+							touched[block] = [source]
+						else:
+							touched[block].append(source)
+				for block, sources in touched.items():
+					block_states = self.blocks[block]
+					if len(sources) == len(block_states):
+						continue
+					new_block = len(self.blocks)
+					new_states = set(sources)
+					block_states.difference_update(new_states)
+					self.blocks.append(new_states)
+					for source in sources:
+						self.block_of[source] = new_block
+					if block in in_worklist or len(new_states) <= len(block_states):
+						worklist.append(new_block)
+						in_worklist.add(new_block)
+					else:
+						worklist.append(block)
+						in_worklist.add(block)
+
+	def _build_dfa(self, dfa: DFA) -> DFA:
+		sink_block = self.block_of[dfa.num_states]
+		new_states: Dict[int, int] = dict()
+		reprs: List[int] = []
+		out_dfa = DFA(dfa.classes)
+
+		# the lowest numbered state represents its block, so the initial state stays at 0
+		for state in range(dfa.num_states):
+			block = self.block_of[state]
+			if block not in new_states:
+				new_states[block] = out_dfa.add_state(dfa.accepts[state])
+				reprs.append(state)
+		new_states[sink_block] = NoState
+
+		block_of = self.block_of
+		for new_state, state in enumerate(reprs):
+			for k, target in enumerate(self.trans[state]):
+				out_dfa.set(new_state, k, new_states[block_of[target]])
+
+		return out_dfa
+
+
+def minimize(dfa: DFA) -> DFA:
+	m = HopcroftMinimizeDFA()
+	return m.run(dfa)
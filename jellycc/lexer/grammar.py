@@ -3,6 +3,25 @@ from typing import Optional
 from jellycc.project.grammar import SharedGrammar
 
 
+# widths of token offsets in the generated lexer
+OffsetWidths = (32, 64)
+DefaultOffsetWidth = 32
+
+# variants of the generated lexer loop: unrolled stores a token and an offset for every byte,
+# runs consumes runs of bytes that keep the DFA in the same state without storing anything,
+# simd scans such runs with SSE2/AVX2 where available
+LoopUnrolled = "unrolled"
+LoopRuns = "runs"
+LoopSimd = "simd"
+LoopModes = (LoopUnrolled, LoopRuns, LoopSimd)
+
+# layouts of the lexer transition table: a dense classes x states matrix, or row-displacement
+# packed rows of the transitions that differ from the most common one of their state
+TableDense = "dense"
+TableComb = "comb"
+TableLayouts = (TableDense, TableComb)
+
+
 class LexerGrammar:
 	def __init__(self, shared: SharedGrammar) -> None:
 		self.shared: SharedGrammar = shared
@@ -10,4 +29,11 @@ class LexerGrammar:
 		self.namespace: str = "ll"
 		self.header_path: Optional[str] = None
 		self.source_path: Optional[str] = None
+		self.tables_path: Optional[str] = None
+		# 64-bit offsets are needed for inputs of 4 GiB and more
+		self.offset_width: int = DefaultOffsetWidth
+		self.loop: str = LoopUnrolled
+		self.table_layout: str = TableDense
+		# adds run_parallel, lexing chunks of the input on several threads
+		self.parallel: bool = False
 
@@ -2,42 +2,170 @@
 #include <cstdint>
 #include <cstring>
 
+#define JCC_LEXER_SIMD ${lexer_simd}
+#define JCC_LEXER_PARALLEL ${lexer_parallel}
+
+#if JCC_LEXER_PARALLEL
+#include <algorithm>
+#include <thread>
+#include <vector>
+#endif
+
+#if JCC_LEXER_SIMD
+#if defined(__AVX2__)
+#include <immintrin.h>
+#define JCC_LEXER_VECTOR 32
+typedef __m256i jcc_vector;
+#define jcc_load(ptr) _mm256_loadu_si256((const __m256i*)(ptr))
+#define jcc_splat(val) _mm256_set1_epi8((char)(val))
+#define jcc_zero() _mm256_setzero_si256()
+#define jcc_sub(a, b) _mm256_sub_epi8(a, b)
+#define jcc_subs_u(a, b) _mm256_subs_epu8(a, b)
+#define jcc_cmpeq(a, b) _mm256_cmpeq_epi8(a, b)
+#define jcc_or(a, b) _mm256_or_si256(a, b)
+#define jcc_mask(a) (uint32_t)_mm256_movemask_epi8(a)
+#elif defined(__SSE2__) || defined(_M_X64) || (defined(_M_IX86_FP) && _M_IX86_FP >= 2)
+#include <emmintrin.h>
+#define JCC_LEXER_VECTOR 16
+typedef __m128i jcc_vector;
+#define jcc_load(ptr) _mm_loadu_si128((const __m128i*)(ptr))
+#define jcc_splat(val) _mm_set1_epi8((char)(val))
+#define jcc_zero() _mm_setzero_si128()
+#define jcc_sub(a, b) _mm_sub_epi8(a, b)
+#define jcc_subs_u(a, b) _mm_subs_epu8(a, b)
+#define jcc_cmpeq(a, b) _mm_cmpeq_epi8(a, b)
+#define jcc_or(a, b) _mm_or_si128(a, b)
+#define jcc_mask(a) (uint32_t)_mm_movemask_epi8(a)
+#else
+// no vector instructions, runs are consumed by the scalar loop
+#define JCC_LEXER_VECTOR 0
+#endif
+#if JCC_LEXER_VECTOR && defined(_MSC_VER)
+#include <intrin.h>
+#endif
+#endif
+
 ${include:lexer.shared.inc}
 
 namespace ${lexer_namespace} {
 
-struct LexerState {
-	uint16_t state;
-
-	const uint8_t* input_begin;
-	const uint8_t* input_end;
-	const uint8_t* input;
-
-	uint16_t* tokens;
-	uint32_t* offsets;
+#define JCC_LEXER_COMB ${lexer_comb}
 
-	size_t token_idx;
-	size_t token_offset;
-	size_t token_max;
+// transitions hold the next state and the emit bit, which is the low bit for 16 and 32-bit states
+// and the high bit for 8-bit ones
+#define JCC_LEXER_EMIT_SHIFT ${lexer_emit_shift}
+#define JCC_LEXER_EMIT_BIT (1u << JCC_LEXER_EMIT_SHIFT)
 
-	LexerCallback cb;
+#if JCC_LEXER_COMB
+// byte classes
+static const ${lexer_equiv_type} equiv_table[256] = {
+	${equiv_table}
 };
 
+// row-displacement packed transitions: states with equal rows share a row class, a slot belongs
+// to the class stored in its check entry, other classes take the most common transition of the row
+static const ${lexer_comb_check_type} comb_class[] = {
+	${lexer_comb_class_data}
+};
+static const LexerStateIndex comb_default[] = {
+	${lexer_comb_default_data}
+};
+static const ${lexer_comb_base_type} comb_base[] = {
+	${lexer_comb_base_data}
+};
+static const ${lexer_comb_check_type} comb_check[] = {
+	${lexer_comb_check_data}
+};
+static const LexerStateIndex comb_value[] = {
+	${lexer_comb_value_data}
+};
 
-static const uint32_t equiv_table[256] = {
+static inline LexerStateIndex next_state(uint32_t klass, LexerStateIndex state) {
+	uint32_t cls = comb_class[state / sizeof(LexerStateIndex)];
+	size_t idx = comb_base[cls] + klass;
+	return comb_check[idx] == cls ? comb_value[idx] : comb_default[cls];
+}
+#else
+// byte classes, premultiplied to the byte offset of their row in trans_table
+static const ${lexer_equiv_type} equiv_table[256] = {
 	${equiv_table}
 };
-static const uint16_t trans_table[] = {
+static const LexerStateIndex trans_table[] = {
 	${trans_table}
 };
-static const uint16_t accept_table[] = {
+
+static inline LexerStateIndex next_state(uint32_t equiv, LexerStateIndex state) {
+	return *(const LexerStateIndex*)((const char*)trans_table + equiv + state);
+}
+#endif
+
+// the state tables share one entry width, a state is the same byte offset into each of them
+static const LexerStateIndex accept_table[] = {
 	${accept_table}
 };
-static const uint16_t trans_fin_table[] = {
+static const LexerStateIndex trans_fin_table[] = {
 	${fin_trans_table}
 };
 
 #define JCC_LEXER_UNROLL_ITERATIONS ${lexer_unroll_count}
+#define JCC_LEXER_SKIP_RUNS ${lexer_skip_runs}
+#define JCC_LEXER_SKIP_PROBE 8
+#if JCC_LEXER_SIMD && JCC_LEXER_VECTOR
+#if defined(_MSC_VER)
+static inline uint32_t jcc_ctz(uint32_t mask) {
+	unsigned long idx;
+	_BitScanForward(&idx, mask);
+	return (uint32_t)idx;
+}
+#else
+#define jcc_ctz(mask) (uint32_t)__builtin_ctz(mask)
+#endif
+
+// bytes a state loops on, as up to 4 ranges low..low+width; with stop set the ranges hold the other bytes
+struct SkipScanner {
+	uint8_t stop;
+	uint8_t count;
+	uint8_t low[4];
+	uint8_t width[4];
+};
+
+static const SkipScanner skip_scanners[] = {
+	{0, 0, {0, 0, 0, 0}, {0, 0, 0, 0}},
+	${skip_scanner_data}
+};
+
+// scanner of every state, 0 for states without one
+static const uint8_t skip_scanner_of[] = {
+	${skip_state_data}
+};
+
+// length of the run of looping bytes at the start of data, up to the last full vector;
+// the scalar loop finishes the run
+static size_t skip_run(const SkipScanner& scanner, const uint8_t* data, size_t avail) {
+	jcc_vector low[4];
+	jcc_vector width[4];
+	for (int i = 0; i < scanner.count; i++) {
+		low[i] = jcc_splat(scanner.low[i]);
+		width[i] = jcc_splat(scanner.width[i]);
+	}
+	uint32_t invert = scanner.stop ? 0 : (uint32_t)((1ull << JCC_LEXER_VECTOR) - 1);
+	size_t pos = 0;
+	while (pos + JCC_LEXER_VECTOR <= avail) {
+		jcc_vector bytes = jcc_load(data + pos);
+		jcc_vector hits = jcc_zero();
+		for (int i = 0; i < scanner.count; i++) {
+			// byte - low <= width, unsigned: the saturating subtraction of width leaves zero
+			hits = jcc_or(hits, jcc_cmpeq(jcc_subs_u(jcc_sub(bytes, low[i]), width[i]), jcc_zero()));
+		}
+		uint32_t ends = jcc_mask(hits) ^ invert;
+		if (ends) {
+			return pos + jcc_ctz(ends);
+		}
+		pos += JCC_LEXER_VECTOR;
+	}
+	return pos;
+}
+#endif
 
 static void request_buffer(LexerState* lex) {
 	size_t count;
@@ -46,18 +174,24 @@ static void request_buffer(LexerState* lex) {
 	lex->token_max = count + lex->token_idx;
 }
 
+// passes the tokens written so far, the rest of the buffer is kept for the following tokens
 static void flush_output(LexerState* lex) {
-	if (lex->token_idx > lex->token_offset) {
-		lex->cb.on_output(lex->cb.ud, lex->tokens, lex->offsets, lex->token_idx - lex->token_offset);
+	size_t count = lex->token_idx - lex->token_offset;
+	if (count > 0) {
+		lex->cb.on_output(lex->cb.ud, lex->tokens, lex->offsets, count);
+		lex->tokens += count;
+		lex->offsets += count;
+		lex->token_offset = lex->token_idx;
 	}
 }
 
 static void loop(LexerState* lex) {
-	uint16_t state = lex->state;
+	LexerStateIndex state = lex->state;
 
-	uintptr_t input_pos = (uintptr_t)(lex->input - lex->input_begin);
-	uintptr_t input_base = (uintptr_t)lex->input_begin;
-	uintptr_t input_len = (uintptr_t)(lex->input_end - lex->input_begin);
+	// positions count from the start of the whole input, so they are token offsets as they are
+	uintptr_t input_pos = (uintptr_t)lex->input_offset + (uintptr_t)(lex->input - lex->input_begin);
+	uintptr_t input_base = (uintptr_t)lex->input_begin - (uintptr_t)lex->input_offset;
+	uintptr_t input_len = (uintptr_t)lex->input_offset + (uintptr_t)(lex->input_end - lex->input_begin);
 
 	size_t token_idx = lex->token_idx;
 	size_t token_end = lex->token_max;
@@ -66,8 +200,44 @@ static void loop(LexerState* lex) {
 	uintptr_t offsets_base = (uintptr_t)(lex->offsets - lex->token_offset);
 
 	#define token(idx) (*(uint16_t*)(tokens_base + idx * sizeof(uint16_t)))
-	#define offset(idx) (*(uint32_t*)(offsets_base + idx * sizeof(uint32_t)))
+	#define offset(idx) (*(LexerOffset*)(offsets_base + idx * sizeof(LexerOffset)))
+	#define transition(pos) next_state(equiv_table[*(const uint8_t*)(input_base + (pos))], state)
+
+#if JCC_LEXER_SKIP_RUNS
+	// a transition back to the same state emits nothing (states never carry the emit bit), so a run of bytes
+	// the state loops on (identifiers, whitespace, comment bodies) is consumed without any stores
+	while ((input_pos != input_len) & (token_idx != token_end)) {
+		LexerStateIndex trans = transition(input_pos);
+		if (trans == state) {
+			input_pos++;
+#if JCC_LEXER_SIMD && JCC_LEXER_VECTOR
+			// most runs are short, the scanner is only set up for runs that go on past a few bytes
+			uintptr_t probe_end = (input_len - input_pos > JCC_LEXER_SKIP_PROBE) ? input_pos + JCC_LEXER_SKIP_PROBE : input_len;
+			while ((input_pos != probe_end) && (transition(input_pos) == state)) {
+				input_pos++;
+			}
+			if (input_pos == probe_end) {
+				const SkipScanner& scanner = skip_scanners[skip_scanner_of[state / sizeof(LexerStateIndex)]];
+				if (scanner.count) {
+					input_pos += skip_run(scanner, (const uint8_t*)(input_base + input_pos), input_len - input_pos);
+				}
+			}
+#endif
+			while ((input_pos != input_len) && (transition(input_pos) == state)) {
+				input_pos++;
+			}
+			continue;
+		}
+
+		token(token_idx) = (uint16_t)*(const LexerStateIndex*)((const char*)accept_table + state);
+		offset(token_idx) = (LexerOffset)input_pos;
+
+		state = (LexerStateIndex)(trans & ~JCC_LEXER_EMIT_BIT);
+		token_idx += (trans >> JCC_LEXER_EMIT_SHIFT) & 1;
 
+		input_pos++;
+	}
+#else
 	size_t input_avail = input_len - input_pos;
 	size_t output_avail = token_end - token_idx;
 
@@ -82,13 +252,13 @@ static void loop(LexerState* lex) {
 			uint8_t chars[JCC_LEXER_UNROLL_ITERATIONS];
 			memcpy(chars, (const uint8_t*)(input_base + input_pos), JCC_LEXER_UNROLL_ITERATIONS);
 			for (int i = 0; i < JCC_LEXER_UNROLL_ITERATIONS; i++) {
-				uint16_t trans = *(const uint16_t*)((const char*)trans_table + equiv_table[chars[i]] + state);
+				LexerStateIndex trans = next_state(equiv_table[chars[i]], state);
 
-				token(token_idx) = *(const uint16_t*)((const char*)accept_table + state);
-				offset(token_idx) = (uint32_t)input_pos + i;
+				token(token_idx) = (uint16_t)*(const LexerStateIndex*)((const char*)accept_table + state);
+				offset(token_idx) = (LexerOffset)(input_pos + i);
 
-				state = (uint16_t)(trans & ~1);
-				token_idx += (trans & 1);
+				state = (LexerStateIndex)(trans & ~JCC_LEXER_EMIT_BIT);
+				token_idx += (trans >> JCC_LEXER_EMIT_SHIFT) & 1;
 			}
 			input_pos += JCC_LEXER_UNROLL_ITERATIONS;
 		}
@@ -97,59 +267,214 @@ static void loop(LexerState* lex) {
 	while ((input_pos != input_len) & (token_idx != token_end)) {
 		uint8_t ch = *(const uint8_t*)(input_base + input_pos);
 		uint32_t equiv = equiv_table[ch];
-		uint16_t trans = *(const uint16_t*)((const char*)trans_table + equiv + state);
+		LexerStateIndex trans = next_state(equiv, state);
 
-		token(token_idx) = *(const uint16_t*)((const char*)accept_table + state);
-		offset(token_idx) = (uint32_t)input_pos;
+		token(token_idx) = (uint16_t)*(const LexerStateIndex*)((const char*)accept_table + state);
+		offset(token_idx) = (LexerOffset)input_pos;
 
-		state = (uint16_t)(trans & ~1);
-		token_idx += (trans & 1);
+		state = (LexerStateIndex)(trans & ~JCC_LEXER_EMIT_BIT);
+		token_idx += (trans >> JCC_LEXER_EMIT_SHIFT) & 1;
 
 		input_pos++;
 	}
+#endif
 
-	size_t first_token = lex->token_idx;
+	#undef transition
 
-	lex->input = lex->input_begin + input_pos;
+	lex->input = (const uint8_t*)(input_base + input_pos);
 	lex->token_idx = token_idx;
 	lex->state = state;
 }
 
 static void finalize(LexerState* lex) {
-	uint16_t state = lex->state;
+	LexerStateIndex state = lex->state;
 
 	size_t token_idx = lex->token_idx;
 	uint16_t* token = lex->tokens + (lex->token_idx - lex->token_offset);
 
-	uint16_t trans = *(const uint16_t*)((const char*)trans_fin_table + state);
-	uint32_t* offset = lex->offsets + (lex->token_idx - lex->token_offset);
+	LexerStateIndex trans = *(const LexerStateIndex*)((const char*)trans_fin_table + state);
+	LexerOffset* offset = lex->offsets + (lex->token_idx - lex->token_offset);
 
-	*token = *(const uint16_t*)((const char*)accept_table + state);
-	*offset = (uint32_t)(lex->input - lex->input_begin);
+	*token = (uint16_t)*(const LexerStateIndex*)((const char*)accept_table + state);
+	*offset = (LexerOffset)lex->input_offset;
 
-	token_idx += (trans & 1);
+	token_idx += (trans >> JCC_LEXER_EMIT_SHIFT) & 1;
 
 	lex->token_idx = token_idx;
 }
 
-void run(LexerCallback cb, const uint8_t* data, size_t len) {
-	LexerState lex;
-	memset(&lex, 0, sizeof(LexerState));
-	lex.cb = cb;
-	lex.input_begin = lex.input = data;
-	lex.input_end = data + len;
+static void lex_input(LexerState* lex, const uint8_t* data, size_t len) {
+	lex->input_begin = lex->input = data;
+	lex->input_end = data + len;
 	while (true) {
-		if (lex.token_idx >= lex.token_max) {
-			flush_output(&lex);
-			request_buffer(&lex);
+		if (lex->token_idx >= lex->token_max) {
+			flush_output(lex);
+			request_buffer(lex);
 		}
-		if (lex.input >= lex.input_end) {
+		if (lex->input >= lex->input_end) {
 			break;
 		}
-		loop(&lex);
+		loop(lex);
+	}
+	lex->input_offset += len;
+	lex->input_begin = lex->input = lex->input_end = nullptr;
+}
+
+void begin(LexerState* lex, LexerCallback cb) {
+	memset(lex, 0, sizeof(LexerState));
+	lex->cb = cb;
+}
+
+void feed(LexerState* lex, const uint8_t* data, size_t len) {
+	lex_input(lex, data, len);
+	flush_output(lex);
+}
+
+void finish(LexerState* lex) {
+	// nothing was fed, there is no buffer yet
+	if (lex->token_idx >= lex->token_max) {
+		flush_output(lex);
+		request_buffer(lex);
 	}
+	finalize(lex);
+	flush_output(lex);
+}
+
+void run(LexerCallback cb, const uint8_t* data, size_t len) {
+	LexerState lex;
+	begin(&lex, cb);
+	lex_input(&lex, data, len);
 	finalize(&lex);
 	flush_output(&lex);
 }
 
+#if JCC_LEXER_PARALLEL
+// chunks after the first are lexed on their own threads from the initial state, as if a token started
+// at the chunk boundary, recording the state reached every JCC_LEXER_SYNC_INTERVAL bytes. the chunks are
+// then stitched in order: a chunk is lexed again from the state the previous one really ended in until
+// that run reaches the recorded state at a checkpoint, from there on both runs are the same
+#define JCC_LEXER_SYNC_INTERVAL 4096
+#define JCC_LEXER_MIN_CHUNK (1 << 16)
+
+struct LexerChunk {
+	size_t begin;
+	size_t end;
+
+	std::vector<uint16_t> tokens;
+	std::vector<LexerOffset> offsets;
+
+	// state and number of tokens after every interval of the chunk
+	std::vector<LexerStateIndex> sync_states;
+	std::vector<size_t> sync_tokens;
+
+	uint16_t token_buffer[1024];
+	LexerOffset offset_buffer[1024];
+};
+
+static LexerCallback collect_tokens(LexerChunk* chunk) {
+	return {
+		chunk,
+		[](void* ud, uint16_t* tokens, LexerOffset* offsets, size_t count) {
+			LexerChunk* chunk = (LexerChunk*)ud;
+			chunk->tokens.insert(chunk->tokens.end(), tokens, tokens + count);
+			chunk->offsets.insert(chunk->offsets.end(), offsets, offsets + count);
+		},
+		[](void* ud, uint16_t** tokens, LexerOffset** offsets, size_t* count) {
+			LexerChunk* chunk = (LexerChunk*)ud;
+			*tokens = chunk->token_buffer;
+			*offsets = chunk->offset_buffer;
+			*count = sizeof(chunk->token_buffer) / sizeof(chunk->token_buffer[0]);
+		}
+	};
+}
+
+static void lex_speculative(LexerChunk* chunk, const uint8_t* data) {
+	LexerState lex;
+	begin(&lex, collect_tokens(chunk));
+	lex.input_offset = chunk->begin;
+	for (size_t pos = chunk->begin; pos < chunk->end; pos += JCC_LEXER_SYNC_INTERVAL) {
+		feed(&lex, data + pos, std::min((size_t)JCC_LEXER_SYNC_INTERVAL, chunk->end - pos));
+		chunk->sync_states.push_back(lex.state);
+		chunk->sync_tokens.push_back(chunk->tokens.size());
+	}
+}
+
+// fixes the tokens of a speculatively lexed chunk for the state it really starts in, returns its end state
+static LexerStateIndex stitch_chunk(LexerChunk* chunk, const uint8_t* data, LexerStateIndex state) {
+	LexerChunk fixed;
+	LexerState lex;
+	begin(&lex, collect_tokens(&fixed));
+	lex.state = state;
+	lex.input_offset = chunk->begin;
+	size_t sync_idx = 0;
+	for (size_t pos = chunk->begin; pos < chunk->end; pos += JCC_LEXER_SYNC_INTERVAL, sync_idx++) {
+		feed(&lex, data + pos, std::min((size_t)JCC_LEXER_SYNC_INTERVAL, chunk->end - pos));
+		if (lex.state == chunk->sync_states[sync_idx]) {
+			size_t from = chunk->sync_tokens[sync_idx];
+			fixed.tokens.insert(fixed.tokens.end(), chunk->tokens.begin() + from, chunk->tokens.end());
+			fixed.offsets.insert(fixed.offsets.end(), chunk->offsets.begin() + from, chunk->offsets.end());
+			lex.state = chunk->sync_states.back();
+			break;
+		}
+	}
+	// without a match the chunk was lexed again as a whole
+	chunk->tokens.swap(fixed.tokens);
+	chunk->offsets.swap(fixed.offsets);
+	return lex.state;
+}
+
+// passes tokens through the buffers of the output lexer, as if the lexer had written them
+static void write_tokens(LexerState* lex, const uint16_t* tokens, const LexerOffset* offsets, size_t count) {
+	while (count > 0) {
+		if (lex->token_idx >= lex->token_max) {
+			flush_output(lex);
+			request_buffer(lex);
+		}
+		size_t n = std::min(count, lex->token_max - lex->token_idx);
+		memcpy(lex->tokens + (lex->token_idx - lex->token_offset), tokens, n * sizeof(uint16_t));
+		memcpy(lex->offsets + (lex->token_idx - lex->token_offset), offsets, n * sizeof(LexerOffset));
+		lex->token_idx += n;
+		tokens += n;
+		offsets += n;
+		count -= n;
+	}
+	flush_output(lex);
+}
+
+void run_parallel(LexerCallback cb, const uint8_t* data, size_t len, size_t threads) {
+	if (threads == 0) {
+		threads = std::max(1u, std::thread::hardware_concurrency());
+	}
+	size_t count = std::min(threads, len / JCC_LEXER_MIN_CHUNK);
+	if (count <= 1) {
+		run(cb, data, len);
+		return;
+	}
+
+	std::vector<LexerChunk*> chunks;
+	std::vector<std::thread> workers;
+	for (size_t idx = 1; idx < count; idx++) {
+		LexerChunk* chunk = new LexerChunk();
+		chunk->begin = len / count * idx;
+		chunk->end = idx + 1 < count ? len / count * (idx + 1) : len;
+		chunks.push_back(chunk);
+		workers.emplace_back(lex_speculative, chunk, data);
+	}
+
+	// the first chunk starts in the initial state for sure, it is lexed right into the output
+	LexerState lex;
+	begin(&lex, cb);
+	feed(&lex, data, chunks[0]->begin);
+	for (size_t idx = 0; idx < chunks.size(); idx++) {
+		LexerChunk* chunk = chunks[idx];
+		workers[idx].join();
+		lex.state = stitch_chunk(chunk, data, lex.state);
+		write_tokens(&lex, chunk->tokens.data(), chunk->offsets.data(), chunk->tokens.size());
+		lex.input_offset = chunk->end;
+		delete chunk;
+	}
+	finish(&lex);
+}
+#endif
+
 }
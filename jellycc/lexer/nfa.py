@@ -1,7 +1,8 @@
-from typing import List, FrozenSet, Tuple, Callable, Set, Dict, Optional
+from typing import List, FrozenSet, Tuple, Callable, Dict, Optional, Generator
 
 from jellycc.project.grammar import Terminal
 from jellycc.utils.error import CCError
+from jellycc.utils.graph import depth_first
 from jellycc.utils.source import SrcLoc
 
 from typing import TYPE_CHECKING
@@ -28,20 +29,14 @@ class NFAState:
 	def add_trans(self, chars: FrozenSet[int], state: 'NFAState') -> None:
 		self.trans.append((chars, state))
 
-	def visit(self, visitor: Callable[['NFAState'], None]) -> None:
-		visited: Set[NFAState] = set()
+	def targets(self) -> Generator['NFAState', None, None]:
+		yield from self.etrans
+		for chars, target_state in self.trans:
+			yield target_state
 
-		def _visit(state: 'NFAState') -> None:
-			if state in visited:
-				return
-			visited.add(state)
+	def visit(self, visitor: Callable[['NFAState'], None]) -> None:
+		for state in depth_first((self,), NFAState.targets):
 			visitor(state)
-			for target_state in state.etrans:
-				_visit(target_state)
-			for chars, target_state in state.trans:
-				_visit(target_state)
-
-		_visit(self)
 
 
 class NFAFragment:
@@ -79,16 +74,14 @@ class NFAContext:
 def clone(begin: NFAState, end: NFAState) -> Tuple[NFAState, NFAState]:
 	remap: Dict[NFAState, NFAState] = dict()
 
-	def get_clone(state: NFAState) -> NFAState:
-		if state in remap:
-			return remap[state]
-		new_state = NFAState()
-		remap[state] = new_state
+	states = list(depth_first((begin, end), NFAState.targets))
+	for state in states:
+		remap[state] = NFAState()
+	for state in states:
+		new_state = remap[state]
 		for target_state in state.etrans:
-			new_state.etrans.append(get_clone(target_state))
+			new_state.etrans.append(remap[target_state])
 		for chars, target_state in state.trans:
-			new_state.trans.append((chars, get_clone(target_state)))
-		return new_state
-
-	return get_clone(begin), get_clone(end)
+			new_state.trans.append((chars, remap[target_state]))
 
+	return remap[begin], remap[end]
@@ -1,5 +1,5 @@
 from abc import abstractmethod
-from typing import Iterable
+from typing import Iterable, List
 
 from jellycc.lexer.nfa import NFAState, NFAContext, clone
 from jellycc.utils.source import SrcLoc
@@ -38,9 +38,21 @@ class ReConcat(Re):
 		self.rhs = rhs
 
 	def build_nfa(self, ctx: NFAContext, begin: NFAState, end: NFAState) -> None:
-		mid = NFAState()
-		self.lhs.build_nfa(ctx, begin, mid)
-		self.rhs.build_nfa(ctx, mid, end)
+		# string literals are long left-nested chains, so flatten them instead of recursing
+		parts: List[Re] = []
+		stack: List[Re] = [self]
+		while len(stack) > 0:
+			re = stack.pop()
+			if isinstance(re, ReConcat):
+				stack.append(re.rhs)
+				stack.append(re.lhs)
+			else:
+				parts.append(re)
+		for part in parts[:-1]:
+			mid = NFAState()
+			part.build_nfa(ctx, begin, mid)
+			begin = mid
+		parts[-1].build_nfa(ctx, begin, end)
 
 
 class ReChoice(Re):
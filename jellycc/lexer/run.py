@@ -1,17 +1,24 @@
-from typing import List, Tuple
+from typing import List, Tuple, Optional
 
-from jellycc.lexer.dfa import DFAState, Builder
+from jellycc.lexer.dfa import DFA, Builder, NoState
 from jellycc.lexer.dfa_minimize import minimize
 from jellycc.lexer.codegen import Codegen
 from jellycc.lexer.grammar import LexerGrammar
 from jellycc.lexer.nfa import NFAContext, NFAState, NFARule
 from jellycc.lexer.phf import PHF
 from jellycc.lexer.regexp import Re
+from jellycc.lexer.runtime import LexerTables
+from jellycc.project.cache import ArtifactCache, ObjectRefs
 from jellycc.project.grammar import SharedGrammar
 from jellycc.utils.error import CCError
+from jellycc.utils.profile import profiler
 from jellycc.utils.source import SrcLoc
 
 
+# sections of the project file the lexer tables are built from
+CacheSections = ("terminals", "lexer.fragments", "lexer.grammar")
+
+
 class LexerGenerator:
 	def __init__(self, shared: SharedGrammar) -> None:
 		self.shared = shared
@@ -21,8 +28,10 @@ class LexerGenerator:
 		self.nfa_ends: List[NFAState] = []
 		self.lexer_rules: List[Tuple[SrcLoc, str, Re]] = []
 		self.nfa_rules: List[NFARule] = []
+		self.cache: Optional[ArtifactCache] = None
 
 	def construct(self) -> None:
+		# the nfa is cheap and resolves every regex and fragment, the cache only skips the dfa stages
 		for idx, (loc, name, re) in enumerate(self.lexer_rules):
 			if name not in self.shared.terminals:
 				raise CCError(loc, f"terminal '{name}' not found")
@@ -34,40 +43,50 @@ class LexerGenerator:
 			self.nfa_rules.append(rule)
 			self.nfa_ends.append(end_state)
 
+	def build_dfa(self) -> DFA:
+		assert self.shared.term_error is not None
+		with profiler.stage("determinize"):
+			builder = Builder(self.shared.term_error, self.nfa_rules, 0)
+			dfa = builder.build(self.nfa_init)
+		with profiler.stage("minimize"):
+			min_dfa = minimize(dfa)
+		self.inject_error_state(min_dfa)
+		return min_dfa
+
 	def run(self) -> None:
 		if not self.shared.term_error:
 			raise CCError(None, "no {error} terminal found")
 
-		builder = Builder(self.shared.term_error, self.nfa_rules, 0)
-		dfa = builder.build(self.nfa_init)
-		keywords = builder.keywords
-		min_dfa = minimize(dfa)
+		if self.cache:
+			refs = ObjectRefs()
+			for terminal in self.shared.terminals.values():
+				refs.add(('terminal', terminal.name), terminal)
+			key = self.cache.key('lexer', self.shared, CacheSections)
+			dfa = self.cache.load(key, refs)
+			if dfa is None:
+				dfa = self.build_dfa()
+				self.cache.store(key, dfa, refs)
+		else:
+			dfa = self.build_dfa()
 
-		self.inject_error_state(min_dfa)
-
-		list_states: List[DFAState] = []
-		min_dfa.visit(lambda state: list_states.append(state))
+		with profiler.stage("codegen"):
+			codegen = Codegen(self.lexer_grammar, dfa)
+			codegen.run()
+		if self.lexer_grammar.tables_path is not None:
+			LexerTables.from_codegen(codegen).save(self.lexer_grammar.tables_path)
 
-		codegen = Codegen(self.lexer_grammar, min_dfa)
-		codegen.run()
-
-	def inject_error_state(self, initial_state: DFAState) -> None:
-		error_state = DFAState()
+	def inject_error_state(self, dfa: DFA) -> None:
 		error_terminal = self.shared.term_error
+		assert error_terminal is not None
 		accept_error = NFARule(-1, error_terminal.loc, error_terminal)
-		error_state.accepts = accept_error
-
-		def visitor(state: DFAState) -> None:
-			if (state.accepts is None) and (state is not initial_state):
-				state.accepts = accept_error
 
-		initial_state.visit(visitor)
+		for state in range(1, dfa.num_states):
+			if dfa.accepts[state] is None:
+				dfa.accepts[state] = accept_error
 
-		bad_characters: List[int] = []
-		for idx, target in enumerate(initial_state.trans):
-			if target is None:
-				bad_characters.append(idx)
-				initial_state.trans[idx] = error_state
+		error_state = dfa.add_state(accept_error)
 
-		for char in bad_characters:
-			error_state.trans[char] = error_state
+		for klass in range(dfa.num_classes):
+			if dfa.get(0, klass) == NoState:
+				dfa.set(0, klass, error_state)
+				dfa.set(error_state, klass, error_state)
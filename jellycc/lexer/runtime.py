@@ -0,0 +1,282 @@
+import json
+import os
+from array import array
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Dict, Tuple, Iterator, Sequence, Union, Optional, Any
+
+from jellycc.lexer.codegen import Codegen, AcceptBit
+
+try:
+	import numpy  # type: ignore
+except ImportError:
+	# optional, batches are lexed one input at a time without it
+	numpy = None
+
+
+LexerInput = Union[bytes, bytearray, memoryview, Any]
+TokenStream = Tuple[List[int], List[int]]
+# tokens and offsets of a speculatively lexed chunk, with the state and token count after every interval
+SpeculativeChunk = Tuple[List[int], List[int], List[int], List[int]]
+
+DefaultChunkSize = 1 << 16
+
+# parallel lexing, as run_parallel of the generated lexer
+SyncInterval = 4096
+MinParallelChunk = 1 << 16
+
+TablesVersion = 1
+
+
+class LexerTables:
+	# the tables generated lexers run on, in the same encoding as lexer.cpp:
+	#   trans[klass * num_states + state] = next_state << 1 | emit
+	# emit means the token accepted in 'state' ends before the current byte
+	def __init__(
+		self, num_states: int, class_of: bytes, transitions: 'array[int]', accepts: 'array[int]', finals: 'array[int]',
+		terminals: Dict[str, int]
+	) -> None:
+		self.num_states: int = num_states
+		self.class_of: bytes = class_of
+		self.transitions: 'array[int]' = transitions
+		self.accepts: 'array[int]' = accepts
+		self.finals: 'array[int]' = finals
+		self.terminals: Dict[str, int] = terminals
+
+	@staticmethod
+	def from_codegen(codegen: Codegen) -> 'LexerTables':
+		terminals: Dict[str, int] = dict()
+		for terminal in codegen.grammar.shared.terminals_list:
+			assert terminal.value is not None
+			terminals[terminal.name] = terminal.value
+		return LexerTables(
+			codegen.dfa.num_states,
+			bytes(codegen.dfa.class_of.tolist()),
+			array('I', codegen.transitions),
+			array('H', codegen.state_accepts),
+			array('B', codegen.state_finals),
+			terminals
+		)
+
+	def to_json(self) -> Dict[str, Any]:
+		return {
+			"version": TablesVersion,
+			"num_states": self.num_states,
+			"class_of": list(self.class_of),
+			"transitions": self.transitions.tolist(),
+			"accepts": self.accepts.tolist(),
+			"finals": self.finals.tolist(),
+			"terminals": self.terminals
+		}
+
+	@staticmethod
+	def from_json(data: Dict[str, Any]) -> 'LexerTables':
+		if data.get("version") != TablesVersion:
+			raise ValueError(f"unsupported lexer tables version {data.get('version')}")
+		return LexerTables(
+			data["num_states"],
+			bytes(data["class_of"]),
+			array('I', data["transitions"]),
+			array('H', data["accepts"]),
+			array('B', data["finals"]),
+			data["terminals"]
+		)
+
+	def save(self, path: str) -> None:
+		with open(path, 'w') as fp:
+			json.dump(self.to_json(), fp)
+
+	@staticmethod
+	def load(path: str) -> 'LexerTables':
+		with open(path, 'r') as fp:
+			return LexerTables.from_json(json.load(fp))
+
+
+class Lexer:
+	# runs LexerTables over byte input, tokens are reported with their end offsets like the C++ lexer does
+	def __init__(self, tables: LexerTables) -> None:
+		self.tables: LexerTables = tables
+		num_states = tables.num_states
+		# per state rows indexed by byte class, the chunk is translated to classes in one pass
+		self.rows: List[Tuple[int, ...]] = [tuple(tables.transitions[state::num_states]) for state in range(num_states)]
+		self.accepts: List[int] = tables.accepts.tolist()
+		self.state: int = 0
+		self.offset: int = 0
+
+	def reset(self) -> None:
+		self.state = 0
+		self.offset = 0
+
+	def feed(self, data: LexerInput) -> TokenStream:
+		# lexes the next piece of input, returns the tokens that ended inside it
+		classes = bytes(memoryview(data).cast('B')).translate(self.tables.class_of)
+		rows = self.rows
+		accepts = self.accepts
+		tokens: List[int] = []
+		offsets: List[int] = []
+		state = self.state
+		for pos, klass in enumerate(classes, self.offset):
+			trans = rows[state][klass]
+			if trans & AcceptBit:
+				tokens.append(accepts[state])
+				offsets.append(pos)
+			state = trans >> 1
+		self.state = state
+		self.offset += len(classes)
+		return tokens, offsets
+
+	def finish(self) -> TokenStream:
+		# ends the input, the pending token is reported if its state accepts
+		tokens: List[int] = []
+		offsets: List[int] = []
+		if self.tables.finals[self.state] & AcceptBit:
+			tokens.append(self.accepts[self.state])
+			offsets.append(self.offset)
+		self.reset()
+		return tokens, offsets
+
+	def run(self, data: LexerInput, chunk_size: int = DefaultChunkSize) -> Iterator[TokenStream]:
+		# data may be bytes, bytearray, memoryview or mmap, it is sliced without copying it as a whole
+		self.reset()
+		view = memoryview(data).cast('B')
+		for begin in range(0, len(view), chunk_size):
+			yield self.feed(view[begin:begin + chunk_size])
+		yield self.finish()
+
+	def tokenize(self, data: LexerInput, chunk_size: int = DefaultChunkSize) -> TokenStream:
+		tokens: List[int] = []
+		offsets: List[int] = []
+		for chunk_tokens, chunk_offsets in self.run(data, chunk_size):
+			tokens.extend(chunk_tokens)
+			offsets.extend(chunk_offsets)
+		return tokens, offsets
+
+	def tokenize_parallel(self, data: LexerInput, workers: Optional[int] = None, processes: bool = True) -> TokenStream:
+		# chunks after the first are lexed speculatively from the initial state on a pool and stitched in order,
+		# see run_parallel in lexer.cpp; threads only help if the runtime can run Python threads in parallel
+		view = memoryview(data).cast('B')
+		count = min(workers or os.cpu_count() or 1, len(view) // MinParallelChunk)
+		if count <= 1:
+			return self.tokenize(data)
+		bounds = [len(view) // count * idx for idx in range(count)] + [len(view)]
+		executor: Executor = ProcessPoolExecutor(count - 1) if processes else ThreadPoolExecutor(count - 1)
+		with executor:
+			futures = [
+				executor.submit(lex_speculative, self.tables, bytes(view[bounds[idx]:bounds[idx + 1]]), bounds[idx])
+				for idx in range(1, count)
+			]
+			# the first chunk starts in the initial state for sure
+			self.reset()
+			tokens, offsets = self.feed(view[:bounds[1]])
+			for idx, future in enumerate(futures, 1):
+				chunk_tokens, chunk_offsets = self.stitch(view[bounds[idx]:bounds[idx + 1]], future.result())
+				tokens.extend(chunk_tokens)
+				offsets.extend(chunk_offsets)
+		final_tokens, final_offsets = self.finish()
+		tokens.extend(final_tokens)
+		offsets.extend(final_offsets)
+		return tokens, offsets
+
+	def stitch(self, data: memoryview, chunk: SpeculativeChunk) -> TokenStream:
+		# lexes the chunk again from the current state until it reaches the state the speculative run
+		# recorded at a checkpoint, the speculative tokens from there on are the right ones
+		chunk_tokens, chunk_offsets, sync_states, sync_tokens = chunk
+		end = self.offset + len(data)
+		tokens: List[int] = []
+		offsets: List[int] = []
+		for idx, pos in enumerate(range(0, len(data), SyncInterval)):
+			piece_tokens, piece_offsets = self.feed(data[pos:pos + SyncInterval])
+			tokens.extend(piece_tokens)
+			offsets.extend(piece_offsets)
+			if self.state == sync_states[idx]:
+				tokens.extend(chunk_tokens[sync_tokens[idx]:])
+				offsets.extend(chunk_offsets[sync_tokens[idx]:])
+				self.state = sync_states[-1]
+				self.offset = end
+				break
+		return tokens, offsets
+
+	def tokenize_many(self, inputs: Sequence[LexerInput], vectorized: Optional[bool] = None) -> List[TokenStream]:
+		# vectorized lexing needs numpy, by default it is used whenever numpy is available
+		if vectorized is None:
+			vectorized = numpy is not None
+		if not vectorized or len(inputs) == 0:
+			return [self.tokenize(data) for data in inputs]
+		if numpy is None:
+			raise RuntimeError("vectorized lexing requires numpy")
+		return self._tokenize_many_numpy(inputs)
+
+	def _tokenize_many_numpy(self, inputs: Sequence[LexerInput]) -> List[TokenStream]:
+		# all inputs advance one byte per step, meant for many small inputs since each is padded to the longest
+		np = numpy
+		views = [memoryview(data).cast('B') for data in inputs]
+		count = len(views)
+		lengths = np.array([len(view) for view in views], dtype=np.int64)
+		# longest first, so the inputs that still have bytes left are always a prefix
+		order = np.argsort(-lengths, kind='stable')
+		lengths = lengths[order]
+		max_length = int(lengths[0])
+
+		class_of = np.frombuffer(self.tables.class_of, dtype=np.uint8)
+		classes = np.zeros((count, max_length), dtype=np.uint8)
+		for row, idx in enumerate(order.tolist()):
+			view = views[idx]
+			classes[row, :len(view)] = class_of[np.frombuffer(view, dtype=np.uint8)]
+
+		num_states = self.tables.num_states
+		transitions = np.array(self.tables.transitions, dtype=np.int64)
+		accepts = np.array(self.tables.accepts, dtype=np.int64)
+		finals = np.array(self.tables.finals, dtype=np.int64)
+
+		states = np.zeros(count, dtype=np.int64)
+		emit_rows: List[Any] = []
+		emit_tokens: List[Any] = []
+		emit_offsets: List[Any] = []
+		active = count
+		for pos in range(max_length):
+			while lengths[active - 1] <= pos:
+				active -= 1
+			current = states[:active]
+			trans = transitions[classes[:active, pos].astype(np.int64) * num_states + current]
+			hits = np.flatnonzero(trans & AcceptBit)
+			if len(hits) > 0:
+				emit_rows.append(hits)
+				emit_tokens.append(accepts[current[hits]])
+				emit_offsets.append(np.full(len(hits), pos, dtype=np.int64))
+			states[:active] = trans >> 1
+
+		hits = np.flatnonzero(finals[states] & AcceptBit)
+		emit_rows.append(hits)
+		emit_tokens.append(accepts[states[hits]])
+		emit_offsets.append(lengths[hits])
+
+		rows = np.concatenate(emit_rows)
+		# emits were collected position by position, a stable sort by input keeps them in order
+		by_row = np.argsort(rows, kind='stable')
+		rows = rows[by_row]
+		tokens = np.concatenate(emit_tokens)[by_row]
+		offsets = np.concatenate(emit_offsets)[by_row]
+		bounds = np.searchsorted(rows, np.arange(count + 1)).tolist()
+
+		results: List[TokenStream] = [([], [])] * count
+		for row, idx in enumerate(order.tolist()):
+			begin, end = bounds[row], bounds[row + 1]
+			results[idx] = (tokens[begin:end].tolist(), offsets[begin:end].tolist())
+		return results
+
+
+def lex_speculative(tables: LexerTables, data: bytes, offset: int) -> SpeculativeChunk:
+	# lexes a chunk from the initial state as if a token started at its beginning, runs in pool workers
+	lexer = Lexer(tables)
+	lexer.offset = offset
+	tokens: List[int] = []
+	offsets: List[int] = []
+	sync_states: List[int] = []
+	sync_tokens: List[int] = []
+	view = memoryview(data)
+	for pos in range(0, len(view), SyncInterval):
+		piece_tokens, piece_offsets = lexer.feed(view[pos:pos + SyncInterval])
+		tokens.extend(piece_tokens)
+		offsets.extend(piece_offsets)
+		sync_states.append(lexer.state)
+		sync_tokens.append(len(tokens))
+	return tokens, offsets, sync_states, sync_tokens
@@ -4,6 +4,7 @@ from typing import Dict, List, Tuple, Iterable, Optional, Set
 
 from jellycc.project.grammar import Terminal, CodeBlock, SharedGrammar
 from jellycc.utils.error import CCError
+from jellycc.utils.helpers import iter_bits
 from jellycc.utils.source import SrcLoc
 
 
@@ -149,6 +150,8 @@ class SymbolTerminal(Symbol):
 		super().__init__()
 		self.terminal = terminal
 		self.idx = -1
+		# terminal sets are bitmasks over the dense terminal index
+		self.bit: int = 0
 
 	def to_inline_str(self) -> str:
 		return str(self)
@@ -176,9 +179,11 @@ class SymbolNonTerminal(Symbol):
 		self.name: str = name
 		self.prods: List[Production] = []
 		self.exported = False
-		self.first: Set[SymbolTerminal] = set()
+		self.first: int = 0
 		self.nullable: bool = False
 		self.idx: int = -1
+		# type of the value the nonterminal leaves on the vm stack, the type of its template
+		self.type: Type = TypeVariable(name)
 
 	def to_inline_str(self) -> str:
 		return self.name
@@ -207,6 +212,7 @@ class ParserGrammar:
 		self.ns: str = "pp"
 		self.core_header_path: Optional[str] = None
 		self.core_source_path: Optional[str] = None
+		self.tables_path: Optional[str] = None
 		self.vm_header_path: Optional[str] = None
 		self.vm_source_path: Optional[str] = None
 		self.vm_args: List[Tuple[SrcLoc, str, str]] = []
@@ -217,10 +223,15 @@ class ParserGrammar:
 		self.actions.append(action)
 
 	def add_terminal(self, terminal: SymbolTerminal) -> SymbolTerminal:
+		terminal.idx = len(self.terminals)
+		terminal.bit = 1 << terminal.idx
 		self.terminal_map[terminal.terminal.name] = terminal
 		self.terminals.append(terminal)
 		return terminal
 
+	def terminal_set(self, mask: int) -> List[SymbolTerminal]:
+		return [self.terminals[idx] for idx in iter_bits(mask)]
+
 	def add_nonterminal(self, nt: SymbolNonTerminal) -> None:
 		self.nonterminals.append(nt)
 
@@ -1,11 +1,12 @@
 import time
 from collections import defaultdict
-from functools import cmp_to_key
 from typing import List, Union, Dict, Optional, Tuple, Callable, TypeVar, Set, Generator, cast, Iterable, Any
 
 import sys
 
 from jellycc.parser.grammar import ParserGrammar, SymbolTerminal, Action, SymbolNonTerminal
+from jellycc.utils.helpers import iter_bits
+from jellycc.utils.profile import profiled
 from jellycc.utils.scc import topological_sort
 
 
@@ -14,8 +15,8 @@ class LLState:
 		self.name = name
 		self.productions: List[LLProduction] = []
 		self.nullable: Optional[Tuple[Action]] = None
-		self.first: Set[SymbolTerminal] = set()
-		self.follow: Set[SymbolTerminal] = set()
+		self.first: int = 0
+		self.follow: int = 0
 		self.order: int = -1
 
 	def add_production(self, production: 'LLProduction') -> None:
@@ -65,6 +66,70 @@ class LLProduction:
 LLItem = Union[LLState, SymbolTerminal, Action]
 
 
+class LLTrie:
+	# the productions of a state with their common prefixes shared. Items are keyed by identity, every state,
+	# terminal and action is a single object. A trie is only changed while it is built, factoring derives new
+	# tries that share every untouched subtrie with the old one
+	def __init__(self, end: bool = False, children: Optional[Dict[LLItem, 'LLTrie']] = None) -> None:
+		self.children: Dict[LLItem, LLTrie] = dict() if children is None else children
+		self.end: bool = end
+		self.key_id: int = -1
+
+	def insert(self, items: Iterable[LLItem]) -> 'LLTrie':
+		node = self
+		for item in items:
+			child = node.children.get(item, None)
+			if child is None:
+				child = LLTrie()
+				node.children[item] = child
+			node = child
+		return node
+
+	def merge_from(self, other: 'LLTrie') -> None:
+		# only for a trie that is still being built, the subtries of other are shared
+		self.end = self.end or other.end
+		for item, other_child in other.children.items():
+			child = self.children.get(item, None)
+			self.children[item] = other_child if child is None else child.merged(other_child)
+
+	def merged(self, other: 'LLTrie') -> 'LLTrie':
+		if self is other:
+			return self
+		trie = LLTrie(self.end, dict(self.children))
+		trie.merge_from(other)
+		return trie
+
+	def expanded(self, state: 'LLState') -> 'LLTrie':
+		# the leading state replaced by its productions, each of them followed by what followed the state
+		tail = self.children[state]
+		trie = LLTrie(self.end, {item: child for item, child in self.children.items() if item is not state})
+		for production in state.productions:
+			head = tail
+			for item in reversed(production.items):
+				head = LLTrie(False, {item: head})
+			trie.merge_from(head)
+		return trie
+
+	def replaced(self, path: Tuple[LLItem, ...], fn: Callable[['LLTrie'], 'LLTrie']) -> 'LLTrie':
+		if len(path) == 0:
+			return fn(self)
+		children = dict(self.children)
+		children[path[0]] = children[path[0]].replaced(path[1:], fn)
+		return LLTrie(self.end, children)
+
+	def key(self, keys: Dict[Any, int]) -> int:
+		# equal for tries with the same set of paths, whatever the order they were inserted in
+		if self.key_id < 0:
+			key = (self.end, frozenset((item, child.key(keys)) for item, child in self.children.items()))
+			self.key_id = keys.setdefault(key, len(keys))
+		return self.key_id
+
+
+# a leading item of a trie: the actions before it and the subtrie that follows it. The item is None for a
+# production that ends after the actions
+TrieUnit = Tuple[Tuple[Action, ...], Optional[LLItem], LLTrie]
+
+
 T = TypeVar('T')
 
 
@@ -81,13 +146,22 @@ def remove_if(list: List[T], fn: Callable[[T], bool]) -> None:
 		del list[j:n]
 
 
-def compare_lists(l1: List[T], l2: List[T]) -> bool:
-	if len(l1) != len(l2):
-		return False
-	for idx in range(len(l1)):
-		if l1[idx] is not l2[idx]:
-			return False
-	return True
+def propagate_masks(worklist: List[LLState], edges: Dict[LLState, List[LLState]], field: str) -> None:
+	# a state is queued again only when its mask grows, so each edge is walked at most once per new terminal
+	queued: Set[LLState] = set(worklist)
+	i = 0
+	while i < len(worklist):
+		state = worklist[i]
+		queued.discard(state)
+		mask = getattr(state, field)
+		for target in edges.get(state, ()):
+			target_mask = getattr(target, field)
+			if mask & ~target_mask:
+				setattr(target, field, target_mask | mask)
+				if target not in queued:
+					queued.add(target)
+					worklist.append(target)
+		i += 1
 
 
 class LLBuilder:
@@ -95,9 +169,9 @@ class LLBuilder:
 		self.grammar: ParserGrammar = grammar
 		self.states: List[LLState] = []
 		self.entries: Dict[SymbolNonTerminal, LLState] = dict()
-		self.singleton_sets: Dict[SymbolTerminal, Set[SymbolTerminal]] = dict()
-		self.empty_set: Set[SymbolTerminal] = set()
 		self.ranks: Dict[LLState, int] = dict()
+		self.trie_keys: Dict[Any, int] = dict()
+		self.unique_states: Dict[int, LLState] = dict()
 
 	def build(self) -> None:
 		self.construct_initial_states()
@@ -139,12 +213,13 @@ class LLBuilder:
 				for production in state.productions:
 					print(f"  {production}")
 				if state.first:
-					print(f"  FIRST: {', '.join(map(str, state.first))}")
+					print(f"  FIRST: {', '.join(map(str, self.grammar.terminal_set(state.first)))}")
 				if state.follow:
-					print(f"  FOLLOW: {', '.join(map(str, state.follow))}")
+					print(f"  FOLLOW: {', '.join(map(str, self.grammar.terminal_set(state.follow)))}")
 		print(f"TOTAL STATES: {len(self.states)}")
 		print("===")
 
+	@profiled("construct_initial_states")
 	def construct_initial_states(self) -> None:
 		nt_to_state: Dict[SymbolNonTerminal, LLState] = dict()
 		nt_list: List[Tuple[SymbolNonTerminal, LLState]] = []
@@ -155,8 +230,10 @@ class LLBuilder:
 			nt_list.append((nt, state))
 			nt_to_state[nt] = state
 
-		for nt in self.grammar.keep:
-			self.entries[nt] = nt_to_state[nt]
+		# entries in grammar order, filter_states numbers the states from them
+		for nt in self.grammar.nonterminals:
+			if nt in self.grammar.keep:
+				self.entries[nt] = nt_to_state[nt]
 
 		for nt, state in nt_list:
 			for prod in nt.prods:
@@ -228,6 +305,7 @@ class LLBuilder:
 							)
 							raise RuntimeError("refactoring failed")
 
+	@profiled("eliminate_nullables")
 	def eliminate_nullables(self) -> None:
 		self.find_nullables()
 		self.factor_in_nullables()
@@ -259,20 +337,22 @@ class LLBuilder:
 			remove_if(state.productions, lambda production: any(map(lambda item: item in states, production.items)))
 		remove_if(self.states, lambda s: s in states)
 
+	@profiled("eliminate_left_recursion")
 	def eliminate_left_recursion(self) -> None:
 		self.semisort()
 		self.prevent_left_recursion()
 		self.eliminate_nullables()
 
 	def semisort(self) -> None:
-		reachables: Dict[LLState, Set[LLState]] = defaultdict(set)
+		# edges are kept in production order, sets of states would order them by identity
+		reachables: Dict[LLState, List[LLState]] = defaultdict(list)
 		ordered: List[LLState] = []
 
 		for state in self.states:
 			for production in state.productions:
 				reachable, _ = production.extract_reachable()
-				if reachable is not None:
-					reachables[state].add(reachable)
+				if reachable is not None and reachable not in reachables[state]:
+					reachables[state].append(reachable)
 
 		def edges_of(state: LLState) -> Generator[LLState, None, None]:
 			yield from reachables[state]
@@ -375,16 +455,14 @@ class LLBuilder:
 		self.compute_first_sets()
 		self.compute_follow_sets()
 
+	@profiled("compute_first_sets")
 	def compute_first_sets(self) -> None:
+		# FIRST of a state flows to every state whose productions can start with it
 		edges: Dict[LLState, List[LLState]] = defaultdict(lambda: [])
-
-		def inject_first(state: LLState, token: SymbolTerminal) -> None:
-			if token not in state.first:
-				state.first.add(token)
-				for target in edges[state]:
-					inject_first(target, token)
+		worklist: List[LLState] = []
 
 		for state in self.states:
+			first = state.first
 			for production in state.productions:
 				for item in production.items:
 					if isinstance(item, LLState):
@@ -392,18 +470,16 @@ class LLBuilder:
 						if item.nullable is None:
 							break
 					elif isinstance(item, SymbolTerminal):
+						first |= item.bit
 						break
+			state.first = first
+			if first:
+				worklist.append(state)
 
-		for state in self.states:
-			for production in state.productions:
-				for item in production.items:
-					if isinstance(item, SymbolTerminal):
-						inject_first(state, item)
-						break
-					elif isinstance(item, LLState) and item.nullable is None:
-						break
+		propagate_masks(worklist, edges, 'first')
 
 	def compute_follow_sets(self) -> None:
+		# FOLLOW of a state flows to the states that can end its productions
 		edges: Dict[LLState, List[LLState]] = defaultdict(lambda: [])
 
 		prevs: List[LLState] = []
@@ -414,11 +490,11 @@ class LLBuilder:
 				for item in production.items:
 					if isinstance(item, SymbolTerminal):
 						for prev in prevs:
-							prev.follow.add(item)
+							prev.follow |= item.bit
 						prevs.clear()
 					elif isinstance(item, LLState):
 						for prev in prevs:
-							prev.follow.update(item.first)
+							prev.follow |= item.first
 						if item.nullable is None:
 							prevs.clear()
 						prevs.append(item)
@@ -427,178 +503,142 @@ class LLBuilder:
 				for prev in prevs:
 					edges[state].append(prev)
 
-		def propagate(state: LLState):
-			if state not in edges:
-				return
-			for target in edges[state]:
-				n = len(target.follow)
-				target.follow.update(state.follow)
-				if n != len(target.follow):
-					propagate(target)
-
-		for state in self.states:
-			propagate(state)
+		worklist = [state for state in self.states if state.follow]
+		propagate_masks(worklist, edges, 'follow')
 
+	@profiled("left_factor")
 	def left_factor(self) -> None:
 		self.compute_first_sets()
 		self.eliminate_common_prefix()
 
-	def get_production_first_set(self, production: LLProduction) -> Set[SymbolTerminal]:
-		for item in production.items:
-			if isinstance(item, SymbolTerminal):
-				if item not in self.singleton_sets:
-					self.singleton_sets[item] = {item}
-				return self.singleton_sets[item]
-			elif isinstance(item, LLState):
-				return item.first
-		return self.empty_set
-
-	def left_factor_state(self, expanded_rules: Dict[LLState, int], state: LLState):
-		new_productions = []
-		self.reprocess_bucket(expanded_rules, state, state.productions, new_productions)
-		uniques: Dict[Tuple[LLItem, ...], LLState] = dict()
-		for production in new_productions:
-			key = tuple(production.items)
-			if key not in uniques:
-				uniques[key] = production
-		state.productions = list(uniques.values())
-
-	def reduce_ranks(self, expanded_rules: Dict[LLState, int], state: LLState, rank: int, list: List[LLProduction]) -> bool:
-		new_productions: List[LLProduction] = []
-		new_expansions: Set[LLState] = set()
-		for production in list:
-			if self.get_production_rank(production) == rank:
-				for idx, item in enumerate(production.items):
-					if isinstance(item, LLState):
-						new_expansions.add(item)
-						if (item in expanded_rules) and (expanded_rules[item] >= 1):
-							return False
-						for item_production in item.productions:
-							new_production = LLProduction(state)
-							new_production.items.extend(production.items[:idx])
-							new_production.items.extend(item_production.items)
-							new_production.items.extend(production.items[idx+1:])
-							new_productions.append(new_production)
-						break
-			else:
-				new_productions.append(production)
-		list.clear()
-		list.extend(new_productions)
-		for expansion in new_expansions:
-			expanded_rules[expansion] += 1
-		return True
-
-	def reprocess_bucket(self, expanded_rules: Dict[LLState, int], state: LLState, list: List[LLProduction], output: List[LLProduction]) -> None:
-		buckets: List[Tuple[Set[SymbolTerminal], List[LLProduction]]] = []
-		for production in list:
-			my_set = self.get_production_first_set(production)
-			for idx, bucket in enumerate(buckets):
-				if not bucket[0].isdisjoint(my_set):
-					if len(bucket[1]) == 1:
-						buckets[idx] = (bucket[0].union(my_set), bucket[1])
-					else:
-						bucket[0].update(my_set)
-					bucket[1].append(production)
-					break
-			else:
-				buckets.append((my_set, [production]))
+	def eliminate_common_prefix(self) -> None:
+		# every state is factored once over a trie of its productions. A suffix shared by several productions
+		# becomes a state of its own, reused for every trie with the same paths, original states included
+		self.compute_ranks()
+		tries: Dict[LLState, LLTrie] = dict()
+		self.trie_keys = dict()
+		self.unique_states = dict()
+		for state in self.states:
+			trie = LLTrie()
+			for production in state.productions:
+				trie.insert(production.items).end = True
+			tries[state] = trie
+			self.unique_states.setdefault(trie.key(self.trie_keys), state)
+		for state in self.states[::]:
+			state.productions = self.factor_trie(state, tries[state], set())
 
-		for bucket in buckets:
-			if len(bucket[1]) > 1:
-				self.left_factor_bucket(expanded_rules, state, bucket[1], output)
-			else:
-				output.append(bucket[1][0])
+	def item_first(self, item: Optional[LLItem]) -> int:
+		if isinstance(item, SymbolTerminal):
+			return item.bit
+		elif isinstance(item, LLState):
+			return item.first
+		return 0
 
-	def insert_unique_state(self, state: LLState) -> LLState:
-		for other in self.states:
-			if other is state:
-				return state
-			if len(other.productions) != len(state.productions):
-				continue
-			for idx in range(len(other.productions)):
-				if not compare_lists(other.productions[idx].items, state.productions[idx].items):
-					break
-			else:
-				return other
-		self.states.append(state)
-		return state
-
-	def unify_bucket(self, state: LLState, bucket: List[LLProduction]) -> None:
-		"""
-		heads: Dict[Tuple[LLItem, ...], LLState] = dict()
-		for production in bucket:
-			_, idx = production.extract_reachable()
-			key = tuple(production.items[:idx + 1])
-			if key not in heads:
-				rhs_state = LLState(state.name + '[' + ' '.join(map(str, key)) + ']')
-				heads[key] = rhs_state
-			rhs_state = heads[key]
-			new_production = LLProduction(rhs_state)
-			new_production.items.extend(production.items[idx + 1:])
-			rhs_state.productions.append(new_production)
-		new_productions: List[LLProduction] = []
-		for key, rhs_state in heads.items():
-			rhs_state = self.insert_unique_state(rhs_state)
-			production = LLProduction(state)
-			production.items.extend(key)
-			production.items.append(rhs_state)
-			new_productions.append(production)
-		bucket.clear()
-		bucket.extend(new_productions)
-		"""
-		pass
-
-	def left_factor_bucket(self, expanded_rules: Dict[LLState, int], state: LLState, bucket: List[LLProduction], output: List[LLProduction]) -> None:
-		common_sequence: List[LLItem] = bucket[0].items[:]
-		for production in bucket[1:]:
-			n = min(len(common_sequence), len(production.items))
-			idx = 0
-			while idx < n:
-				if common_sequence[idx] != production.items[idx]:
-					break
-				idx += 1
-			if idx != len(common_sequence):
-				del common_sequence[idx:]
-
-		if len(common_sequence) == 0:
-			self.unify_bucket(state, bucket)
-			max_rank = max(map(self.get_production_rank, bucket))
-			if not self.reduce_ranks(expanded_rules, state, max_rank, bucket):
-				productions = '\n'.join(map(lambda x: '  ' + str(x), bucket))
-				states = ' '.join(map(str, expanded_rules))
-				print(
-					f"Left factoring failed: state {state.name} invokes recursive expansion:\n{states}\n\n{productions}"
-				)
-				self.dump_states()
-				raise RuntimeError("refactoring failed")
-			else:
-				self.reprocess_bucket(expanded_rules, state, bucket, output)
-				return
+	def item_rank(self, item: Optional[LLItem]) -> int:
+		if isinstance(item, LLState):
+			return self.ranks[item]
+		return 0
 
-		rhs_state = LLState(state.name + '[' + ' '.join(map(str, common_sequence)) + ']')
-		for production in bucket:
-			rhs_production = LLProduction(rhs_state)
-			rhs_production.items.extend(production.items[len(common_sequence):])
-			rhs_state.add_production(rhs_production)
-			rhs_state.follow = state.follow
-			rhs_state.first.update(self.get_production_first_set(rhs_production))
-		old_state = rhs_state
-		rhs_state = self.insert_unique_state(rhs_state)
-		if rhs_state == old_state:
-			rules_copy = defaultdict(lambda: 0)
-			for k, v in expanded_rules.items():
-				rules_copy[k] = v
-			self.left_factor_state(rules_copy, rhs_state)
-
-		factored_production = LLProduction(state)
-		factored_production.items.extend(common_sequence)
-		factored_production.items.append(rhs_state)
-		output.append(factored_production)
+	def trie_units(self, root: LLTrie) -> List[TrieUnit]:
+		units: List[TrieUnit] = []
 
-	def eliminate_common_prefix(self) -> None:
-		self.compute_ranks()
-		for state in self.states[::]:
-			self.left_factor_state(defaultdict(lambda: 0), state)
+		def visit(actions: Tuple[Action, ...], node: LLTrie) -> None:
+			for item, child in node.children.items():
+				if isinstance(item, Action):
+					path = actions + (item,)
+					if child.end:
+						units.append((path, None, child))
+					visit(path, child)
+				else:
+					units.append((actions, item, child))
+
+		visit((), root)
+		return units
+
+	def group_units(self, units: List[TrieUnit]) -> List[List[TrieUnit]]:
+		# units are connected through the terminals their FIRST sets share
+		parents: List[int] = list(range(len(units)))
+
+		def find(idx: int) -> int:
+			while parents[idx] != idx:
+				parents[idx] = parents[parents[idx]]
+				idx = parents[idx]
+			return idx
+
+		owners: Dict[int, int] = dict()
+		for idx, unit in enumerate(units):
+			for bit in iter_bits(self.item_first(unit[1])):
+				parents[find(owners.setdefault(bit, idx))] = find(idx)
+
+		groups: Dict[int, List[TrieUnit]] = dict()
+		for idx, unit in enumerate(units):
+			groups.setdefault(find(idx), []).append(unit)
+		return list(groups.values())
+
+	def factor_trie(self, state: LLState, root: LLTrie, expanded: Set[LLState]) -> List[LLProduction]:
+		while True:
+			groups = self.group_units(self.trie_units(root))
+			conflicts = [group for group in groups if len(group) > 1]
+			if len(conflicts) == 0:
+				break
+			for group in conflicts:
+				root = self.expand_units(state, root, group, expanded)
+
+		productions: List[LLProduction] = []
+		if root.end:
+			productions.append(LLProduction(state))
+		for group in groups:
+			productions.append(self.factor_unit(state, group[0], expanded))
+		return productions
+
+	def expand_units(self, state: LLState, root: LLTrie, group: List[TrieUnit], expanded: Set[LLState]) -> LLTrie:
+		# units of the highest rank are replaced by the productions of their leading state, which lowers the
+		# rank of the group. A state expanded twice on the way to this trie would be expanded forever
+		rank = max(self.item_rank(unit[1]) for unit in group)
+		targets = [unit for unit in group if self.item_rank(unit[1]) == rank]
+		if rank == 0 or any(unit[1] in expanded for unit in targets):
+			reason = "has conflicting prefixes" if rank == 0 else "invokes recursive expansion"
+			prefixes = '\n'.join('  ' + ' '.join(map(str, unit[0] + (unit[1],))) for unit in group)
+			states = ' '.join(map(str, expanded))
+			print(f"Left factoring failed: state {state.name} {reason}:\n{states}\n\n{prefixes}")
+			self.dump_states()
+			raise RuntimeError("refactoring failed")
+
+		for actions, item, _ in targets:
+			target = cast(LLState, item)
+			root = root.replaced(actions, lambda parent: parent.expanded(target))
+			expanded.add(target)
+		return root
+
+	def factor_unit(self, state: LLState, unit: TrieUnit, expanded: Set[LLState]) -> LLProduction:
+		actions, item, node = unit
+		production = LLProduction(state)
+		production.items.extend(actions)
+		if item is None:
+			return production
+		production.items.append(item)
+		# the prefix common to every production of the unit goes on until they part or one of them ends
+		while len(node.children) == 1 and not node.end:
+			item, node = next(iter(node.children.items()))
+			production.items.append(item)
+		if len(node.children) > 0:
+			production.items.append(self.factor_suffix(state, production.items, node, expanded))
+		return production
+
+	def factor_suffix(self, state: LLState, prefix: List[LLItem], node: LLTrie, expanded: Set[LLState]) -> LLState:
+		key = node.key(self.trie_keys)
+		rhs_state = self.unique_states.get(key, None)
+		if rhs_state is None:
+			rhs_state = LLState(state.name + '[' + ' '.join(map(str, prefix)) + ']')
+			rhs_state.follow = state.follow
+			units = self.trie_units(node)
+			for unit in units:
+				rhs_state.first |= self.item_first(unit[1])
+			self.ranks[rhs_state] = max((self.item_rank(unit[1]) for unit in units), default=0) + 1
+			self.unique_states[key] = rhs_state
+			self.states.append(rhs_state)
+			rhs_state.productions = self.factor_trie(rhs_state, node, set(expanded))
+		return rhs_state
 
 	def get_production_rank(self, production: LLProduction) -> int:
 		for item in production.items:
@@ -616,6 +656,7 @@ class LLBuilder:
 				rank = max(rank, self.get_production_rank(production) + 1)
 			self.ranks[state] = rank
 
+	@profiled("eliminate_units")
 	def eliminate_units(self) -> None:
 		derivable: Dict[LLState, LLState] = dict()
 
@@ -637,8 +678,9 @@ class LLBuilder:
 						if item in derivable:
 							production.items[idx] = derivable[item]
 
+	@profiled("eliminate_singletons")
 	def eliminate_singletons(self) -> None:
-		derivable: Dict[LLState, Set[LLState]] = defaultdict(lambda: set())
+		derivable: Dict[LLState, List[LLState]] = defaultdict(lambda: [])
 
 		def is_singleton(production) -> bool:
 			return len(production.items) == 1 and isinstance(production.items[0], LLState)
@@ -646,8 +688,8 @@ class LLBuilder:
 		self.semisort()
 		for state in self.states:
 			for production in state.productions:
-				if len(production.items) == 1 and isinstance(production.items[0], LLState):
-					derivable[state].add(production.items[0])
+				if is_singleton(production) and production.items[0] not in derivable[state]:
+					derivable[state].append(cast(LLState, production.items[0]))
 
 		for state in reversed(self.states):
 			remove_if(state.productions, is_singleton)
@@ -657,79 +699,94 @@ class LLBuilder:
 					production_copy.items.extend(production.items)
 					state.add_production(production_copy)
 
+	@profiled("merge_states")
 	def merge_states(self) -> None:
-		shapes: Dict[LLState, int] = dict()
-
-		def compare(l1, l2) -> int:
-			if len(l1) > len(l2):
-				return -1
-			if len(l1) < len(l2):
-				return 1
-			for idx in range(len(l1)):
-				i1 = l1[idx]
-				i2 = l2[idx]
-				if isinstance(i1, int) and isinstance(i2, int):
-					if i1 - i2 != 0:
-						return i1 - i2
-				elif isinstance(i1, int):
-					return -1
-				elif isinstance(i2, int):
-					return 1
-				else:
-					if id(i1) != id(i2):
-						return id(i1) - id(i2)
-			return 0
-
-		def construct_state_key(state: LLState) -> Any:
-			key_list = []
+		# states are merged when they derive the same multiset of productions up to merged states: the
+		# coarsest stable partition, found by refining one class that holds every state. Productions are
+		# interned as tuples of ints, a state index or the negative id of a terminal or action, and only
+		# states that use a state whose class changed get their signature recomputed.
+		states = self.states
+		state_idx: Dict[LLState, int] = {state: idx for idx, state in enumerate(states)}
+		atoms: Dict[Union[SymbolTerminal, Action], int] = dict()
+		productions: List[List[Tuple[int, ...]]] = []
+		users: List[List[int]] = [[] for state in states]
+
+		for idx, state in enumerate(states):
+			interned: List[Tuple[int, ...]] = []
 			for production in state.productions:
-				key_sublist = []
+				items: List[int] = []
 				for item in production.items:
 					if isinstance(item, LLState):
-						key_sublist.append(shapes[item])
+						items.append(state_idx[item])
+						users[state_idx[item]].append(idx)
 					else:
-						key_sublist.append(item)
-				key_list.append(tuple(key_sublist))
-			return tuple(sorted(key_list, key=cmp_to_key(compare)))
-
-		for state in self.states:
-			shapes[state] = 0
-
-		old_len = 0
-		while True:
-			key_to_shape: Dict[Any, int] = dict()
-			keys: Dict[LLState, Any] = dict()
-			for state in self.states:
-				key = construct_state_key(state)
-				if key not in key_to_shape:
-					key_to_shape[key] = len(key_to_shape)
-				keys[state] = key
-			for state in self.states:
-				shapes[state] = key_to_shape[keys[state]]
-			if old_len == len(key_to_shape):
-				break
-			old_len = len(key_to_shape)
-
-		shape_repr: Dict[int, LLState] = dict()
-		new_states: List[LLState] = []
-		for state, shape in shapes.items():
-			if shape not in shape_repr:
-				shape_repr[shape] = state
-				new_states.append(state)
-
-		for state in self.states:
+						if item not in atoms:
+							atoms[item] = -1 - len(atoms)
+						items.append(atoms[item])
+				interned.append(tuple(items))
+			productions.append(interned)
+
+		classes: List[int] = [0] * len(states)
+		class_size: List[int] = [len(states)]
+		class_sig: List[Any] = [None]
+
+		def signature(idx: int) -> Any:
+			return tuple(sorted(
+				tuple(classes[item] if item >= 0 else item for item in production)
+				for production in productions[idx]
+			))
+
+		dirty: List[int] = list(range(len(states)))
+		while dirty:
+			by_class: Dict[int, List[int]] = defaultdict(list)
+			for idx in sorted(set(dirty)):
+				by_class[classes[idx]].append(idx)
+			moved: List[int] = []
+			for cls, members in by_class.items():
+				groups: Dict[Any, List[int]] = defaultdict(list)
+				for idx in members:
+					groups[signature(idx)].append(idx)
+				# members that were not touched keep the signature of the class and its id, without them the
+				# largest group keeps the id, every other group becomes a new class
+				if len(members) < class_size[cls]:
+					keep = class_sig[cls]
+				else:
+					keep = max(groups, key=lambda sig: len(groups[sig]))
+				class_sig[cls] = keep
+				for sig, group in groups.items():
+					if sig == keep:
+						continue
+					new_cls = len(class_size)
+					class_size.append(len(group))
+					class_sig.append(sig)
+					class_size[cls] -= len(group)
+					for idx in group:
+						classes[idx] = new_cls
+						moved.append(idx)
+			dirty = [user for idx in moved for user in users[idx]]
+
+		representative: Dict[int, LLState] = dict()
+		for idx, state in enumerate(states):
+			if classes[idx] not in representative:
+				representative[classes[idx]] = state
+
+		for state in states:
 			for production in state.productions:
 				for idx, item in enumerate(production.items):
 					if isinstance(item, LLState):
-						production.items[idx] = shape_repr[shapes[item]]
+						production.items[idx] = representative[classes[state_idx[item]]]
 
+	@profiled("filter_states")
 	def filter_states(self) -> None:
 		visited: Set[LLState] = set()
+		# states are kept in discovery order, so merged states get the same representative on every run
+		filtered_states: List[LLState] = []
 
 		def visit(state: LLState):
 			if state in visited:
 				return
 			visited.add(state)
+			filtered_states.append(state)
 			for production in state.productions:
 				for item in production.items:
 					if isinstance(item, LLState):
@@ -738,5 +795,4 @@ class LLBuilder:
 		for state in self.entries.values():
 			visit(state)
 
-		filtered_states = list(visited)
 		self.states = filtered_states
@@ -1,6 +1,7 @@
 from typing import List, Dict, Tuple, Optional, Callable
 
 from jellycc.codegen.codegen import CodePrinter, parse_template
+from jellycc.codegen.comb import CombTable
 
 import os
 
@@ -9,6 +10,15 @@ from jellycc.parser.ll.lhtable import LHTable, LHState, Transition, MegaAction,
 from jellycc.utils.helpers import chunked
 
 
+# layouts of the token dispatch tables
+DispatchDense = "dense"
+DispatchComb = "comb"
+DispatchLayouts = (DispatchDense, DispatchComb)
+
+# dispatch value of tokens a state (or a sync row) has no transition for
+NoDispatch = 0xff
+
+
 class SharedData:
 	def __init__(self):
 		self.action_sync_insert_token: int = -1
@@ -95,10 +105,54 @@ class SyncTable:
 		return self.states_ref[states]
 
 
+# vm code of the value stack operations, shared by the lh and lr backends
+def push_value(printer: CodePrinter, type: Type, offset: str, func: Callable[[], None]) -> None:
+	type = type.repr()
+	if isinstance(type, TypeVoid):
+		printer.write("(void)")
+	else:
+		printer.write(f"*({type}*)(data{offset}) = ")
+	printer.writeln("(")
+	func()
+	printer.writeln(");")
+	if (not isinstance(type, TypeVoid)):
+		printer.writeln(f"data += Aligned<{type}>;")
+	if len(offset) > 0:
+		printer.writeln(f"data += {offset};")
+
+
+def print_shift_action(printer: CodePrinter, grammar: ParserGrammar) -> None:
+	def print_shift():
+		_, _, (loc, name) = grammar.vm_actions['shift']
+		printer.include(loc, name)
+	push_value(printer, grammar.terminal_type, "", print_shift)
+
+
+def print_semantic_action(printer: CodePrinter, action: Action) -> None:
+	typelist: List[str] = []
+	for name, type in reversed(action.args):
+		type = type.repr()
+		if isinstance(type, TypeVoid):
+			continue
+		typelist.append(str(type))
+		if name:
+			printer.writeln(f"{type} ${name} = *({type}*)(data - ListOffset<{','.join(typelist)}>);")
+
+	def print_action():
+		printer.include(action.loc, action.source)
+
+	if len(typelist) > 0:
+		offset = f"-ListOffset<{','.join(typelist)}>"
+	else:
+		offset = ""
+	push_value(printer, action.type, offset, print_action)
+
+
 class CodegenLH:
-	def __init__(self, grammar: ParserGrammar, table: LHTable) -> None:
+	def __init__(self, grammar: ParserGrammar, table: LHTable, dispatch: str = DispatchDense) -> None:
 		self.grammar: ParserGrammar = grammar
 		self.table: LHTable = table
+		self.dispatch: str = dispatch
 
 		self.shared_data: SharedData = SharedData()
 
@@ -118,9 +172,14 @@ class CodegenLH:
 
 		self.sync_table: SyncTable = SyncTable(self.shared_data)
 
+		self.dispatch_comb: Optional[CombTable] = None
+		self.sync_dispatch_comb: Optional[CombTable] = None
+
 	def run(self) -> None:
 		self.compute()
+		self.write()
 
+	def write(self) -> None:
 		module_dir = os.path.dirname(os.path.abspath(__file__))
 
 		header_path = self.grammar.core_header_path
@@ -143,20 +202,6 @@ class CodegenLH:
 					self.subst
 				)
 
-	def push_val(self, printer: CodePrinter, type: Type, offset: str, func: Callable[[], None]) -> None:
-		type = type.repr()
-		if isinstance(type, TypeVoid):
-			printer.write("(void)")
-		else:
-			printer.write(f"*({type}*)(data{offset}) = ")
-		printer.writeln("(")
-		func()
-		printer.writeln(");")
-		if (not isinstance(type, TypeVoid)):
-			printer.writeln(f"data += Aligned<{type}>;")
-		if len(offset) > 0:
-			printer.writeln(f"data += {offset};")
-
 	def print_action_expr(self, printer: CodePrinter, action: MegaActionNode) -> None:
 		pass
 
@@ -164,30 +209,10 @@ class CodegenLH:
 		printer.writeln("{")
 		with printer.indented():
 			if action is Shift:
-				def print_shift():
-					_, _, (loc, name) = self.grammar.vm_actions['shift']
-					printer.include(loc, name)
-				self.push_val(printer, self.grammar.terminal_type, "", print_shift)
+				print_shift_action(printer, self.grammar)
 			else:
 				assert(isinstance(action, Action))
-
-				typelist: List[str] = []
-				for name, type in reversed(action.args):
-					type = type.repr()
-					if isinstance(type, TypeVoid):
-						continue
-					typelist.append(str(type))
-					if name:
-						printer.writeln(f"{type} ${name} = *({type}*)(data - ListOffset<{','.join(typelist)}>);")
-
-				def print_action():
-					printer.include(action.loc, action.source)
-
-				if len(typelist) > 0:
-					offset = f"-ListOffset<{','.join(typelist)}>"
-				else:
-					offset = ""
-				self.push_val(printer, action.type, offset, print_action)
+				print_semantic_action(printer, action)
 		printer.writeln("}")
 
 	def subst(self, printer: CodePrinter, name: str) -> None:
@@ -209,25 +234,32 @@ class CodegenLH:
 			for chunk in chunked(self.states, 10):
 				printer.write(', '.join(map(lambda row: str(row.base_offset), chunk)))
 				printer.writeln(',')
+		elif name == "dispatch_comb":
+			printer.write('1' if self.dispatch == DispatchComb else '0')
 		elif name == "dispatch_data":
-			def get_offset_of(row: TableRow, t: Optional[SymbolTerminal]) -> int:
-				if t is None:
-					return 0xff
-				if t in row.state.transitions:
-					return row.transition_map[row.state.transitions[t]]
-				if row.state.etransition is not None:
-					return row.transition_map[row.state.etransition]
-				return 0xff
-
-			for row in self.states:
-				printer.write('{')
-				printer.write(','.join(map(lambda t: str(get_offset_of(row, t)), self.all_terminals)))
-				printer.writeln('},')
-
-			printer.write('{')
-			for i in range(len(self.all_terminals)):
-				printer.write('255,')
-			printer.writeln('},')
+			if self.dispatch == DispatchDense:
+				self.write_dispatch_data(printer)
+		elif name == "dispatch_check_type":
+			if self.dispatch_comb is not None:
+				printer.write(self.dispatch_comb.check_type())
+		elif name == "dispatch_base_type":
+			if self.dispatch_comb is not None:
+				printer.write(self.dispatch_comb.base_type())
+		elif name == "dispatch_class_data":
+			if self.dispatch_comb is not None:
+				self.write_data(printer, self.dispatch_comb.classes)
+		elif name == "dispatch_default_data":
+			if self.dispatch_comb is not None:
+				self.write_data(printer, self.dispatch_comb.defaults)
+		elif name == "dispatch_base_data":
+			if self.dispatch_comb is not None:
+				self.write_data(printer, self.dispatch_comb.base)
+		elif name == "dispatch_check_data":
+			if self.dispatch_comb is not None:
+				self.write_data(printer, self.dispatch_comb.check)
+		elif name == "dispatch_value_data":
+			if self.dispatch_comb is not None:
+				self.write_data(printer, self.dispatch_comb.values)
 		elif name == "table_data":
 			for chunk in chunked(self.table_data, 16):
 				printer.write(','.join(map(str, chunk)))
@@ -277,7 +309,29 @@ class CodegenLH:
 		elif name == "parser_source":
 			printer.include(self.grammar.parser_source.loc, self.grammar.parser_source.contents)
 		elif name == "sync_dispatch_data":
-			self.write_sync_dispatch_data(printer)
+			if self.dispatch == DispatchDense:
+				self.write_sync_dispatch_data(printer)
+		elif name == "sync_dispatch_check_type":
+			if self.sync_dispatch_comb is not None:
+				printer.write(self.sync_dispatch_comb.check_type())
+		elif name == "sync_dispatch_base_type":
+			if self.sync_dispatch_comb is not None:
+				printer.write(self.sync_dispatch_comb.base_type())
+		elif name == "sync_dispatch_class_data":
+			if self.sync_dispatch_comb is not None:
+				self.write_data(printer, self.sync_dispatch_comb.classes)
+		elif name == "sync_dispatch_default_data":
+			if self.sync_dispatch_comb is not None:
+				self.write_data(printer, self.sync_dispatch_comb.defaults)
+		elif name == "sync_dispatch_base_data":
+			if self.sync_dispatch_comb is not None:
+				self.write_data(printer, self.sync_dispatch_comb.base)
+		elif name == "sync_dispatch_check_data":
+			if self.sync_dispatch_comb is not None:
+				self.write_data(printer, self.sync_dispatch_comb.check)
+		elif name == "sync_dispatch_value_data":
+			if self.sync_dispatch_comb is not None:
+				self.write_data(printer, self.sync_dispatch_comb.values)
 		elif name == "sync_base_data":
 			self.write_sync_base_data(printer)
 		elif name == "sync_entries_data":
@@ -331,6 +385,36 @@ class CodegenLH:
 					self.print_action(printer, action)
 			printer.writeln("break; }")
 
+	def write_data(self, printer: CodePrinter, data: List[int]) -> None:
+		for chunk in chunked(data, 32):
+			printer.write(','.join(map(str, chunk)))
+			printer.writeln(',')
+
+	def get_dispatch_offset(self, row: TableRow, t: Optional[SymbolTerminal]) -> int:
+		if t is None:
+			return NoDispatch
+		if t in row.state.transitions:
+			return row.transition_map[row.state.transitions[t]]
+		if row.state.etransition is not None:
+			return row.transition_map[row.state.etransition]
+		return NoDispatch
+
+	def get_sync_dispatch_offset(self, row: SyncRow, term: Optional[SymbolTerminal]) -> int:
+		if term in row.term_dispatch:
+			return row.entries[row.term_dispatch[term]]
+		return NoDispatch
+
+	def write_dispatch_data(self, printer: CodePrinter) -> None:
+		for row in self.states:
+			printer.write('{')
+			printer.write(','.join(map(lambda t: str(self.get_dispatch_offset(row, t)), self.all_terminals)))
+			printer.writeln('},')
+
+		printer.write('{')
+		for i in range(len(self.all_terminals)):
+			printer.write('255,')
+		printer.writeln('},')
+
 	def write_sync_actions_data(self, printer: CodePrinter) -> None:
 		for items in chunked(self.sync_table.sync_actions, 16):
 			printer.write(','.join(map(str, items)))
@@ -353,22 +437,43 @@ class CodegenLH:
 			printer.writeln(',')
 
 	def write_sync_dispatch_data(self, printer: CodePrinter) -> None:
-		def get_offset_of(row: SyncRow, term: SymbolTerminal) -> int:
-			if term in row.term_dispatch:
-				return row.entries[row.term_dispatch[term]]
-			return 0xff
-
 		for term in self.all_terminals:
 			printer.write('{')
 			for row in self.sync_table.sync_rows:
-				printer.write(str(get_offset_of(row, term)))
+				printer.write(str(self.get_sync_dispatch_offset(row, term)))
 				printer.write(',')
 			printer.writeln('},')
 
+	def build_dispatch_comb(self) -> None:
+		comb = CombTable(self.terminal_table_size)
+		for row in self.states:
+			comb.add_dense_row([self.get_dispatch_offset(row, t) for t in self.all_terminals])
+		# sentinel state past the last one
+		comb.add_row(NoDispatch, dict())
+		comb.pack()
+		self.dispatch_comb = comb
+
+		sync_comb = CombTable(self.terminal_table_size)
+		for sync_row in self.sync_table.sync_rows:
+			sync_comb.add_dense_row([self.get_sync_dispatch_offset(sync_row, t) for t in self.all_terminals])
+		sync_comb.pack()
+		self.sync_dispatch_comb = sync_comb
+
 	def compute(self) -> None:
 		self.collect_data()
 		self.build_tables()
 		self.build_recovery()
+		if self.dispatch == DispatchComb:
+			self.build_dispatch_comb()
+
+	def table_size(self) -> int:
+		# bytes of the arrays the core parser reads, the recovery tables are not counted
+		if self.dispatch_comb is not None:
+			dispatch = self.dispatch_comb.byte_size()
+		else:
+			dispatch = (len(self.states) + 1) * self.terminal_table_size
+		# data_base holds size_t, a table_entry is 12 bytes
+		return dispatch + 8 * len(self.states) + 2 * len(self.table_data) + 12 * len(self.entry_data)
 
 	def collect_data(self) -> None:
 		for terminal in self.grammar.terminals:
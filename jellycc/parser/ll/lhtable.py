@@ -2,6 +2,7 @@ from typing import Tuple, Iterable, Union, Dict, List, Set, Optional
 
 from jellycc.parser.grammar import ParserGrammar, Action, SymbolTerminal, SymbolNonTerminal
 from jellycc.parser.ll.builder import LLBuilder, LLState
+from jellycc.utils.profile import profiled, profiler
 
 
 class ShiftType:
@@ -36,7 +37,7 @@ class LHState:
 		list.append(self)
 		self.transitions: Dict[SymbolTerminal, Transition] = dict()
 		self.etransition: Optional[Transition] = None
-		self.target_states: Set[LHState] = set()
+		self.target_states: List[LHState] = []
 		self.sync_skip: Optional[Tuple[int, Tuple[SkipNode, ...]]] = None
 		self.sync: Dict[SymbolTerminal, Tuple[int, Tuple[SkipNode, ...], Tuple[LHState, ...]]] = dict()
 
@@ -69,10 +70,12 @@ class LHTableBuilder:
 
 	def build(self) -> LHTable:
 		ll_builder = LLBuilder(self.grammar)
-		ll_builder.build()
+		with profiler.stage("ll"):
+			ll_builder.build()
 
-		for nt, ll_state in ll_builder.entries.items():
-			self.entries[nt] = self.convert_state(ll_state)
+		with profiler.stage("convert_states"):
+			for nt, ll_state in ll_builder.entries.items():
+				self.entries[nt] = self.convert_state(ll_state)
 
 		self.optimize_states()
 		self.split_long_states()
@@ -119,7 +122,8 @@ class LHTableBuilder:
 		self.state_map[ll] = lh
 		for production in ll.productions:
 			action_collection: List[MegaActionNode] = []
-			terminals: Set[SymbolTerminal] = set()
+			# a mask keeps the transitions in terminal order
+			terminals: int = 0
 			targets: List[LHState] = []
 			shift: bool = False
 			items = production.items
@@ -130,7 +134,7 @@ class LHTableBuilder:
 				if isinstance(item, Action):
 					action_collection.append(item)
 				elif isinstance(item, SymbolTerminal):
-					terminals.add(item)
+					terminals |= item.bit
 					action_collection.append(Shift)
 					idx += 1
 					while idx < n and isinstance(items[idx], Action):
@@ -139,7 +143,7 @@ class LHTableBuilder:
 					shift = True
 					break
 				elif isinstance(item, LLState):
-					terminals.update(item.first)
+					terminals |= item.first
 					break
 				idx += 1
 			while idx < n:
@@ -152,10 +156,10 @@ class LHTableBuilder:
 					targets.append(self.convert_state(item))
 				idx += 1
 			transition = (shift, self.get_megaaction(action_collection), tuple(targets))
-			if len(terminals) == 0:
+			if terminals == 0:
 				lh.etransition = transition
 			else:
-				for terminal in terminals:
+				for terminal in self.grammar.terminal_set(terminals):
 					lh.transitions[terminal] = transition
 		return lh
 
@@ -183,12 +187,14 @@ class LHTableBuilder:
 			return transition
 		return self.create_long_transition(shift, actions, states)
 
+	@profiled("split_long_states")
 	def split_long_states(self) -> None:
 		for state in self.states:
 			for term, trans in state.transitions.items():
 				state.transitions[term] = self.split_long_transition(trans)
 			state.etransition = self.split_long_transition(state.etransition)
 
+	@profiled("inline_states")
 	def inline_states(self) -> None:
 		for state in self.states:
 			for term, (shift, action, targets) in state.transitions.items():
@@ -208,6 +214,7 @@ class LHTableBuilder:
 							break
 					state.transitions[term] = (shift, self.get_megaaction(actions), tuple(reversed(stack)))
 
+	@profiled("filter_states")
 	def filter_states(self) -> None:
 		new_list: List[LHState] = []
 		visited: Set[LHState] = set()
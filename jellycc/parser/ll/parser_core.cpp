@@ -1,9 +1,24 @@
 #include <cstdint>
 #include <cstddef>
 #include <cstring>
+#include <climits>
 #include <bitset>
 #include <algorithm>
 
+#if defined(_MSC_VER)
+#define JELLYCC_NOINLINE __declspec(noinline)
+#else
+#define JELLYCC_NOINLINE __attribute__((noinline))
+#endif
+
+// hooks around the parser stages (core, vm, recovery) for benchmarks, compiled out unless defined
+#ifndef JELLYCC_STAGE_ENTER
+#define JELLYCC_STAGE_ENTER(stage)
+#endif
+#ifndef JELLYCC_STAGE_LEAVE
+#define JELLYCC_STAGE_LEAVE(stage)
+#endif
+
 ${include:parser.shared.inc}
 
 ${parser_source}
@@ -137,7 +152,7 @@ ParserState* parser_create(AllocatorCallback cb, ParserConfig cfg) {
 	return state;
 }
 
-#define JELLYCC_CHECKED(expr) if (ParseResult _result = (expr); _result != ParseResult::OK) { return _result; } else
+#define JELLYCC_CHECKED(expr) do { ParseResult _result = (expr); if (_result != ParseResult::OK) { return _result; } } while (0)
 
 ParseResult parser_initialize(ParserState* parser) {
 	JELLYCC_CHECKED(parser_reallocate_stack(parser, parser->config.stack_initial));
@@ -247,14 +262,20 @@ ParseResult parser_run(ParserState* parser, NonTerminal nt, const uint16_t* inpu
 		if (parser->stack >= parser->stack_limit) {
 			JELLYCC_CHECKED(parser_grow_stack(parser));
 		}
-		if (run_core(parser)) {
+		JELLYCC_STAGE_ENTER(core);
+		bool stopped = run_core(parser);
+		JELLYCC_STAGE_LEAVE(core);
+		if (stopped) {
 			if (*parser->stack == ${sentinel_state} && parser->input == parser->input_end) {
 				// accept
 				JELLYCC_CHECKED(parser_drain(parser));
 				break;
 			} else {
 				// recovery
-				JELLYCC_CHECKED(parser_recovery(parser));
+				JELLYCC_STAGE_ENTER(recovery);
+				ParseResult result = parser_recovery(parser);
+				JELLYCC_STAGE_LEAVE(recovery);
+				JELLYCC_CHECKED(result);
 			}
 		}
 	}
@@ -262,11 +283,10 @@ ParseResult parser_run(ParserState* parser, NonTerminal nt, const uint16_t* inpu
 	return ParseResult::OK;
 }
 
-__declspec(noinline)
+JELLYCC_NOINLINE
 static bool run_core(ParserState* parser) {
 	uint16_t* __restrict stack = parser->stack;
 	const uint16_t* __restrict input = parser->input;
-	const uint16_t* input_end = parser->input_end;
 	uint16_t* __restrict output = parser->output;
 	uint16_t* __restrict rewind = parser->rewind;
 	uint16_t* rewind_end = parser->rewind_end;
@@ -279,7 +299,7 @@ static bool run_core(ParserState* parser) {
 
 		uint16_t state = *stack;
 		uint16_t tok = *input;
-		uint8_t dispatch = data_dispatch[state][tok];
+		uint8_t dispatch = dispatch_lookup(state, tok);
 		if (dispatch == 0xff) {
 			goto exit_success;
 		}
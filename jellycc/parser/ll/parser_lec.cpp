@@ -11,7 +11,7 @@ static bool parse_lec_parse_single_loop(ParserState* parser, uint16_t tok, bool*
 		}
 
 		uint16_t state = *stack;
-		uint8_t dispatch = data_dispatch[state][tok];
+		uint8_t dispatch = dispatch_lookup(state, tok);
 		if (dispatch == 0xff) {
 			goto exit_success;
 		}
@@ -105,6 +105,8 @@ static ParseResult parser_lec_apply_one(
 		JELLYCC_CHECKED(parser_greedy_consume(parser));
 		parser->input = old_input;
 	} break;
+	case correction_kind::none: {
+	} break;
 	}
 	return parser_drain(parser);
 }
@@ -14,7 +14,7 @@ static ParseResult parser_sync_discard_state(ParserState* parser, uint16_t state
 }
 
 static ParseResult parser_sync_resync_state(ParserState* parser, uint16_t state, uint16_t token)  {
-	uint8_t dispatch = data_sync_dispatch[token][state];
+	uint8_t dispatch = sync_dispatch_lookup(state, token);
 	size_t locus = data_sync_base[state] + dispatch;
 	sync_entry entry = data_sync_entries[locus];
 	const uint16_t* actions = &data_sync_actions[entry.actions];
@@ -33,7 +33,6 @@ static ParseResult parser_panic_resync(ParserState* parser) {
 	const uint16_t* input = parser->input;
 	const uint16_t* input_end = parser->input_end;
 	uint16_t* stack = parser->stack;
-	uint16_t* stack_begin = parser->stack_begin;
 
 	std::bitset<${token_count}> visited_tokens;
 	std::bitset<${state_count}> visited_states;
@@ -66,7 +65,7 @@ static ParseResult parser_panic_resync(ParserState* parser) {
 				continue;
 			}
 			visited_states.set(state);
-			uint8_t dispatch = data_sync_dispatch[tok][state];
+			uint8_t dispatch = sync_dispatch_lookup(state, tok);
 			if (dispatch == 0xff) {
 				continue;
 			}
@@ -143,7 +142,7 @@ static bool parser_run_to_end(ParserState* parser) {
 
 		uint16_t state = *stack;
 		uint16_t tok = *input;
-		uint8_t dispatch = data_dispatch[state][tok];
+		uint8_t dispatch = dispatch_lookup(state, tok);
 		if (dispatch == 0xff) {
 			goto exit_success;
 		}
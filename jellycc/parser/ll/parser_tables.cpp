@@ -10,10 +10,46 @@ static const size_t data_base[] = {
 	${base_data}
 };
 
+#define JELLYCC_COMB_DISPATCH ${dispatch_comb}
+
+#if JELLYCC_COMB_DISPATCH
+// row-displacement packed dispatch: states with equal rows share a row class, a slot belongs
+// to the class stored in its check entry, other tokens take the most common offset of the class
+static const ${dispatch_check_type} data_dispatch_class[] = {
+	${dispatch_class_data}
+};
+
+static const uint8_t data_dispatch_default[] = {
+	${dispatch_default_data}
+};
+
+static const ${dispatch_base_type} data_dispatch_base[] = {
+	${dispatch_base_data}
+};
+
+static const ${dispatch_check_type} data_dispatch_check[] = {
+	${dispatch_check_data}
+};
+
+static const uint8_t data_dispatch_value[] = {
+	${dispatch_value_data}
+};
+
+static inline uint8_t dispatch_lookup(uint16_t state, uint16_t tok) {
+	uint16_t cls = data_dispatch_class[state];
+	size_t idx = data_dispatch_base[cls] + tok;
+	return data_dispatch_check[idx] == cls ? data_dispatch_value[idx] : data_dispatch_default[cls];
+}
+#else
 static const uint8_t data_dispatch[][${token_count}] = {
 	${dispatch_data}
 };
 
+static inline uint8_t dispatch_lookup(uint16_t state, uint16_t tok) {
+	return data_dispatch[state][tok];
+}
+#endif
+
 static const uint16_t data_table[] = {
 	${table_data}
 };
@@ -24,10 +60,42 @@ static const table_entry data_entries[] = {
 
 
 
+#if JELLYCC_COMB_DISPATCH
+static const ${sync_dispatch_check_type} data_sync_dispatch_class[] = {
+	${sync_dispatch_class_data}
+};
+
+static const uint8_t data_sync_dispatch_default[] = {
+	${sync_dispatch_default_data}
+};
+
+static const ${sync_dispatch_base_type} data_sync_dispatch_base[] = {
+	${sync_dispatch_base_data}
+};
+
+static const ${sync_dispatch_check_type} data_sync_dispatch_check[] = {
+	${sync_dispatch_check_data}
+};
+
+static const uint8_t data_sync_dispatch_value[] = {
+	${sync_dispatch_value_data}
+};
+
+static inline uint8_t sync_dispatch_lookup(uint16_t state, uint16_t tok) {
+	uint16_t cls = data_sync_dispatch_class[state];
+	size_t idx = data_sync_dispatch_base[cls] + tok;
+	return data_sync_dispatch_check[idx] == cls ? data_sync_dispatch_value[idx] : data_sync_dispatch_default[cls];
+}
+#else
 static const uint8_t data_sync_dispatch[][${state_count}] = {
 	${sync_dispatch_data}
 };
 
+static inline uint8_t sync_dispatch_lookup(uint16_t state, uint16_t tok) {
+	return data_sync_dispatch[tok][state];
+}
+#endif
+
 static const size_t data_sync_base[] = {
 	${sync_base_data}
 };
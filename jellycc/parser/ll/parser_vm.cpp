@@ -9,7 +9,10 @@ static ParseResult parser_vm_dispatch(ParserState* parser, uint16_t* actions);
 
 static ParseResult parser_run_vm(ParserState* parser, uint16_t* output, uint16_t* output_end) {
 	*output_end = ${vm_action_sentinel};
-	return parser_vm_dispatch(parser, output);
+	JELLYCC_STAGE_ENTER(vm);
+	ParseResult result = parser_vm_dispatch(parser, output);
+	JELLYCC_STAGE_LEAVE(vm);
+	return result;
 }
 
 static ParseResult parser_vm_dispatch(ParserState* parser, uint16_t* actions) {
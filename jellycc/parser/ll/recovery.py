@@ -19,13 +19,16 @@ class LHRecovery:
 		self.compute_skip_costs()
 
 	def fill_edges(self) -> None:
+		# edges in transition order, the order states are visited in decides between equal skip costs
 		for state in self.table.states:
 			if state.etransition:
 				for target in state.etransition[2]:
-					state.target_states.add(target)
+					if target not in state.target_states:
+						state.target_states.append(target)
 			for _, _, targets in state.transitions.values():
 				for target in targets:
-					state.target_states.add(target)
+					if target not in state.target_states:
+						state.target_states.append(target)
 
 	def compute_skip_costs(self) -> None:
 		for scc in topological_sort(self.table.states, state_to_edges):
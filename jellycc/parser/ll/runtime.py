@@ -0,0 +1,272 @@
+import json
+from array import array
+from typing import List, Dict, Tuple, Iterable, Union, Optional, Any
+
+from jellycc.parser.ll.codegen import CodegenLH, DispatchDense, DispatchComb, DispatchLayouts, NoDispatch
+
+
+TokenInput = Union[Iterable[int], bytes, bytearray, memoryview, 'array[int]']
+
+TablesVersion = 1
+
+
+class ParseError(Exception):
+	def __init__(self, pos: int, token: int, state: int, expected: List[int]) -> None:
+		super().__init__(f"unexpected token {token} at {pos} in state {state}, expected one of {expected}")
+		self.pos: int = pos
+		self.token: int = token
+		self.state: int = state
+		self.expected: List[int] = expected
+
+
+class ParserTables:
+	# the tables of the generated LH parser core, in the same layout as parser_tables.cpp:
+	#   entry = table[base[state] + dispatch(state, token)]
+	# an entry shifts 0 or 1 tokens, emits one megaaction and replaces the top state with up to 4 states
+	def __init__(self, num_states: int, token_count: int, dispatch: str) -> None:
+		self.num_states: int = num_states
+		self.token_count: int = token_count
+		self.dispatch: str = dispatch
+		self.eof: int = 0
+		self.skippable: 'array[int]' = array('B')
+		self.entries: Dict[str, int] = dict()
+		self.megaactions: List[str] = []
+		# dense dispatch, (num_states + 1) rows of token_count offsets, the last row is the sentinel state
+		self.dispatch_data: 'array[int]' = array('B')
+		# comb dispatch, see CombTable
+		self.dispatch_class: 'array[int]' = array('H')
+		self.dispatch_default: 'array[int]' = array('B')
+		self.dispatch_base: 'array[int]' = array('L')
+		self.dispatch_check: 'array[int]' = array('H')
+		self.dispatch_value: 'array[int]' = array('B')
+		self.base: 'array[int]' = array('L')
+		self.table: 'array[int]' = array('H')
+		self.entry_shift: 'array[int]' = array('B')
+		self.entry_action: 'array[int]' = array('H')
+		# states replacing the top of the stack, entry_states[entry_offsets[i]:entry_offsets[i + 1]], top last
+		self.entry_offsets: 'array[int]' = array('L')
+		self.entry_states: 'array[int]' = array('H')
+
+	@property
+	def sentinel(self) -> int:
+		return self.num_states
+
+	@staticmethod
+	def from_codegen(codegen: CodegenLH) -> 'ParserTables':
+		grammar = codegen.grammar
+		tables = ParserTables(len(codegen.states), codegen.terminal_table_size, codegen.dispatch)
+		term_eof = grammar.shared.term_eof
+		assert term_eof is not None and term_eof.value is not None
+		tables.eof = term_eof.value
+		tables.skippable = array('B', (1 if t is not None and t.terminal.skip else 0 for t in codegen.all_terminals))
+		for name, nt in grammar.exports.items():
+			tables.entries[name] = codegen.table.entries[nt].order
+		tables.megaactions = [str(megaaction) for megaaction in codegen.shared_data.megaactions]
+
+		if codegen.dispatch == DispatchComb:
+			comb = codegen.dispatch_comb
+			assert comb is not None
+			tables.dispatch_class = array('H', comb.classes)
+			tables.dispatch_default = array('B', comb.defaults)
+			tables.dispatch_base = array('L', comb.base)
+			tables.dispatch_check = array('H', comb.check)
+			tables.dispatch_value = array('B', comb.values)
+		else:
+			for row in codegen.states:
+				tables.dispatch_data.extend(codegen.get_dispatch_offset(row, t) for t in codegen.all_terminals)
+			tables.dispatch_data.extend([NoDispatch] * codegen.terminal_table_size)
+
+		tables.base = array('L', (row.base_offset for row in codegen.states))
+		tables.table = array('H', codegen.table_data)
+		tables.entry_offsets.append(0)
+		for shift, megaaction, states in codegen.entry_data:
+			tables.entry_shift.append(1 if shift else 0)
+			tables.entry_action.append(codegen.shared_data.action_to_index[megaaction])
+			tables.entry_states.extend(state.order for state in reversed(states))
+			tables.entry_offsets.append(len(tables.entry_states))
+		return tables
+
+	def to_json(self) -> Dict[str, Any]:
+		data: Dict[str, Any] = {
+			"version": TablesVersion,
+			"num_states": self.num_states,
+			"token_count": self.token_count,
+			"dispatch": self.dispatch,
+			"eof": self.eof,
+			"skippable": self.skippable.tolist(),
+			"entries": self.entries,
+			"megaactions": self.megaactions,
+			"base": self.base.tolist(),
+			"table": self.table.tolist(),
+			"entry_shift": self.entry_shift.tolist(),
+			"entry_action": self.entry_action.tolist(),
+			"entry_offsets": self.entry_offsets.tolist(),
+			"entry_states": self.entry_states.tolist()
+		}
+		if self.dispatch == DispatchComb:
+			data["dispatch_class"] = self.dispatch_class.tolist()
+			data["dispatch_default"] = self.dispatch_default.tolist()
+			data["dispatch_base"] = self.dispatch_base.tolist()
+			data["dispatch_check"] = self.dispatch_check.tolist()
+			data["dispatch_value"] = self.dispatch_value.tolist()
+		else:
+			data["dispatch_data"] = self.dispatch_data.tolist()
+		return data
+
+	@staticmethod
+	def from_json(data: Dict[str, Any]) -> 'ParserTables':
+		if data.get("version") != TablesVersion:
+			raise ValueError(f"unsupported parser tables version {data.get('version')}")
+		if data["dispatch"] not in DispatchLayouts:
+			raise ValueError(f"unknown dispatch layout '{data['dispatch']}'")
+		tables = ParserTables(data["num_states"], data["token_count"], data["dispatch"])
+		tables.eof = data["eof"]
+		tables.skippable = array('B', data["skippable"])
+		tables.entries = data["entries"]
+		tables.megaactions = data["megaactions"]
+		if tables.dispatch == DispatchComb:
+			tables.dispatch_class = array('H', data["dispatch_class"])
+			tables.dispatch_default = array('B', data["dispatch_default"])
+			tables.dispatch_base = array('L', data["dispatch_base"])
+			tables.dispatch_check = array('H', data["dispatch_check"])
+			tables.dispatch_value = array('B', data["dispatch_value"])
+		else:
+			tables.dispatch_data = array('B', data["dispatch_data"])
+		tables.base = array('L', data["base"])
+		tables.table = array('H', data["table"])
+		tables.entry_shift = array('B', data["entry_shift"])
+		tables.entry_action = array('H', data["entry_action"])
+		tables.entry_offsets = array('L', data["entry_offsets"])
+		tables.entry_states = array('H', data["entry_states"])
+		return tables
+
+	def save(self, path: str) -> None:
+		with open(path, 'w') as fp:
+			json.dump(self.to_json(), fp)
+
+	@staticmethod
+	def load(path: str) -> 'ParserTables':
+		with open(path, 'r') as fp:
+			return ParserTables.from_json(json.load(fp))
+
+	def get_dispatch(self, state: int, token: int) -> int:
+		if self.dispatch == DispatchComb:
+			cls = self.dispatch_class[state]
+			idx = self.dispatch_base[cls] + token
+			if self.dispatch_check[idx] == cls:
+				return int(self.dispatch_value[idx])
+			return int(self.dispatch_default[cls])
+		return int(self.dispatch_data[state * self.token_count + token])
+
+
+def token_array(tokens: TokenInput) -> 'array[int]':
+	# buffers are read as native 16-bit token values, anything else is iterated
+	if isinstance(tokens, array) and tokens.typecode == 'H':
+		return tokens
+	try:
+		view = memoryview(tokens)  # type: ignore
+	except TypeError:
+		return array('H', tokens)
+	return array('H', view.cast('B').cast('H'))
+
+
+class Parser:
+	# runs the LH parser core over a token stream, producing the megaaction ids the C++ core hands to the vm;
+	# there is no error recovery, the first token the tables have no transition for raises ParseError
+	def __init__(self, tables: ParserTables) -> None:
+		self.tables: ParserTables = tables
+		# entries flattened once: shift, megaaction and the states pushed after popping the top
+		self.entry_list: List[Tuple[int, int, Tuple[int, ...]]] = []
+		offsets = tables.entry_offsets
+		for idx in range(len(tables.entry_shift)):
+			self.entry_list.append((
+				tables.entry_shift[idx],
+				tables.entry_action[idx],
+				tuple(tables.entry_states[offsets[idx]:offsets[idx + 1]])
+			))
+		# per state dispatch straight to entries, NoDispatch maps to None
+		self.rows: List[List[Optional[Tuple[int, int, Tuple[int, ...]]]]] = []
+		for state in range(tables.num_states + 1):
+			row: List[Optional[Tuple[int, int, Tuple[int, ...]]]] = []
+			base = tables.base[state] if state < tables.num_states else 0
+			for token in range(tables.token_count):
+				dispatch = tables.get_dispatch(state, token)
+				row.append(None if dispatch == NoDispatch else self.entry_list[tables.table[base + dispatch]])
+			self.rows.append(row)
+
+	def filter_tokens(self, tokens: TokenInput) -> 'array[int]':
+		# drops skippable tokens and terminates the stream with eof, as the driver of the C++ parser does
+		skippable = self.tables.skippable
+		result = array('H', (token for token in token_array(tokens) if not skippable[token]))
+		result.append(self.tables.eof)
+		return result
+
+	def parse(self, tokens: TokenInput, entry: Optional[str] = None, skip: bool = True) -> 'array[int]':
+		# with skip the stream is raw lexer output, otherwise it must already be filtered and end with eof
+		if entry is None:
+			entry = next(iter(self.tables.entries))
+		input = self.filter_tokens(tokens) if skip else token_array(tokens)
+		if len(input) == 0 or input[-1] != self.tables.eof:
+			raise ValueError("token stream must end with eof")
+		if self.tables.dispatch == DispatchComb:
+			return self.run_tables(input, self.tables.entries[entry])
+		return self.run_rows(input, self.tables.entries[entry])
+
+	def run_rows(self, input: 'array[int]', state: int) -> 'array[int]':
+		# dispatch resolved to entries in advance, one list lookup per step
+		rows = self.rows
+		output = array('H')
+		emit = output.append
+		stack: List[int] = [self.tables.sentinel, state]
+		pop = stack.pop
+		push = stack.extend
+		pos = 0
+		token = input[0]
+		while True:
+			entry = rows[stack[-1]][token]
+			if entry is None:
+				break
+			shift, action, states = entry
+			pop()
+			push(states)
+			emit(action)
+			if shift:
+				pos += 1
+				token = input[pos]
+		self.finish(input, pos, stack)
+		return output
+
+	def run_tables(self, input: 'array[int]', state: int) -> 'array[int]':
+		# the same loop reading the flattened tables directly, for checking table layouts
+		tables = self.tables
+		get_dispatch = tables.get_dispatch
+		base = tables.base
+		table = tables.table
+		entries = self.entry_list
+		output = array('H')
+		stack: List[int] = [tables.sentinel, state]
+		pos = 0
+		while True:
+			state = stack[-1]
+			dispatch = get_dispatch(state, input[pos])
+			if dispatch == NoDispatch:
+				break
+			shift, action, states = entries[table[base[state] + dispatch]]
+			stack.pop()
+			stack.extend(states)
+			output.append(action)
+			pos += shift
+		self.finish(input, pos, stack)
+		return output
+
+	def finish(self, input: 'array[int]', pos: int, stack: List[int]) -> None:
+		if len(stack) == 1 and pos == len(input) - 1:
+			return
+		state = stack[-1]
+		token = input[pos]
+		expected = [t for t in range(self.tables.token_count) if self.rows[state][t] is not None]
+		raise ParseError(pos, token, state, expected)
+
+	def describe(self, output: Iterable[int]) -> List[str]:
+		# megaaction ids to their action lists, empty megaactions are left out
+		return [self.tables.megaactions[action] for action in output if self.tables.megaactions[action]]
@@ -1,265 +1,360 @@
-from typing import List, Dict, Set, Tuple, Optional
+from collections import Counter
+from typing import List, Dict, Optional
 
 from jellycc.codegen.codegen import CodePrinter, parse_template
-
+from jellycc.codegen.comb import CombTable, uint_size, uint_type
 
 import os
 
-from jellycc.parser.grammar import ParserGrammar, SymbolNonTerminal, Production, SymbolTerminal
+from jellycc.parser.grammar import ParserGrammar, SymbolNonTerminal, Production, SymbolTerminal, Action, Type, \
+	TypeVoid
+from jellycc.parser.ll.codegen import print_shift_action, print_semantic_action
 from jellycc.parser.lr.lalr import LRTable
-from jellycc.parser.lr.lr1 import LR1State, Shift, Reduce, AcceptType, Accept
+from jellycc.parser.lr.lr1 import LR1State, Shift, Reduce, AcceptType
+from jellycc.parser.lr.recovery import RecoveryBuilder
+from jellycc.utils.error import CCError
+from jellycc.utils.helpers import chunked
+
 
-AcceptBit = 1
+# action table value of tokens a state has no action for
+ActionError = 0
 
+# vm codes written by the core: every shift pushes the terminal, reductions of productions without an
+# action leave the value stack as it is and are not written at all. Recovery writes the codes past the
+# semantic actions: one to skip tokens, then one per value type to discard the value of a popped state.
+VMShift = 0
+VMNone = 1
 
-class Codegen:
-	def __init__(self, grammar: ParserGrammar, table: LRTable) -> None:
+
+class CodegenLR:
+	# action values: 0 is an error, 1..N shifts to that state, reduce_base + p reduces production p,
+	# accept_value accepts. States are numbered from 1, the stack holds state numbers.
+	def __init__(self, grammar: ParserGrammar, table: LRTable, recovery: RecoveryBuilder) -> None:
 		self.grammar: ParserGrammar = grammar
 		self.table: LRTable = table
+		self.recovery: RecoveryBuilder = recovery
 
-		self.states: Dict[int, LR1State] = dict()
 		self.state_idx: Dict[LR1State, int] = dict()
-
-		self.nts: Dict[int, SymbolNonTerminal] = dict()
 		self.nt_idx: Dict[SymbolNonTerminal, int] = dict()
-
-		self.productions: Dict[int, Production] = dict()
+		self.productions: List[Production] = []
 		self.prod_idx: Dict[Production, int] = dict()
 
-		self.dispatch: Dict[LR1State, List[int]] = dict()
-		self.payload: Dict[LR1State, List[int]] = dict()
-		self.dispatch_dict: Dict[LR1State, Dict[int, int]] = dict()
-
-		self.goto: Dict[LR1State, List[int]] = dict()
+		self.terminal_table_size: int = 0
+		self.all_terminals: List[Optional[SymbolTerminal]] = []
 
-		self.resolve: List[int] = []
+		self.reduce_base: int = 0
+		self.accept_value: int = 0
+		self.vm_skip: int = 0
+		self.vm_sentinel: int = 0
 
-		self.token_count: int = 0
-		self.shift_count: int = 0
-		self.dispatch_count: int = 0
+		# filled by compute, empty until then
+		self.action_comb: CombTable = CombTable(0)
+		self.goto_comb: CombTable = CombTable(0)
+		self.prod_length: List[int] = []
+		self.prod_nt: List[int] = []
+		self.prod_vm: List[int] = []
+		self.sync_comb: CombTable = CombTable(0)
+		self.state_discard: List[int] = []
+		self.discard_types: Dict[str, int] = dict()
 
 	def run(self) -> None:
 		self.compute()
+		self.write()
 
+	def write(self) -> None:
 		module_dir = os.path.dirname(os.path.abspath(__file__))
 
 		header_path = self.grammar.core_header_path
 		if header_path is not None:
 			with open(header_path, 'w') as fp:
-				parse_template(os.path.join(module_dir, "parser_core.h")).run(header_path, fp, self.subst)
+				parse_template(os.path.join(module_dir, "parser_core.h")).run(
+					self.grammar.shared.base_dir,
+					header_path,
+					fp,
+					self.subst
+				)
 
 		source_path = self.grammar.core_source_path
 		if source_path is not None:
 			with open(source_path, 'w') as fp:
-				parse_template(os.path.join(module_dir, "parser_core.cpp")).run(source_path, fp, self.subst)
+				parse_template(os.path.join(module_dir, "parser_core.cpp")).run(
+					self.grammar.shared.base_dir,
+					source_path,
+					fp,
+					self.subst
+				)
 
 	def subst(self, printer: CodePrinter, name: str) -> None:
 		if name == "parser_prefix":
 			printer.write(self.grammar.prefix)
+		elif name == "parser_namespace":
+			printer.write(self.grammar.ns)
 		elif name == "token_count":
-			printer.write(f"{self.token_count}")
-		elif name == "goto_count":
-			printer.write(f"{1 + self.shift_count + len(self.nts)}")
-		elif name == "dispatch_count":
-			printer.write(f"{self.dispatch_count}")
-		elif name == "table_resolve":
-			for val in self.resolve:
-				printer.write(f"{val}u, ")
-		elif name == "export_symbols":
-			for nt, state in self.table.entries.items():
-				printer.writeln(f"{nt.name} = {self.state_idx[state]},")
-		elif name == "count_shifts":
-			printer.write(f"{self.shift_count}")
-		elif name == "table_dispatch":
-			printer.write("{")
-			for i in range(self.token_count):
-				printer.write(f"255u, ")
-			printer.writeln("},")
-			for i in range(1, len(self.states) + 1):
-				state = self.states[i]
-				printer.write("{")
-				for j in self.dispatch[state]:
-					printer.write(f"{j}u, ")
-				printer.writeln("},")
-		elif name == "table_payload":
-			printer.writeln("{},")
-			for i in range(1, len(self.states) + 1):
-				state = self.states[i]
-				printer.write("{")
-				for j in self.payload[state]:
-					printer.write(f"{j}u, ")
-				printer.writeln("},")
-		elif name == "table_goto":
-			printer.writeln("{},")
-			for i in range(1, len(self.states) + 1):
-				state = self.states[i]
-				printer.write("{")
-				for j in self.goto[state]:
-					printer.write(f"{j}u, ")
-				printer.writeln("},")
-		elif name == "table_accepts":
-			printer.write("0,")
-			eof = self.grammar.eof
-			for i in range(1, len(self.states) + 1):
-				state = self.states[i]
-				if state.actions.get(eof, None) is Accept:
-					printer.write("1,")
-				else:
-					printer.write("0,")
+			printer.write(str(self.terminal_table_size))
+		elif name == "state_count":
+			printer.write(str(len(self.state_idx) + 1))
 		elif name == "token_eof":
-			printer.write(f"{self.grammar.eof.terminal.value}")
-		elif name == "debug_grammar":
-			with printer.indented('// '):
-				for idx in range(len(self.nts)):
-					printer.writeln(f"NT {idx}: {self.nts[idx].name}")
-				printer.writeln("")
-				for idx in range(len(self.productions)):
-					printer.writeln(f"PROD {idx}: {self.productions[idx].nt.name} -> {self.productions[idx]}")
-				printer.writeln("")
+			term_eof = self.grammar.shared.term_eof
+			assert term_eof is not None
+			printer.write(f"{term_eof.value}")
+		elif name == "token_skippable_data":
+			for chunk in chunked(self.all_terminals, 32):
+				printer.write(','.join(map((lambda t: '1' if t is not None and t.terminal.skip else '0'), chunk)))
+				printer.writeln(',')
+		elif name == "entry_states":
+			for export_name, nt in self.grammar.exports.items():
+				printer.writeln(f"{export_name} = {self.state_idx[self.table.entries[nt]]},")
+		elif name == "action_type":
+			printer.write(self.action_comb.value_type())
+		elif name == "reduce_base":
+			printer.write(str(self.reduce_base))
+		elif name == "accept_value":
+			printer.write(str(self.accept_value))
+		elif name == "action_check_type":
+			printer.write(self.action_comb.check_type())
+		elif name == "action_base_type":
+			printer.write(self.action_comb.base_type())
+		elif name == "action_class_data":
+			self.write_data(printer, self.action_comb.classes)
+		elif name == "action_default_data":
+			self.write_data(printer, self.action_comb.defaults)
+		elif name == "action_base_data":
+			self.write_data(printer, self.action_comb.base)
+		elif name == "action_check_data":
+			self.write_data(printer, self.action_comb.check)
+		elif name == "action_value_data":
+			self.write_data(printer, self.action_comb.values)
+		elif name == "goto_value_type":
+			printer.write(self.goto_comb.value_type())
+		elif name == "goto_check_type":
+			printer.write(self.goto_comb.check_type())
+		elif name == "goto_base_type":
+			printer.write(self.goto_comb.base_type())
+		elif name == "goto_class_data":
+			self.write_data(printer, self.goto_comb.classes)
+		elif name == "goto_default_data":
+			self.write_data(printer, self.goto_comb.defaults)
+		elif name == "goto_base_data":
+			self.write_data(printer, self.goto_comb.base)
+		elif name == "goto_check_data":
+			self.write_data(printer, self.goto_comb.check)
+		elif name == "goto_value_data":
+			self.write_data(printer, self.goto_comb.values)
+		elif name == "prod_length_type":
+			printer.write(uint_type(max(self.prod_length, default=0)))
+		elif name == "prod_length_data":
+			self.write_data(printer, self.prod_length)
+		elif name == "prod_nt_type":
+			printer.write(uint_type(max(self.prod_nt, default=0)))
+		elif name == "prod_nt_data":
+			self.write_data(printer, self.prod_nt)
+		elif name == "prod_vm_data":
+			self.write_data(printer, self.prod_vm)
+		elif name == "sync_value_type":
+			printer.write(self.sync_comb.value_type())
+		elif name == "sync_check_type":
+			printer.write(self.sync_comb.check_type())
+		elif name == "sync_base_type":
+			printer.write(self.sync_comb.base_type())
+		elif name == "sync_class_data":
+			self.write_data(printer, self.sync_comb.classes)
+		elif name == "sync_default_data":
+			self.write_data(printer, self.sync_comb.defaults)
+		elif name == "sync_base_data":
+			self.write_data(printer, self.sync_comb.base)
+		elif name == "sync_check_data":
+			self.write_data(printer, self.sync_comb.check)
+		elif name == "sync_value_data":
+			self.write_data(printer, self.sync_comb.values)
+		elif name == "state_discard_data":
+			self.write_data(printer, self.state_discard)
+		elif name == "vm_shift":
+			printer.write(str(VMShift))
+		elif name == "vm_none":
+			printer.write(str(VMNone))
+		elif name == "vm_skip":
+			printer.write(str(self.vm_skip))
+		elif name == "vm_action_skip":
+			printer.include(*self.grammar.vm_actions["sync_skip"][2])
+		elif name == "vm_extract_vm_args":
+			for _, arg_name, type in self.grammar.vm_args:
+				printer.writeln(f'{type}& {arg_name} = parser->vm_args.{arg_name};')
+		elif name == "vm_extra_params":
+			for _, arg_name, type in self.grammar.vm_args:
+				printer.write(f', {type} {arg_name}')
+		elif name == "vm_struct":
+			for _, arg_name, type in self.grammar.vm_args:
+				printer.writeln(f'{type} {arg_name};')
+		elif name == "vm_copy_params":
+			for _, arg_name, _ in self.grammar.vm_args:
+				printer.write(f'{arg_name},')
+		elif name == "vm_dispatch_switch":
+			self.write_dispatch(printer)
+		elif name == "vm_action_sentinel":
+			printer.write(str(self.vm_sentinel))
+		elif name == "parser_header":
+			parser_header = self.grammar.parser_header
+			assert parser_header is not None
+			printer.include(parser_header.loc, parser_header.contents)
+		elif name == "parser_source":
+			parser_source = self.grammar.parser_source
+			assert parser_source is not None
+			printer.include(parser_source.loc, parser_source.contents)
 		else:
 			raise RuntimeError(f"INTERNAL ERROR: unresolved substitution '{name}'")
 
-	def compute(self) -> None:
-		self._pre_visit()
-		self._build_tables()
-
-	def _pre_visit(self) -> None:
-		visited: Set[LR1State] = set()
-
-		def visit_nt(nt: SymbolNonTerminal) -> None:
-			if nt in self.nt_idx:
-				return
-			idx = len(self.nt_idx)
-			self.nt_idx[nt] = idx
-			self.nts[idx] = nt
-
-		def visit_prod(prod: Production) -> None:
-			if prod in self.prod_idx:
-				return
-			idx = len(self.prod_idx)
-			self.prod_idx[prod] = idx
-			self.productions[idx] = prod
-
-		max_unique_shifts: int = 0
-
-		def visit_state(state: LR1State) -> None:
-			if state in visited:
-				return
-
-			nonlocal max_unique_shifts
+	def write_data(self, printer: CodePrinter, data: List[int]) -> None:
+		for chunk in chunked(data, 32):
+			printer.write(','.join(map(str, chunk)))
+			printer.writeln(',')
+
+	def write_dispatch(self, printer: CodePrinter) -> None:
+		printer.writeln(f"case {VMShift}: {{")
+		with printer.indented():
+			print_shift_action(printer, self.grammar)
+		printer.writeln("break; }")
+		for action in self.grammar.actions:
+			printer.writeln(f"case {self.vm_code(action)}: {{")
+			with printer.indented():
+				print_semantic_action(printer, action)
+			printer.writeln("break; }")
+		for type_name, code in self.discard_types.items():
+			printer.writeln(f"case {code}: {{")
+			with printer.indented():
+				printer.writeln(f"data -= Aligned<{type_name}>;")
+			printer.writeln("break; }")
 
-			visited.add(state)
-
-			idx = len(self.state_idx) + 1
-			self.state_idx[state] = idx
-			self.states[idx] = state
-
-			shifts: Set[LR1State] = set()
-			for term, action in state.actions.items():
-				if isinstance(action, Shift):
-					visit_state(action.state)
-					shifts.add(action.state)
-				elif isinstance(action, Reduce):
-					visit_nt(action.nt)
-					visit_prod(action.prod)
-				elif isinstance(action, AcceptType):
-					pass
-				else:
-					raise RuntimeError("INTERNAL ERROR: invalid LR action")
-			max_unique_shifts = max(max_unique_shifts, len(shifts))
-			for nt, target_state in state.gotos.items():
-				visit_nt(nt)
-				visit_state(target_state)
-
-		for state in self.table.entries.values():
-			visit_state(state)
-
-		self.shift_count = max_unique_shifts
-
-	def _build_tables(self) -> None:
-		terminals: Dict[int, SymbolTerminal] = dict()
-
-		max_term: int = 0
+	def compute(self) -> None:
+		self.collect_data()
+		self.action_comb = self.build_actions()
+		self.goto_comb = self.build_gotos()
+		self.build_productions()
+		self.sync_comb = self.build_sync()
+		self.build_discards()
+
+	def collect_data(self) -> None:
+		value_to_terminal: Dict[int, SymbolTerminal] = dict()
 		for terminal in self.grammar.terminals:
-			value = terminal.terminal.value
-			assert value is not None
-			terminals[value] = terminal
-			max_term = max(value, max_term)
-
-		self.token_count = max_term + 1
-		skip_resolve_idx: int = 0
-
-		max_unique_actions: int = 0
-
-		for state, state_idx in self.state_idx.items():
-			token_to_act: List[Optional[Tuple[int, int]]] = [None] * self.token_count
-			for term in self.grammar.terminals:
-				value = term.terminal.value
-				if term.terminal.skip:
-					token_to_act[value] = (0, skip_resolve_idx)
-
-			target_states: Dict[LR1State, int] = dict()
-			target_states_inv: Dict[int, LR1State] = dict()
-
-			def get_unique_index(state: LR1State) -> int:
-				if state not in target_states:
-					idx = len(target_states) + 1
-					target_states[state] = idx
-					target_states_inv[idx] = state
-				return target_states[state]
-
-			dispatch: List[int] = [0xff] * self.token_count
-
+			value_to_terminal[self.terminal_value(terminal)] = terminal
+		self.terminal_table_size = max(value_to_terminal, default=0) + 1
+		for i in range(self.terminal_table_size):
+			self.all_terminals.append(value_to_terminal.get(i, None))
+
+		# state 0 is never entered, it only pads row 0 of the action table and column 0 of the goto table
+		for state in self.table.states:
+			self.state_idx[state] = len(self.state_idx) + 1
+		if len(self.state_idx) >= 0xffff:
+			raise CCError(None, f"lr parser has {len(self.state_idx)} states, at most 65534 fit the parser stack")
+		for nt in self.grammar.nonterminals:
+			self.nt_idx[nt] = len(self.nt_idx)
+			for prod in nt.prods:
+				self.prod_idx[prod] = len(self.productions)
+				self.productions.append(prod)
+
+		self.reduce_base = len(self.state_idx) + 1
+		self.accept_value = self.reduce_base + len(self.productions)
+		if "sync_skip" not in self.grammar.vm_actions:
+			raise CCError(None, "the lr backend skips tokens on syntax errors, the grammar has no 'sync_skip' vm action")
+		self.vm_skip = VMNone + 1 + len(self.grammar.actions)
+
+	def terminal_value(self, terminal: SymbolTerminal) -> int:
+		value = terminal.terminal.value
+		assert value is not None
+		return value
+
+	def vm_code(self, action: Action) -> int:
+		assert action.idx is not None
+		return VMNone + 1 + action.idx
+
+	def action_value(self, action: object) -> int:
+		if isinstance(action, Shift):
+			return self.state_idx[action.state]
+		if isinstance(action, Reduce):
+			return self.reduce_base + self.prod_idx[action.prod]
+		if isinstance(action, AcceptType):
+			return self.accept_value
+		raise RuntimeError("INTERNAL ERROR: invalid LR action")
+
+	def build_actions(self) -> CombTable:
+		comb = CombTable(self.terminal_table_size)
+		comb.add_row(ActionError, dict())
+		for state in self.table.states:
+			row: Dict[int, int] = dict()
 			for term, action in state.actions.items():
-				value = term.terminal.value
+				row[self.terminal_value(term)] = self.action_value(action)
+			# default reduction: the most common reduction of the state also replaces its error entries,
+			# an error is then found after the reductions, still before the bad token is shifted
+			reductions = Counter(
+				value for value in row.values() if self.reduce_base <= value < self.accept_value
+			)
+			default = reductions.most_common(1)[0][0] if reductions else ActionError
+			comb.add_row(default, {col: value for col, value in row.items() if value != default})
+		comb.pack()
+		return comb
+
+	def build_gotos(self) -> CombTable:
+		# one row per nonterminal indexed by the state under the reduced production; the lookup only
+		# happens for pairs that have a goto, so the most common target serves every other state
+		targets: Dict[SymbolNonTerminal, Dict[int, int]] = {nt: dict() for nt in self.nt_idx}
+		for state in self.table.states:
+			for nt, target in state.gotos.items():
+				targets[nt][self.state_idx[state]] = self.state_idx[target]
+		comb = CombTable(len(self.state_idx) + 1)
+		for nt in self.nt_idx:
+			row = targets[nt]
+			default = Counter(row.values()).most_common(1)[0][0] if row else 0
+			comb.add_row(default, {col: value for col, value in row.items() if value != default})
+		comb.pack()
+		return comb
+
+	def build_productions(self) -> None:
+		for prod in self.productions:
+			self.prod_length.append(len(prod.symbols))
+			self.prod_nt.append(self.nt_idx[prod.nt])
+			if prod.action is None:
+				self.prod_vm.append(VMNone)
+			else:
+				self.prod_vm.append(self.vm_code(prod.action))
+
+	def build_sync(self) -> CombTable:
+		# a state syncs on the terminals it has an action for; the action table cannot tell, its default
+		# reductions replace the error entries
+		comb = CombTable(self.terminal_table_size)
+		comb.add_row(0, dict())
+		for state in self.table.states:
+			comb.add_row(0, {self.terminal_value(term): 1 for term in self.recovery.lookaheads(state)})
+		comb.pack()
+		return comb
+
+	def build_discards(self) -> None:
+		# every state on the stack above the entry state holds one value of the symbol it is entered on
+		state_type: Dict[LR1State, Type] = dict()
+		for state in self.table.states:
+			for action in state.actions.values():
 				if isinstance(action, Shift):
-					token_to_act[value] = (0, get_unique_index(action.state))
-				elif isinstance(action, Reduce):
-					token_to_act[value] = (len(action.prod.symbols), 1 + self.shift_count + self.prod_idx[action.prod])
-
-			dispatch_dict: Dict[int, int] = dict()
-
-			def get_unique_dispatch(entry: Tuple[int, int]) -> int:
-				val = (entry[0] << 12) | entry[1]
-				if val not in dispatch_dict:
-					dispatch_dict[val] = len(dispatch_dict)
-				return dispatch_dict[val]
-
-			for idx, entry in enumerate(token_to_act):
-				if entry is not None:
-					dispatch[idx] = get_unique_dispatch(entry)
-				else:
-					dispatch[idx] = 0xff
-
-			goto: List[int] = [0xDE] * (1 + self.shift_count + len(self.nts))
-			# shifts
-			for target_state, idx in target_states.items():
-				goto[idx] = self.state_idx[target_state]
-			# skip
-			goto[skip_resolve_idx] = state_idx
-			# gotos
-			for nt, target_state in state.gotos.items():
-				idx = self.shift_count + 1 + self.nt_idx[nt]
-				if goto[idx] != 0xDE:
-					raise RuntimeError("INTERNAL ERROR: incosistent goto produced")
-				goto[idx] = self.state_idx[target_state]
-
-			self.dispatch[state] = dispatch
-			self.goto[state] = goto
-			self.dispatch_dict[state] = dispatch_dict
-			max_unique_actions = max(max_unique_actions, len(dispatch_dict))
-
-		self.dispatch_count = max_unique_actions
-
-		for state, state_idx in self.state_idx.items():
-			payload: List[int] = [0xDE] * self.dispatch_count
-			for val, idx in self.dispatch_dict[state].items():
-				payload[idx] = val
-			self.payload[state] = payload
-
-		self.resolve = [0xDE] * (1 + self.shift_count + len(self.productions))
-		for i in range(self.shift_count + 1):
-			self.resolve[i] = i
-		for idx, prod in self.productions.items():
-			self.resolve[self.shift_count + 1 + idx] = self.shift_count + 1 + self.nt_idx[prod.nt]
-
+					state_type[action.state] = self.grammar.terminal_type
+			for nt, target in state.gotos.items():
+				state_type[target] = nt.type
+		self.state_discard.append(VMNone)
+		for state in self.table.states:
+			type = state_type.get(state, None)
+			if type is None or isinstance(type.repr(), TypeVoid):
+				self.state_discard.append(VMNone)
+				continue
+			type_name = str(type.repr())
+			if type_name not in self.discard_types:
+				self.discard_types[type_name] = self.vm_skip + 1 + len(self.discard_types)
+			self.state_discard.append(self.discard_types[type_name])
+		self.vm_sentinel = self.vm_skip + 1 + len(self.discard_types)
+
+	def table_size(self) -> int:
+		# action, goto, production and recovery arrays as emitted in the generated source
+		return (
+			self.action_comb.byte_size() +
+			self.goto_comb.byte_size() +
+			uint_size(max(self.prod_length, default=0)) * len(self.prod_length) +
+			uint_size(max(self.prod_nt, default=0)) * len(self.prod_nt) +
+			2 * len(self.prod_vm) +
+			self.sync_comb.byte_size() +
+			2 * len(self.state_discard)
+		)
@@ -1,5 +1,5 @@
 from collections import defaultdict
-from typing import NamedTuple, Iterable, FrozenSet, Set, List, Optional, Dict, Tuple, TypeVar, Union, Any
+from typing import NamedTuple, Iterable, FrozenSet, Set, List, Optional, Dict, Tuple, TypeVar, Union, Any, cast
 from itertools import chain
 
 import sys
@@ -7,7 +7,9 @@ import sys
 from jellycc.parser.grammar import Production, SymbolNonTerminal, SymbolTerminal, Symbol, ParserGrammar
 from jellycc.parser.lr.lr1 import Reduce, AcceptType, LR1State, Shift, Accept
 from jellycc.project.grammar import Terminal
-from jellycc.utils.helpers import head
+from jellycc.utils.helpers import iter_bits
+from jellycc.utils.profile import profiled
+from jellycc.utils.scc import topological_sort
 from jellycc.utils.source import SrcLoc
 
 
@@ -47,12 +49,67 @@ class LR1Item(NamedTuple):
 	la: SymbolTerminal
 
 
+class ItemIndex:
+	# dense numbering of the LR(0) items of a grammar: the items of a production are consecutive,
+	# so item + 1 moves the dot over the next symbol
+	def __init__(self, grammar: ParserGrammar) -> None:
+		self.first_item: Dict[Production, int] = dict()
+		# per item: the symbol after the dot (None at the end), kernel flag and the item as LR0Item
+		self.next: List[Optional[Symbol]] = []
+		self.kernel: List[bool] = []
+		self.lr0: List[LR0Item] = []
+		self.closures: Dict[SymbolNonTerminal, Tuple[int, ...]] = dict()
+		for nt in grammar.nonterminals:
+			for prod in nt.prods:
+				self.first_item[prod] = len(self.next)
+				for offset in range(len(prod.symbols) + 1):
+					item = LR0Item(nt, prod, offset)
+					self.next.append(prod.symbols[offset] if offset < len(prod.symbols) else None)
+					self.kernel.append(item.is_kernel())
+					self.lr0.append(item)
+
+	def closure_of(self, nt: SymbolNonTerminal) -> Tuple[int, ...]:
+		# items X -> . alpha of every nonterminal X that nt derives at the left, nt included
+		items = self.closures.get(nt, None)
+		if items is None:
+			worklist: List[SymbolNonTerminal] = [nt]
+			seen: Set[SymbolNonTerminal] = {nt}
+			result: List[int] = []
+			i = 0
+			while i < len(worklist):
+				for prod in worklist[i].prods:
+					item = self.first_item[prod]
+					result.append(item)
+					next = self.next[item]
+					if isinstance(next, SymbolNonTerminal) and next not in seen:
+						seen.add(next)
+						worklist.append(next)
+				i += 1
+			items = tuple(result)
+			self.closures[nt] = items
+		return items
+
+	def closure(self, items: Iterable[int]) -> List[int]:
+		result: List[int] = list(items)
+		added: Set[int] = set(result)
+		seen: Set[SymbolNonTerminal] = set()
+		for item in result[:]:
+			next = self.next[item]
+			if isinstance(next, SymbolNonTerminal) and next not in seen:
+				seen.add(next)
+				for closure_item in self.closure_of(next):
+					if closure_item not in added:
+						added.add(closure_item)
+						result.append(closure_item)
+		return result
+
+
 class LR0Set:
 	__slots__ = (
 		'idx', 'kernel', 'nonkernel', 'goto',
 		'lookahead', 'propagates', 'action_list',
 		'goto_list', 'shift', 'actions', 'witness',
-		'gen'
+		'gen', 'items'
 	)
 
 	def __init__(self, idx: int, kernel: FrozenSet[LR0Item], nonkernel: FrozenSet[LR0Item]):
@@ -63,8 +120,11 @@ class LR0Set:
 		self.lookahead: Dict[LR0Item, Set[SymbolTerminal]] = defaultdict(lambda: set())
 		self.propagates: Dict[LR0Item, Set[Tuple[LR0Set, LR0Item]]] = defaultdict(lambda: set())
 		self.shift = LRActionShift(self)
-		self.actions: Dict[SymbolTerminal, Set[LRAction]] = dict()
+		# actions in the order they were found, the first one wins a conflict
+		self.actions: Dict[SymbolTerminal, List[LRAction]] = dict()
 		self.gen: LR1State = LR1State()
+		# kernel and nonkernel items in the order of the closure, the sets above hash by object identity
+		self.items: Tuple[LR0Item, ...] = ()
 
 	def __hash__(self) -> int:
 		return hash(self.kernel)
@@ -93,22 +153,49 @@ class LRTable:
 		self.states: List[LR1State] = []
 
 
+# lookahead engines: propagation from LR(1) closures of kernel items, or DeRemer-Pennello relations
+LookaheadsPropagate = "propagate"
+LookaheadsDeRemerPennello = "deremer-pennello"
+LookaheadEngines = (LookaheadsPropagate, LookaheadsDeRemerPennello)
+
+
+def digraph(edges: List[List[int]], initial: List[int]) -> List[int]:
+	# F(x) = initial(x) | F(y) for every edge x -> y; members of a cycle share the same set
+	result = list(initial)
+	for scc in topological_sort(range(len(edges)), lambda x: edges[x]):
+		mask = 0
+		for x in scc:
+			mask |= result[x]
+			for y in edges[x]:
+				mask |= result[y]
+		for x in scc:
+			result[x] = mask
+	return result
+
+
 class LALRBuilder:
-	def __init__(self, grammar: ParserGrammar):
+	def __init__(self, grammar: ParserGrammar, lookaheads: str = LookaheadsPropagate):
 		self.grammar = grammar
+		self.lookaheads: str = lookaheads
 		self.sharp = SymbolTerminal(Terminal(SrcLoc("", 0, 0), '#', '#'))
+		self.sharp.idx = len(grammar.terminals)
+		self.sharp.bit = 1 << self.sharp.idx
+		self.bit_terminals: List[SymbolTerminal] = grammar.terminals + [self.sharp]
+		self.mask_terminals: Dict[int, List[SymbolTerminal]] = dict()
 		self.states: List[LR0Set] = []
 		self.terminal_list: List[SymbolTerminal] = []
 		self.nonterminal_list: List[SymbolNonTerminal] = []
 		self.entry: Dict[SymbolNonTerminal, LR0Set] = dict()
 
 	def build(self) -> LRTable:
-		print("fn")
 		self.find_nullables()
 		self.find_first()
 		self.construct_sets()
-		self.determine_lookaheads()
-		self.propagate_lookaheads()
+		if self.lookaheads == LookaheadsDeRemerPennello:
+			self.compute_lookaheads_dp()
+		else:
+			self.determine_lookaheads()
+			self.propagate_lookaheads()
 		self.construct_actions()
 		self.resolve_conflicts()
 		self.generate_table()
@@ -133,13 +220,15 @@ class LALRBuilder:
 
 		return table
 
+	@profiled("generate_table")
 	def generate_table(self) -> None:
 		for state in self.states:
 			for symbol, target in state.goto.items():
 				if isinstance(symbol, SymbolNonTerminal):
 					state.gen.gotos[symbol] = target.gen
-			for terminal, actions in state.actions.items():
-				action = head(actions)
+			# actions in terminal order, the table visits the shift targets in this order to number the states
+			for terminal in sorted(state.actions, key=lambda terminal: terminal.bit):
+				action = state.actions[terminal][0]
 				if isinstance(action, AcceptType) or isinstance(action, Reduce):
 					state.gen.actions[terminal] = action
 				elif isinstance(action, LRActionShift):
@@ -147,8 +236,9 @@ class LALRBuilder:
 				else:
 					raise RuntimeError("internal error: invalid action produced")
 
+	@profiled("resolve_conflicts")
 	def resolve_conflicts(self) -> None:
-		conflicts: Dict[LR0Set, List[Tuple[SymbolTerminal, Set[LRAction]]]] = defaultdict(lambda: [])
+		conflicts: Dict[LR0Set, List[Tuple[SymbolTerminal, List[LRAction]]]] = defaultdict(lambda: [])
 
 		for terminal in self.grammar.terminal_map.values():
 			terminal.idx = len(self.terminal_list)
@@ -165,9 +255,9 @@ class LALRBuilder:
 			newline = '\n'
 			for state, conflict in conflicts.items():
 				self.print_state(state)
-				by_actions: Dict[FrozenSet[LRAction], Set[SymbolTerminal]] = defaultdict(lambda: set())
+				by_actions: Dict[Tuple[LRAction, ...], List[SymbolTerminal]] = defaultdict(lambda: [])
 				for symbol, actions in conflict:
-					by_actions[frozenset(actions)].add(symbol)
+					by_actions[tuple(actions)].append(symbol)
 				for action_set, symbols in by_actions.items():
 					symbols_str = ' / '.join(map(lambda s: s.to_inline_str(), symbols))
 					print(
@@ -175,77 +265,113 @@ class LALRBuilder:
 						file=sys.stderr
 					)
 
+	@profiled("construct_actions")
 	def construct_actions(self) -> None:
 		def add_action(state: LR0Set, terminal: SymbolTerminal, action: LRAction) -> None:
 			if terminal not in state.actions:
-				state.actions[terminal] = set()
-			state.actions[terminal].add(action)
+				state.actions[terminal] = []
+			if action not in state.actions[terminal]:
+				state.actions[terminal].append(action)
 
 		for state in self.states:
-			for item in chain(state.kernel, state.nonkernel):
+			for item in state.items:
 				if len(item.prod.symbols) > item.offset:
 					next = item.prod.symbols[item.offset]
 					if isinstance(next, SymbolTerminal) and next in state.goto:
 						target = state.goto[next]
 						add_action(state, next, target.shift)
 				else:
+					mask = 0
 					for lookahead in state.lookahead[item]:
+						mask |= lookahead.bit
+					for lookahead in self.terminals_of(mask):
 						if not item.nt.exported:
 							add_action(state, lookahead, Reduce.get(item.nt, item.prod))
 						elif lookahead == self.grammar.eof:
 							add_action(state, lookahead, Accept)
 
-	def first(self, rule: Iterable[Symbol], la: Iterable[SymbolTerminal]) -> Set[SymbolTerminal]:
-		result = set()
+	def terminals_of(self, mask: int) -> List[SymbolTerminal]:
+		terminals = self.mask_terminals.get(mask, None)
+		if terminals is None:
+			terminals = [self.bit_terminals[idx] for idx in iter_bits(mask)]
+			self.mask_terminals[mask] = terminals
+		return terminals
+
+	def first(self, rule: Iterable[Symbol], la: int) -> int:
+		result = 0
 		for symbol in rule:
 			if isinstance(symbol, SymbolTerminal):
-				result.add(symbol)
+				result |= symbol.bit
 				break
 			elif isinstance(symbol, SymbolNonTerminal):
-				result.update(symbol.first)
+				result |= symbol.first
 				if not symbol.nullable:
 					break
 		else:
-			result.update(la)
+			result |= la
 		return result
 
+	@profiled("find_nullables")
 	def find_nullables(self) -> None:
-		while True:
-			progress = False
-			for nt in self.grammar.nonterminals:
-				if not nt.nullable:
-					for prod in nt.prods:
-						for symbol in prod.symbols:
-							if isinstance(symbol, SymbolTerminal) or (isinstance(symbol, SymbolNonTerminal) and symbol.nullable):
-								break
-						else:
-							nt.nullable = True
-							progress = True
-			if not progress:
-				break
+		# a production becomes nullable once all of its symbols are, track the count of the ones still pending
+		pending: Dict[Production, int] = dict()
+		users: Dict[SymbolNonTerminal, List[Production]] = defaultdict(lambda: [])
+		worklist: List[SymbolNonTerminal] = []
 
-	def find_first(self) -> None:
 		for nt in self.grammar.nonterminals:
 			for prod in nt.prods:
+				count = 0
 				for symbol in prod.symbols:
 					if isinstance(symbol, SymbolTerminal):
-						nt.first.add(symbol)
+						count = -1
 						break
+					users[cast(SymbolNonTerminal, symbol)].append(prod)
+					count += 1
+				pending[prod] = count
+				if count == 0 and not nt.nullable:
+					nt.nullable = True
+					worklist.append(nt)
 
-		while True:
-			progress = False
-			for nt in self.grammar.nonterminals:
-				for prod in nt.prods:
-					for symbol in prod.symbols:
-						if isinstance(symbol, SymbolTerminal):
+		i = 0
+		while i < len(worklist):
+			for prod in users[worklist[i]]:
+				if pending[prod] > 0:
+					pending[prod] -= 1
+					if pending[prod] == 0 and not prod.nt.nullable:
+						prod.nt.nullable = True
+						worklist.append(prod.nt)
+			i += 1
+
+	@profiled("find_first")
+	def find_first(self) -> None:
+		# FIRST of a nonterminal flows to every nonterminal whose productions can start with it
+		edges: Dict[SymbolNonTerminal, List[SymbolNonTerminal]] = defaultdict(lambda: [])
+		worklist: List[SymbolNonTerminal] = []
+		for nt in self.grammar.nonterminals:
+			for prod in nt.prods:
+				for symbol in prod.symbols:
+					if isinstance(symbol, SymbolTerminal):
+						nt.first |= symbol.bit
+						break
+					elif isinstance(symbol, SymbolNonTerminal):
+						edges[symbol].append(nt)
+						if not symbol.nullable:
 							break
-						elif isinstance(symbol, SymbolNonTerminal):
-							if extend_set(nt.first, symbol.first):
-								progress = True
-							if not symbol.nullable:
-								break
-			if not progress:
-				break
+			if nt.first:
+				worklist.append(nt)
+
+		queued: Set[SymbolNonTerminal] = set(worklist)
+		i = 0
+		while i < len(worklist):
+			nt = worklist[i]
+			queued.discard(nt)
+			for target in edges.get(nt, ()):
+				if nt.first & ~target.first:
+					target.first |= nt.first
+					if target not in queued:
+						queued.add(target)
+						worklist.append(target)
+			i += 1
 
 	def closure_lr1(self, items: Iterable[LR1Item]) -> FrozenSet[LR1Item]:
 		worklist: List[LR1Item] = list(items)
@@ -256,8 +382,9 @@ class LALRBuilder:
 			if len(item.prod.symbols) > item.offset:
 				next = item.prod.symbols[item.offset]
 				if isinstance(next, SymbolNonTerminal):
+					lookahead = self.terminals_of(self.first(item.prod.symbols[item.offset + 1:], item.la.bit))
 					for prod in next.prods:
-						for sym in self.first(item.prod.symbols[item.offset + 1:], (item.la,)):
+						for sym in lookahead:
 							newitem = LR1Item(next, prod, 0, sym)
 							if newitem not in closure:
 								closure.add(newitem)
@@ -265,36 +392,6 @@ class LALRBuilder:
 			i += 1
 		return frozenset(closure)
 
-	def closure(self, items: Iterable[LR0Item]) -> Tuple[FrozenSet[LR0Item], FrozenSet[LR0Item]]:
-		worklist: List[LR0Item] = list(items)
-		closure: Set[LR0Item] = set(items)
-		i = 0
-		while i < len(worklist):
-			item = worklist[i]
-			if len(item.prod.symbols) > item.offset:
-				next = item.prod.symbols[item.offset]
-				if isinstance(next, SymbolNonTerminal):
-					for prod in next.prods:
-						newitem = LR0Item(next, prod, 0)
-						if newitem not in closure:
-							closure.add(newitem)
-							worklist.append(newitem)
-			i += 1
-		return (
-			frozenset(item for item in worklist if item.is_kernel()),
-			frozenset(item for item in worklist if not item.is_kernel())
-		)
-
-	def compute_goto(self, state: LR0Set, symbol: Symbol) -> Optional[Tuple[FrozenSet[LR0Item], FrozenSet[LR0Item]]]:
-		items = set()
-		for item in chain(state.kernel, state.nonkernel):
-			if len(item.prod.symbols) > item.offset:
-				if item.prod.symbols[item.offset] == symbol:
-					items.add(LR0Item(item.nt, item.prod, item.offset + 1))
-		if len(items) == 0:
-			return None
-		return self.closure(items)
-
 	def print_states(self) -> None:
 		for state in self.states:
 			self.print_state(state)
@@ -330,6 +427,7 @@ class LALRBuilder:
 				file=sys.stderr
 			)
 
+	@profiled("determine_lookaheads")
 	def determine_lookaheads(self) -> None:
 		for state in self.states:
 			for symbol in state.goto.keys():
@@ -371,6 +469,7 @@ class LALRBuilder:
 				assert self.grammar.eof is not None
 				state.lookahead[item].add(self.grammar.eof)
 
+	@profiled("propagate_lookaheads")
 	def propagate_lookaheads(self) -> None:
 		while True:
 			progress = False
@@ -389,23 +488,21 @@ class LALRBuilder:
 			self.propagate_lookahead_to_nonkernels(state)
 
 	def propagate_lookahead_to_nonkernels(self, state: LR0Set) -> None:
-		worklist: List[Tuple[LR0Item, Set[SymbolTerminal]]] = list(state.lookahead.items())
-		closure: Dict[LR0Item, Set[SymbolTerminal]] = state.lookahead
-
-		def add_work(item: LR0Item, lookahead: Iterable[SymbolTerminal]) -> None:
-			new_lookahead = set()
-			if item not in closure:
-				closure[item] = set()
-			base_set = closure[item]
-			for term in lookahead:
-				if term not in base_set:
-					base_set.add(term)
-					new_lookahead.add(term)
-			if len(new_lookahead) > 0:
+		closure: Dict[LR0Item, int] = dict()
+		worklist: List[Tuple[LR0Item, int]] = []
+
+		def add_work(item: LR0Item, lookahead: int) -> None:
+			base = closure.get(item, 0)
+			new_lookahead = lookahead & ~base
+			if new_lookahead:
+				closure[item] = base | new_lookahead
 				worklist.append((item, new_lookahead))
 
 		for item, lookahead in state.lookahead.items():
-			add_work(item, lookahead)
+			mask = 0
+			for term in lookahead:
+				mask |= term.bit
+			add_work(item, mask)
 
 		i = 0
 		while i < len(worklist):
@@ -418,35 +515,113 @@ class LALRBuilder:
 						add_work(newitem, self.first(item.prod.symbols[item.offset + 1:], lookaheads))
 			i += 1
 
+		for item, mask in closure.items():
+			state.lookahead[item].update(self.terminals_of(mask))
+
+	@profiled("compute_lookaheads_dp")
+	def compute_lookaheads_dp(self) -> None:
+		# nonterminal transitions (state, A); every export gets a pseudo transition from its entry state reading {eof}
+		transitions: List[Tuple[LR0Set, SymbolNonTerminal]] = []
+		transition_idx: Dict[Tuple[LR0Set, SymbolNonTerminal], int] = dict()
+		direct_reads: List[int] = []
+
+		def add_transition(state: LR0Set, nt: SymbolNonTerminal, reads: int) -> None:
+			transition_idx[(state, nt)] = len(transitions)
+			transitions.append((state, nt))
+			direct_reads.append(reads)
+
+		assert self.grammar.eof is not None
+		for nt, entry in self.entry.items():
+			add_transition(entry, nt, self.grammar.eof.bit)
+		for state in self.states:
+			for symbol, target in state.goto.items():
+				if isinstance(symbol, SymbolNonTerminal):
+					reads = 0
+					for next_symbol in target.goto.keys():
+						if isinstance(next_symbol, SymbolTerminal):
+							reads |= next_symbol.bit
+					add_transition(state, symbol, reads)
+
+		reads_edges: List[List[int]] = [[] for _ in transitions]
+		includes_edges: List[List[int]] = [[] for _ in transitions]
+		lookback: Dict[Tuple[LR0Set, LR0Item], List[int]] = defaultdict(lambda: [])
+
+		for idx, (state, nt) in enumerate(transitions):
+			nt_target = state.goto.get(nt, None)
+			if nt_target is not None:
+				for symbol, next_target in nt_target.goto.items():
+					if isinstance(symbol, SymbolNonTerminal) and symbol.nullable:
+						reads_edges[idx].append(transition_idx[(nt_target, symbol)])
+
+			for prod in nt.prods:
+				symbols = prod.symbols
+				# nullable_tail[i]: every symbol from i on derives the empty string
+				nullable_tail = [True] * (len(symbols) + 1)
+				for i in range(len(symbols) - 1, -1, -1):
+					symbol = symbols[i]
+					nullable_tail[i] = nullable_tail[i + 1] and isinstance(symbol, SymbolNonTerminal) and symbol.nullable
+				current = state
+				for i, symbol in enumerate(symbols):
+					if isinstance(symbol, SymbolNonTerminal) and nullable_tail[i + 1]:
+						includes_edges[transition_idx[(current, symbol)]].append(idx)
+					current = current.goto[symbol]
+				lookback[(current, LR0Item(nt, prod, len(symbols)))].append(idx)
+
+		read_sets = digraph(reads_edges, direct_reads)
+		follow_sets = digraph(includes_edges, read_sets)
+
+		for (state, item), sources in lookback.items():
+			mask = 0
+			for idx in sources:
+				mask |= follow_sets[idx]
+			state.lookahead[item].update(self.terminals_of(mask))
+
+	@profiled("construct_sets")
 	def construct_sets(self) -> None:
-		worklist: List[LR0Set] = []
-		states: Dict[FrozenSet[LR0Item], LR0Set] = dict()
-
-		def add_state(items: Optional[Tuple[FrozenSet[LR0Item], FrozenSet[LR0Item]]]) -> Optional[LR0Set]:
-			if items is None:
-				return None
-			if len(items[0]) == 0:
-				return None
-			kernel = items[0]
-			if kernel not in states:
-				state = LR0Set(len(self.states), *items)
-				states[kernel] = state
+		index = ItemIndex(self.grammar)
+		# states by the items they were reached with: the advanced items of a goto, or the start item of an
+		# export; the closure only adds items with the dot at the start, so these identify the kernel
+		states: Dict[FrozenSet[int], LR0Set] = dict()
+		# closure items of every state, by state index
+		state_items: List[List[int]] = []
+		# gotos are visited in the order of the symbols, so states are numbered the same way in every run
+		symbol_order: Dict[Symbol, int] = {
+			symbol: order for order, symbol in enumerate(chain(self.grammar.terminal_map.values(), self.grammar.nonterminals))
+		}
+
+		def add_state(items: List[int]) -> LR0Set:
+			key = frozenset(items)
+			state = states.get(key, None)
+			if state is None:
+				closure = index.closure(items)
+				kernel = [item for item in closure if index.kernel[item]]
+				nonkernel = [item for item in closure if not index.kernel[item]]
+				state = LR0Set(
+					len(self.states),
+					frozenset(index.lr0[item] for item in kernel),
+					frozenset(index.lr0[item] for item in nonkernel)
+				)
+				state.items = tuple(index.lr0[item] for item in chain(kernel, nonkernel))
+				states[key] = state
 				self.states.append(state)
-				worklist.append(state)
-			return states[kernel]
+				state_items.append(closure)
+			return state
 
 		for nt in self.grammar.exports.values():
-			item = LR0Item(nt, nt.prods[0], 0)
-			set = add_state(self.closure((item,)))
-			assert set is not None
-			self.entry[nt] = set
+			self.entry[nt] = add_state([index.first_item[nt.prods[0]]])
 
 		i = 0
-		while i < len(worklist):
-			state = worklist[i]
-			for symbol in chain(self.grammar.terminal_map.values(), self.grammar.nonterminals):
-				new_state = add_state(self.compute_goto(state, symbol))
-				if new_state:
-					state.goto[symbol] = new_state
+		while i < len(self.states):
+			state = self.states[i]
+			# the items of every goto target, only symbols that follow a dot in this state have one
+			targets: Dict[Symbol, List[int]] = dict()
+			for item in state_items[i]:
+				next = index.next[item]
+				if next is not None:
+					if next not in targets:
+						targets[next] = []
+					targets[next].append(item + 1)
+			for symbol in sorted(targets, key=lambda symbol: symbol_order[symbol]):
+				state.goto[symbol] = add_state(targets[symbol])
 			i += 1
 
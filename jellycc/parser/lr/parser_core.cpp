@@ -1,130 +1,281 @@
+#include <bitset>
+#include <climits>
 #include <cstdint>
 #include <cstddef>
+#include <cstring>
 
-${include:parser_core.h}
+#if defined(_MSC_VER)
+#define JELLYCC_NOINLINE __declspec(noinline)
+#else
+#define JELLYCC_NOINLINE __attribute__((noinline))
+#endif
 
-const uint8_t ${parser_prefix}_table_dispatch[][${token_count}] = {
-	${table_dispatch}
-};
-const uint16_t ${parser_prefix}_table_payload[][${dispatch_count}] = {
-	${table_payload}
+// hooks around the parser stages (core, vm, recovery) for benchmarks, compiled out unless defined
+#ifndef JELLYCC_STAGE_ENTER
+#define JELLYCC_STAGE_ENTER(stage)
+#endif
+#ifndef JELLYCC_STAGE_LEAVE
+#define JELLYCC_STAGE_LEAVE(stage)
+#endif
+
+${include:../ll/parser.shared.inc}
+
+${parser_source}
+
+namespace ${parser_namespace} {
+
+extern const uint8_t skippable_flag[${token_count}] = {
+	${token_skippable_data}
 };
-const uint16_t ${parser_prefix}_table_goto[][${goto_count}] = {
-	${table_goto}
+
+struct VMArgs {
+	${vm_struct}
 };
-const uint16_t ${parser_prefix}_resolve[] = {
-	${table_resolve}
+
+struct ParserState {
+	uint16_t* stack;
+	uint16_t* stack_limit;
+	uint16_t* stack_begin;
+	uint16_t* stack_end;
+
+	const uint16_t* input;
+	const uint16_t* input_end;
+
+	uint16_t* output;
+	uint16_t* output_begin;
+	uint16_t* output_end;
+
+	uint8_t* data;
+	uint8_t* data_end;
+	uint8_t* data_begin;
+
+	AllocatorCallback allocator;
+	ParserConfig config;
+
+	VMArgs vm_args;
+
+	size_t tokens_to_skip;
+	// input position of the last recovery, a second error there has to skip a token to make progress
+	const uint16_t* recovery_input;
+
+	size_t total_size;
 };
-const uint8_t ${parser_prefix}_table_accepts[] = {
-	${table_accepts}
+
+enum class CoreResult {
+	Full,
+	Accept,
+	Error
 };
 
-void ${parser_prefix}_init(${parser_prefix}_Parser* pp) {
-	pp->stack = nullptr;
-	pp->stack_top = nullptr;
-	pp->stack_base = nullptr;
+static ParseResult parser_grow_data(ParserState* parser);
+static ParseResult parser_run_vm(ParserState* parser, uint16_t* output, uint16_t* output_end);
+static ParseResult parser_recovery(ParserState* parser);
+
+${include:parser_tables.cpp}
+
+#define JELLYCC_CHECKED(expr) do { ParseResult _result = (expr); if (_result != ParseResult::OK) { return _result; } } while (0)
+
+static uint8_t* parser_allocate(ParserState* parser, size_t size) {
+	return parser->allocator.allocate(parser->allocator.ud, size);
+}
 
-	pp->token_idx = 0;
-	pp->tokens = nullptr;
-	pp->token_count = 0;
+static uint8_t* parser_reallocate(ParserState* parser, uint8_t* ptr, size_t old_size, size_t new_size) {
+	return parser->allocator.reallocate(parser->allocator.ud, ptr, old_size, new_size);
+}
 
-	pp->out = nullptr;
-	pp->out_base = nullptr;
-	pp->out_end = nullptr;
+static void parser_free(ParserState* parser, uint8_t* ptr, size_t size) {
+	parser->allocator.free(parser->allocator.ud, ptr, size);
 }
 
-void ${parser_prefix}_push_symbol(${parser_prefix}_Parser* pp, ${parser_prefix}_Symbol symbol) {
-	*pp->stack = (uint16_t)symbol;
-	pp->stack++;
+static ParseResult parser_reallocate_data(ParserState* parser, size_t new_size) {
+	size_t data_offset = parser->data - parser->data_begin;
+	uint8_t* new_data;
+	if (parser->data_begin) {
+		new_data = parser_reallocate(parser, parser->data_begin, parser->data_end - parser->data_begin, new_size);
+	} else {
+		new_data = parser_allocate(parser, new_size);
+	}
+	if (!new_data) {
+		return ParseResult::OutOfMemory;
+	}
+	parser->data_begin = new_data;
+	parser->data = new_data + data_offset;
+	parser->data_end = new_data + new_size;
+	return ParseResult::OK;
 }
 
-void ${parser_prefix}_set_input(${parser_prefix}_Parser* pp, uint16_t* tokens, size_t count) {
-	pp->token_idx = 0;
-	pp->tokens = tokens;
-	pp->token_count = count;
+// stack sizes in the config are in bytes
+static ParseResult parser_reallocate_stack(ParserState* parser, size_t new_size) {
+	size_t stack_offset = parser->stack - parser->stack_begin;
+	size_t old_bytes = (parser->stack_end - parser->stack_begin) * sizeof(uint16_t);
+	uint16_t* new_stack;
+	if (parser->stack_begin) {
+		new_stack = (uint16_t*)parser_reallocate(parser, (uint8_t*)parser->stack_begin, old_bytes, new_size);
+	} else {
+		new_stack = (uint16_t*)parser_allocate(parser, new_size);
+	}
+	if (!new_stack) {
+		return ParseResult::OutOfMemory;
+	}
+	parser->stack_begin = new_stack;
+	parser->stack = new_stack + stack_offset;
+	parser->stack_end = new_stack + new_size / sizeof(uint16_t);
+	parser->stack_limit = parser->stack_end - 4;
+	return ParseResult::OK;
 }
 
-void ${parser_prefix}_set_stack(${parser_prefix}_Parser* pp, uint16_t* stack, size_t size) {
-	size_t old_size = pp->stack - pp->stack_base;
-	pp->stack = stack + old_size;
-	pp->stack_top = stack + size;
-	pp->stack_base = stack;
+static ParseResult parser_grow(ParserState* parser, size_t old_size, size_t max_size, ParseResult (*reallocate)(ParserState*, size_t)) {
+	size_t new_size = old_size * 2;
+	if (new_size > max_size) {
+		new_size = max_size;
+	}
+	if (new_size <= old_size) {
+		return ParseResult::StackOverflow;
+	}
+	return reallocate(parser, new_size);
 }
 
-void ${parser_prefix}_set_output(${parser_prefix}_Parser* pp, uint16_t* out, size_t size) {
-	pp->out = out;
-	pp->out_end = out + size;
-	pp->out_base = out;
+static ParseResult parser_grow_stack(ParserState* parser) {
+	size_t old_size = (parser->stack_end - parser->stack_begin) * sizeof(uint16_t);
+	return parser_grow(parser, old_size, parser->config.stack_max, parser_reallocate_stack);
 }
 
-size_t ${parser_prefix}_get_input_pos(${parser_prefix}_Parser* pp) {
-	return pp->token_idx;
+static ParseResult parser_grow_data(ParserState* parser) {
+	size_t old_size = parser->data_end - parser->data_begin;
+	return parser_grow(parser, old_size, parser->config.data_max, parser_reallocate_data);
 }
 
-size_t ${parser_prefix}_get_output_count(${parser_prefix}_Parser* pp) {
-	return pp->out - pp->out_base;
+ParserState* parser_create(AllocatorCallback cb, ParserConfig cfg) {
+	// the output chunk has a slot past its end for the vm sentinel
+	size_t total_allocation_size = sizeof(ParserState) + sizeof(uint16_t) * (cfg.chunk_size + 1);
+	uint8_t* ptr = cb.allocate(cb.ud, total_allocation_size);
+	ParserState* parser = (ParserState*)ptr;
+	if (!parser) {
+		return nullptr;
+	}
+	memset(parser, 0, sizeof(ParserState));
+	parser->allocator = cb;
+	parser->config = cfg;
+	parser->total_size = total_allocation_size;
+	parser->output_begin = (uint16_t*)(ptr + sizeof(ParserState));
+	parser->output_end = parser->output_begin + cfg.chunk_size;
+	return parser;
 }
 
-${parser_prefix}_Result ${parser_prefix}_run(${parser_prefix}_Parser* pp) {
-	uint16_t* tokens = pp->tokens;
-	size_t token_idx = pp->token_idx;
-	size_t token_end = pp->token_count;
+static ParseResult parser_initialize(ParserState* parser) {
+	JELLYCC_CHECKED(parser_reallocate_stack(parser, parser->config.stack_initial));
+	JELLYCC_CHECKED(parser_reallocate_data(parser, parser->config.data_initial));
+	return ParseResult::OK;
+}
 
-	if (pp->stack == pp->stack_top) {
-		return ${parser_prefix}_Result::MoreStack;
+void parser_destroy(ParserState* parser) {
+	if (!parser) {
+		return;
+	}
+	if (parser->stack_begin) {
+		parser_free(parser, (uint8_t*)parser->stack_begin, (parser->stack_end - parser->stack_begin) * sizeof(uint16_t));
+	}
+	if (parser->data_begin) {
+		parser_free(parser, parser->data_begin, parser->data_end - parser->data_begin);
 	}
-	uint16_t* stack = pp->stack - 1;
-	uint16_t* stack_top = pp->stack_top - 1;
+	parser->allocator.free(parser->allocator.ud, (uint8_t*)parser, parser->total_size);
+}
 
-	uint16_t* out = pp->out;
-	uint16_t* out_end = pp->out_end;
+static ParseResult parser_flush(ParserState* parser) {
+	if (parser->output != parser->output_begin) {
+		JELLYCC_CHECKED(parser_run_vm(parser, parser->output_begin, parser->output));
+		parser->output = parser->output_begin;
+	}
+	return ParseResult::OK;
+}
 
-	while ((token_idx < token_end) & (stack != stack_top) & (out != out_end)) {
-		uint16_t token = tokens[token_idx];
-		uint16_t state = *stack;
+JELLYCC_NOINLINE
+static CoreResult run_core(ParserState* parser) {
+	uint16_t* __restrict stack = parser->stack;
+	const uint16_t* __restrict input = parser->input;
+	uint16_t* __restrict output = parser->output;
+	uint16_t* output_end = parser->output_end;
+	uint16_t* stack_limit = parser->stack_limit;
+	CoreResult result = CoreResult::Full;
 
-		uint8_t dispatch = ${parser_prefix}_table_dispatch[state][token];
-        if (dispatch == 0xff) {
+	while (output < output_end && stack < stack_limit) {
+		action_t action = action_lookup(*stack, *input);
+		if (action < action_reduce_base) {
+			if (action == action_error) {
+				result = CoreResult::Error;
+				break;
+			}
+			stack++;
+			*stack = (uint16_t)action;
+			input++;
+			*output = vm_shift;
+			output++;
+		} else if (action < action_accept) {
+			uint16_t prod = (uint16_t)(action - action_reduce_base);
+			stack -= data_prod_length[prod];
+			uint16_t target = goto_lookup(data_prod_nt[prod], *stack);
+			stack++;
+			*stack = target;
+			uint16_t vm = data_prod_vm[prod];
+			*output = vm;
+			output += (vm != vm_none);
+		} else {
+			result = CoreResult::Accept;
 			break;
 		}
-        uint16_t action = ${parser_prefix}_table_payload[state][dispatch];
-
-		uint8_t shift = action >> 12;
-		uint16_t payload = action & ((1 << 12) - 1);
+	}
 
-		stack -= shift;
+	parser->stack = stack;
+	parser->input = input;
+	parser->output = output;
+	return result;
+}
 
-		uint16_t reduce_state = ${parser_prefix}_table_goto[*stack][${parser_prefix}_resolve[payload]];
-		stack += (payload != 0);
-		*stack = reduce_state;
+ParseResult parser_run(ParserState* parser, NonTerminal nt, const uint16_t* input, const uint16_t* input_end ${vm_extra_params}) {
+	if (!parser->stack_begin) {
+		JELLYCC_CHECKED(parser_initialize(parser));
+	}
 
-		token_idx += (payload <= ${count_shifts});
+	// copy vm arguments
+	parser->vm_args = {${vm_copy_params}};
 
-		*out = payload;
-		out++;
-	}
+	// values of an earlier run are dead
+	parser->data = parser->data_begin;
+	parser->output = parser->output_begin;
 
-	pp->token_idx = token_idx;
-	pp->stack = stack + 1;
-	pp->out = out;
+	// the stack starts with the entry state of the nonterminal
+	parser->stack = parser->stack_begin;
+	*parser->stack = (uint16_t)nt;
 
-	if (token_idx >= token_end) {
-		return ${parser_prefix}_Result::MoreInput;
-	}
-	if (stack >= stack_top) {
-		return ${parser_prefix}_Result::MoreStack;
-	}
-	if (out >= out_end) {
-		return ${parser_prefix}_Result::MoreOutput;
-	}
+	// input_end points at the eof token, which is never shifted
+	parser->input = input;
+	parser->input_end = input_end;
+	parser->recovery_input = nullptr;
 
-	if (tokens[token_idx] == ${token_eof}) {
-		uint8_t accept = ${parser_prefix}_table_accepts[*stack];
-		if (accept) {
-			pp->stack -= 2;
-			pp->token_idx++;
-			return ${parser_prefix}_Result::Accept;
+	while (true) {
+		if (parser->output >= parser->output_end) {
+			JELLYCC_CHECKED(parser_flush(parser));
+		}
+		if (parser->stack >= parser->stack_limit) {
+			JELLYCC_CHECKED(parser_grow_stack(parser));
+		}
+		JELLYCC_STAGE_ENTER(core);
+		CoreResult result = run_core(parser);
+		JELLYCC_STAGE_LEAVE(core);
+		if (result == CoreResult::Accept && parser->input == parser->input_end) {
+			return parser_flush(parser);
+		}
+		if (result != CoreResult::Full) {
+			JELLYCC_STAGE_ENTER(recovery);
+			ParseResult recovery_result = parser_recovery(parser);
+			JELLYCC_STAGE_LEAVE(recovery);
+			JELLYCC_CHECKED(recovery_result);
 		}
 	}
-	return ${parser_prefix}_Result::Reject;
+}
+
+${include:parser_recovery.cpp}
+
+${include:parser_vm.cpp}
+
 }
@@ -0,0 +1,70 @@
+static ParseResult parser_push_action(ParserState* parser, uint16_t action) {
+	if (parser->output >= parser->output_end) {
+		JELLYCC_CHECKED(parser_flush(parser));
+	}
+	*parser->output = action;
+	parser->output++;
+	return ParseResult::OK;
+}
+
+// panic mode: pop states and skip tokens until a state on the stack has an action on the next token,
+// each popped state and skipped token costs one. The eof token at input_end syncs too but is never skipped.
+static ParseResult parser_recovery(ParserState* parser) {
+	uint16_t* stack = parser->stack;
+	size_t stack_depth = stack - parser->stack_begin;
+	const uint16_t* input = parser->input;
+	const uint16_t* input_end = parser->input_end;
+
+	std::bitset<${token_count}> visited_tokens;
+	std::bitset<${state_count}> visited_states;
+
+	uint32_t best_cost = UINT_MAX;
+	uint16_t* best_stack = nullptr;
+	const uint16_t* best_input = nullptr;
+
+	// the parser failed again where it last recovered, syncing there without a skip would loop
+	const uint16_t* input_pos = input + (input == parser->recovery_input ? 1 : 0);
+	for (; input_pos <= input_end && (uint32_t)(input_pos - input) < best_cost; input_pos++) {
+		uint16_t tok = *input_pos;
+		if (visited_tokens.test(tok)) {
+			continue;
+		}
+		visited_tokens.set(tok);
+		visited_states.reset();
+		uint32_t token_cost = (uint32_t)(input_pos - input);
+		for (size_t depth = 0; depth <= stack_depth && token_cost + depth < best_cost; depth++) {
+			uint16_t state = *(stack - depth);
+			if (visited_states.test(state)) {
+				continue;
+			}
+			visited_states.set(state);
+			if (sync_lookup(state, tok)) {
+				best_cost = token_cost + (uint32_t)depth;
+				best_stack = stack - depth;
+				best_input = input_pos;
+				break;
+			}
+		}
+	}
+
+	if (best_cost == UINT_MAX) {
+		return ParseResult::FatalError;
+	}
+
+	while (stack != best_stack) {
+		uint16_t discard = data_state_discard[*stack];
+		if (discard != vm_none) {
+			JELLYCC_CHECKED(parser_push_action(parser, discard));
+		}
+		stack--;
+	}
+	if (best_input != input) {
+		parser->tokens_to_skip = best_input - input;
+		JELLYCC_CHECKED(parser_push_action(parser, vm_skip));
+	}
+	parser->stack = stack;
+	parser->input = best_input;
+	parser->recovery_input = best_input;
+	// the vm reads tokens_to_skip when it runs the skip, before the next recovery overwrites it
+	return parser_flush(parser);
+}
@@ -0,0 +1,108 @@
+// action and goto tables are row-displacement packed: rows with equal entries share a class, a slot
+// belongs to the class stored in its check entry, every other column takes the default of the class
+using action_t = ${action_type};
+
+static constexpr action_t action_error = 0;
+static constexpr action_t action_reduce_base = ${reduce_base};
+static constexpr action_t action_accept = ${accept_value};
+
+static constexpr uint16_t vm_shift = ${vm_shift};
+static constexpr uint16_t vm_none = ${vm_none};
+
+static const ${action_check_type} data_action_class[] = {
+	${action_class_data}
+};
+
+static const action_t data_action_default[] = {
+	${action_default_data}
+};
+
+static const ${action_base_type} data_action_base[] = {
+	${action_base_data}
+};
+
+static const ${action_check_type} data_action_check[] = {
+	${action_check_data}
+};
+
+static const action_t data_action_value[] = {
+	${action_value_data}
+};
+
+static inline action_t action_lookup(uint16_t state, uint16_t tok) {
+	${action_check_type} cls = data_action_class[state];
+	size_t idx = data_action_base[cls] + tok;
+	return data_action_check[idx] == cls ? data_action_value[idx] : data_action_default[cls];
+}
+
+static const ${goto_check_type} data_goto_class[] = {
+	${goto_class_data}
+};
+
+static const ${goto_value_type} data_goto_default[] = {
+	${goto_default_data}
+};
+
+static const ${goto_base_type} data_goto_base[] = {
+	${goto_base_data}
+};
+
+static const ${goto_check_type} data_goto_check[] = {
+	${goto_check_data}
+};
+
+static const ${goto_value_type} data_goto_value[] = {
+	${goto_value_data}
+};
+
+static inline uint16_t goto_lookup(uint16_t nt, uint16_t state) {
+	${goto_check_type} cls = data_goto_class[nt];
+	size_t idx = data_goto_base[cls] + state;
+	return data_goto_check[idx] == cls ? data_goto_value[idx] : data_goto_default[cls];
+}
+
+static const ${prod_length_type} data_prod_length[] = {
+	${prod_length_data}
+};
+
+static const ${prod_nt_type} data_prod_nt[] = {
+	${prod_nt_data}
+};
+
+static const uint16_t data_prod_vm[] = {
+	${prod_vm_data}
+};
+
+// recovery: the terminals each state has an action for, without the default reductions, and the vm
+// code that discards the value a state holds on the value stack
+static constexpr uint16_t vm_skip = ${vm_skip};
+
+static const ${sync_check_type} data_sync_class[] = {
+	${sync_class_data}
+};
+
+static const ${sync_value_type} data_sync_default[] = {
+	${sync_default_data}
+};
+
+static const ${sync_base_type} data_sync_base[] = {
+	${sync_base_data}
+};
+
+static const ${sync_check_type} data_sync_check[] = {
+	${sync_check_data}
+};
+
+static const ${sync_value_type} data_sync_value[] = {
+	${sync_value_data}
+};
+
+static inline bool sync_lookup(uint16_t state, uint16_t tok) {
+	${sync_check_type} cls = data_sync_class[state];
+	size_t idx = data_sync_base[cls] + tok;
+	return (data_sync_check[idx] == cls ? data_sync_value[idx] : data_sync_default[cls]) != 0;
+}
+
+static const uint16_t data_state_discard[] = {
+	${state_discard_data}
+};
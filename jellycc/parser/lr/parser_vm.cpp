@@ -1,25 +1,47 @@
-${include:parser_vm.h}
+template<class T>
+constexpr intptr_t Aligned = (sizeof(T) + 7) & ~7;
 
-${parser_vm_source}
+template<class... Args>
+constexpr intptr_t ListOffset = (Aligned<Args> + ... + 0);
 
-void PP_vm_init(PP_VM* vm) {
-	vm->output = nullptr;
-	vm->output_end = nullptr;
-}
+static ParseResult parser_vm_dispatch(ParserState* parser, uint16_t* actions);
 
-void PP_vm_set_output(PP_VM* vm, uint16_t* output, size_t len) {
-	vm->output = output;
-	vm->output_end = output + len;
+static ParseResult parser_run_vm(ParserState* parser, uint16_t* output, uint16_t* output_end) {
+	*output_end = ${vm_action_sentinel};
+	JELLYCC_STAGE_ENTER(vm);
+	ParseResult result = parser_vm_dispatch(parser, output);
+	JELLYCC_STAGE_LEAVE(vm);
+	return result;
 }
 
-void PP_vm_run(PP_VM* vm, ${parser_vm_ctx} ctx) {
-	uint16_t* output = vm->output;
-	uint16_t* output_end = vm->output_end;
-	while (output != output_end) {
-		switch (*output) {
-		${vm_switch}
+static ParseResult parser_vm_dispatch(ParserState* parser, uint16_t* actions) {
+	uint8_t* data = parser->data;
+	uint8_t* data_end = parser->data_end;
+	uint8_t* data_limit = data_end - 256;
+
+	${vm_extract_vm_args}
+
+	while (true) {
+		if (data >= data_limit) {
+			parser->data = data;
+			JELLYCC_CHECKED(parser_grow_data(parser));
+			data = parser->data;
+			data_end = parser->data_end;
+			data_limit = data_end - 256;
 		}
-		output++;
+		switch (*actions) {
+		${vm_dispatch_switch}
+		case ${vm_skip}: {
+			size_t num = parser->tokens_to_skip;
+			${vm_action_skip}
+		} break;
+		case ${vm_action_sentinel}: {
+			goto exit;
+		} break;
+		}
+		actions++;
 	}
+exit:
+	parser->data = data;
+	return ParseResult::OK;
 }
-
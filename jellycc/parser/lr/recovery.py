@@ -1,69 +1,87 @@
-from typing import Optional, Dict, Tuple, List, Set
+from collections import defaultdict
+from typing import Optional, Dict, Tuple, List, Iterator
 
 from jellycc.parser.grammar import ParserGrammar, SymbolTerminal, SymbolNonTerminal, Production
 from jellycc.parser.lr.lalr import LRTable
 from jellycc.parser.lr.lr1 import LR1State, Shift, Reduce
+from jellycc.utils.helpers import iter_bits
 
 
-class Node:
-	def __init__(self, state: LR1State, lookahead: SymbolTerminal) -> None:
-		self.state: LR1State = state
-		self.lookahead: SymbolTerminal = lookahead
-		self.reduce: Optional[Production] = None
-
-		self.in_shift: Set[Node] = set()
-		self.in_goto:  Set[Tuple[Node, SymbolNonTerminal]] = set()
+# a recovery node: the parser is in the state and sees the lookahead
+Node = Tuple[LR1State, SymbolTerminal]
 
 
 class RecoveryBuilder:
+	# the recovery graph has a node for every terminal a reachable state has an action on. It is never
+	# materialized: the nodes of a state are the terminal bitset of its actions, and the in-edges of a node
+	# are expanded on demand from the reverse shift and goto lists of its state.
 	def __init__(self, grammar: ParserGrammar, table: LRTable) -> None:
 		self.table = table
 		self.grammar = grammar
-		self.nodes: Dict[Tuple[LR1State, SymbolTerminal], Node] = dict()
-		self.worklist: List[Node] = []
-
-	def get_node(self, state: LR1State, lookahead: SymbolTerminal) -> Node:
-		key = (state, lookahead)
-		node = self.nodes.get(key, None)
-		if node is None:
-			node = Node(state, lookahead)
-			self.nodes[key] = node
-			self.worklist.append(node)
-			return node
-		return node
+		self.masks: Dict[LR1State, int] = dict()
+		self.shift_sources: Dict[LR1State, List[Node]] = defaultdict(list)
+		self.goto_sources: Dict[LR1State, List[Tuple[LR1State, SymbolNonTerminal]]] = defaultdict(list)
+		self.node_count: int = 0
 
 	def build(self) -> None:
 		print("Constructing recovery")
 
+		worklist: List[LR1State] = []
+
+		def visit(state: LR1State) -> int:
+			mask = self.masks.get(state, None)
+			if mask is None:
+				mask = 0
+				for term in state.actions:
+					mask |= term.bit
+				self.masks[state] = mask
+				# a state without actions has no nodes, so nothing is reached through it
+				if mask:
+					worklist.append(state)
+			return mask
+
 		for entry in self.table.entries.values():
-			for term in self.grammar.terminals:
-				if term in entry.actions:
-					self.get_node(entry, term)
+			visit(entry)
 
+		# every node of a state is reached once any of them is, so reachability is tracked per state
 		i = 0
-		while i < len(self.worklist):
-			self.process(self.worklist[i])
+		while i < len(worklist):
+			state = worklist[i]
 			i += 1
+			for term, action in state.actions.items():
+				if isinstance(action, Shift) and visit(action.state):
+					self.shift_sources[action.state].append((state, term))
+			for nt, target_state in state.gotos.items():
+				if visit(target_state):
+					self.goto_sources[target_state].append((state, nt))
+
+		self.node_count = sum(bin(mask).count('1') for mask in self.masks.values())
 
 		print(f"Total states: {len(self.table.states)}");
-		print(f"Total nodes: {len(self.nodes)}")
-
-	def process(self, node: Node) -> None:
-		state = node.state
-		action = state.actions.get(node.lookahead, None)
-		if action is not None:
-			if isinstance(action, Shift):
-				for term in self.grammar.terminals:
-					target_state = action.state
-					if term in target_state.actions:
-						target_node = self.get_node(target_state, term)
-						if target_node:
-							target_node.in_shift.add(node)
-			elif isinstance(action, Reduce):
-				node.reduce = action.prod
-			for nt, target_state in state.gotos.items():
-				for term in self.grammar.terminals:
-					if term in target_state.actions:
-						target_node = self.get_node(target_state, term)
-						target_node.in_goto.add((node, nt))
+		print(f"Total nodes: {self.node_count}")
+
+	def has_node(self, state: LR1State, lookahead: SymbolTerminal) -> bool:
+		return bool(self.masks.get(state, 0) & lookahead.bit)
+
+	def lookaheads(self, state: LR1State) -> List[SymbolTerminal]:
+		return self.grammar.terminal_set(self.masks.get(state, 0))
+
+	def reduce(self, node: Node) -> Optional[Production]:
+		action = node[0].actions.get(node[1], None)
+		if isinstance(action, Reduce):
+			return action.prod
+		return None
+
+	def in_shift(self, node: Node) -> List[Node]:
+		# nodes that shift into the state of the node, the same for each of its lookaheads
+		if not self.has_node(*node):
+			return []
+		return self.shift_sources.get(node[0], [])
 
+	def in_goto(self, node: Node) -> Iterator[Tuple[Node, SymbolNonTerminal]]:
+		# every node of a state with a goto into the state of the node, whatever its lookahead
+		if not self.has_node(*node):
+			return
+		for source, nt in self.goto_sources.get(node[0], []):
+			for idx in iter_bits(self.masks[source]):
+				yield (source, self.grammar.terminals[idx]), nt
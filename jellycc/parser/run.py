@@ -1,21 +1,24 @@
 import re
 from collections import defaultdict
-from typing import Dict, Set, List, Optional, Tuple
+from typing import Dict, Set, List, Optional, Tuple, Union
 
 from jellycc.parser.ll.builder import LLBuilder
-from jellycc.parser.ll.codegen import CodegenLH
-from jellycc.parser.ll.lhtable import LHTableBuilder
+from jellycc.parser.ll.codegen import CodegenLH, DispatchDense
+from jellycc.parser.ll.lhtable import LHTableBuilder, LHTable, Shift as LHShift
 from jellycc.parser.ll.recovery import LHRecovery
-from jellycc.parser.lr.codegen import Codegen
+from jellycc.parser.ll.runtime import ParserTables
+from jellycc.parser.lr.codegen import CodegenLR
 from jellycc.parser.grammar import unify_type, TypeVariable, Type, TypeVoid, SymbolNonTerminal, Action, TypeConstant, \
 	ParserGrammar, SymbolTerminal, Void
-from jellycc.parser.lr.lalr import LALRBuilder, LRTable
+from jellycc.parser.lr.lalr import LALRBuilder, LRTable, LookaheadsPropagate
 from jellycc.parser.lr.lr1 import LR1State, Shift, Reduce
 from jellycc.parser.lr.recovery import RecoveryBuilder
 from jellycc.parser.template import TypeConstraint, TemplateNonTerminalRule, TemplateSymbol, CaptureRe, \
 	TemplateNonTerminal, TemplateGrammar, TemplateExpr, TemplateAction
+from jellycc.project.cache import ArtifactCache, ObjectRefs
 from jellycc.project.grammar import SharedGrammar
 from jellycc.utils.error import CCError
+from jellycc.utils.profile import profiler
 from jellycc.utils.source import SrcLoc
 
 
@@ -24,6 +27,14 @@ ParserRule = Tuple[SrcLoc, str, List[str], Optional[TemplateExpr], List[Template
 
 SimpleNameRe = re.compile("^[a-zA-Z_][a-zA-Z0-9_]*$")
 
+# sections of the project file the parser tables are built from
+CacheSections = ("terminals", "parser.types", "parser.grammar", "parser.expose")
+
+# parser backends: LH tables with error correction and recovery, or LALR(1) tables with panic mode recovery
+BackendLH = "lh"
+BackendLR = "lr"
+Backends = (BackendLH, BackendLR)
+
 
 class ParserGenerator:
 	def __init__(self, shared: SharedGrammar) -> None:
@@ -34,13 +45,21 @@ class ParserGenerator:
 		self.type_values: Dict[str, Type] = dict()
 		self.exposed_nt: List[Tuple[SrcLoc, str]] = []
 		self.types: List[Tuple[SrcLoc, str, str]] = []
+		self.cache: Optional[ArtifactCache] = None
+		self.lalr_lookaheads: str = LookaheadsPropagate
+		self.lh_dispatch: str = DispatchDense
+		self.backend: str = BackendLH
 
 	def construct(self) -> None:
 		self._construct_terminals()
-		self._construct_nonterminals()
-		self._apply_types()
-		self._populate_parser()
-		self._typecheck_parser()
+		with profiler.stage("templates"):
+			self._construct_nonterminals()
+		with profiler.stage("types"):
+			self._apply_types()
+		with profiler.stage("instantiate"):
+			self._populate_parser()
+		with profiler.stage("type_inference"):
+			self._typecheck_parser()
 		self._simplify_actions()
 
 	def is_simple_name(self, name: str) -> bool:
@@ -154,6 +173,7 @@ class ParserGenerator:
 			if not template:
 				raise CCError(loc, f"nonterminal '{name}' not found")
 			nt_export = SymbolNonTerminal(f"{name}")
+			nt_export.type = template.type
 			nt_export.exported = True
 			nt_export.add_rule([template.instantiate(loc, ())], None)
 			self.grammar.add_nonterminal(nt_export)
@@ -206,27 +226,84 @@ class ParserGenerator:
 				unify_type(loc, nt.type, type)
 			type_locs[name] = loc
 
-	def run_lr(self) -> None:
+	def run(self) -> None:
+		self.write(self.build())
+
+	def build(self) -> Union[CodegenLH, CodegenLR]:
+		# tables and code of the selected backend, nothing is written until write
+		if self.backend == BackendLR:
+			return self.build_lr()
+		return self.build_lh()
+
+	def write(self, codegen: Union[CodegenLH, CodegenLR]) -> None:
+		with profiler.stage("codegen"):
+			codegen.write()
+		if isinstance(codegen, CodegenLH) and self.grammar.tables_path is not None:
+			ParserTables.from_codegen(codegen).save(self.grammar.tables_path)
+		print("Parser done")
+
+	def build_lr_table(self) -> Tuple[LRTable, RecoveryBuilder]:
 		print("Constructing parser")
 		print("LALR builder")
-		table = LALRBuilder(self.grammar).build()
-		print("Recovery builder")
-		recovery = RecoveryBuilder(self.grammar, table)
-		recovery.build()
+		with profiler.stage("lalr"):
+			table = LALRBuilder(self.grammar, self.lalr_lookaheads).build()
+		with profiler.stage("recovery"):
+			recovery = RecoveryBuilder(self.grammar, table)
+			recovery.build()
+		return table, recovery
+
+	def build_lr(self) -> CodegenLR:
+		if self.grammar.tables_path is not None:
+			raise CCError(None, "parser tables for the Python runtime are only produced by the lh backend")
+		table, recovery = self.build_lr_table()
 		print("Codegen")
-		codegen = Codegen(self.grammar, table)
-		codegen.run()
-		print("Parser done")
+		with profiler.stage("codegen"):
+			codegen = CodegenLR(self.grammar, table, recovery)
+			codegen.compute()
+		return codegen
 
-	def run_lh(self) -> None:
+	def run_lr(self) -> None:
+		self.write(self.build_lr())
+
+	def _cache_refs(self) -> ObjectRefs:
+		refs = ObjectRefs()
+		refs.add(('shift',), LHShift)
+		for terminal in self.grammar.terminals:
+			refs.add(('terminal', terminal.terminal.name), terminal)
+		# nonterminal names are not unique after template instantiation
+		for idx, nt in enumerate(self.grammar.nonterminals):
+			refs.add(('nonterminal', idx), nt)
+		for action in self.grammar.actions:
+			refs.add(('action', action.idx), action)
+		return refs
+
+	def build_lh_table(self) -> LHTable:
 		print("Constructing parser")
-		table = LHTableBuilder(self.grammar).build()
+		with profiler.stage("lh_table"):
+			table = LHTableBuilder(self.grammar).build()
 		print("Computing recovery")
-		recovery = LHRecovery(table)
-		recovery.compute()
-		print("Codegen")
-		codegen = CodegenLH(self.grammar, table)
-		codegen.run()
-		print("Parser done")
+		with profiler.stage("recovery"):
+			recovery = LHRecovery(table)
+			recovery.compute()
+		return table
 
+	def build_lh(self) -> CodegenLH:
+		if self.cache:
+			refs = self._cache_refs()
+			key = self.cache.key('parser.lh', self.shared, CacheSections)
+			table = self.cache.load(key, refs)
+			if table is None:
+				table = self.build_lh_table()
+				self.cache.store(key, table, refs)
+			else:
+				print("Using cached parser tables")
+		else:
+			table = self.build_lh_table()
+		print("Codegen")
+		with profiler.stage("codegen"):
+			codegen = CodegenLH(self.grammar, table, self.lh_dispatch)
+			codegen.compute()
+		return codegen
 
+	def run_lh(self) -> None:
+		self.write(self.build_lh())
@@ -219,6 +219,7 @@ class TemplateNonTerminal:
 		if len(values) > 0:
 			name = name + "[" + ','.join(map(str, values)) + "]"
 		nt = SymbolNonTerminal(name)
+		nt.type = self.type
 		self.instances[values] = nt
 		self.ctx.grammar.add_nonterminal(nt)
 		for rule_template in self.rules:
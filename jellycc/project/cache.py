@@ -0,0 +1,98 @@
+import hashlib
+import os
+import pickle
+from typing import Any, Dict, Hashable, IO, Iterable, List, Optional
+
+import jellycc
+from jellycc.project.grammar import SharedGrammar
+
+
+_fingerprint: Optional[str] = None
+
+
+def generator_fingerprint() -> str:
+	# cached artifacts are only valid for the exact generator sources that produced them
+	global _fingerprint
+	if _fingerprint is not None:
+		return _fingerprint
+	digest = hashlib.sha256(jellycc.__version__.encode('utf-8'))
+	package_dir = os.path.dirname(os.path.abspath(jellycc.__file__))
+	paths: List[str] = []
+	for dir_path, dir_names, file_names in os.walk(package_dir):
+		dir_names.sort()
+		for file_name in file_names:
+			if file_name.endswith('.py'):
+				paths.append(os.path.join(dir_path, file_name))
+	for path in sorted(paths):
+		digest.update(os.path.relpath(path, package_dir).encode('utf-8'))
+		with open(path, 'rb') as fp:
+			digest.update(fp.read())
+	_fingerprint = digest.hexdigest()
+	return _fingerprint
+
+
+class ObjectRefs:
+	# objects owned by the current project are stored as references, so loaded artifacts link to them instead of copies
+	def __init__(self) -> None:
+		self.ids: Dict[int, Hashable] = dict()
+		self.objects: Dict[Hashable, Any] = dict()
+
+	def add(self, ref: Hashable, obj: Any) -> None:
+		self.ids[id(obj)] = ref
+		self.objects[ref] = obj
+
+
+class _RefPickler(pickle.Pickler):
+	def __init__(self, fp: IO[bytes], refs: ObjectRefs) -> None:
+		super().__init__(fp, pickle.HIGHEST_PROTOCOL)
+		self.refs: ObjectRefs = refs
+
+	def persistent_id(self, obj: Any) -> Optional[Hashable]:
+		return self.refs.ids.get(id(obj), None)
+
+
+class _RefUnpickler(pickle.Unpickler):
+	def __init__(self, fp: IO[bytes], refs: ObjectRefs) -> None:
+		super().__init__(fp)
+		self.refs: ObjectRefs = refs
+
+	def persistent_load(self, ref: Hashable) -> Any:
+		return self.refs.objects[ref]
+
+
+class ArtifactCache:
+	def __init__(self, path: str) -> None:
+		self.path: str = path
+		self.fingerprint: str = generator_fingerprint()
+
+	def key(self, stage: str, shared: SharedGrammar, sections: Iterable[str]) -> str:
+		selected = frozenset(sections)
+		digest = hashlib.sha256()
+		digest.update(self.fingerprint.encode('utf-8'))
+		digest.update(stage.encode('utf-8'))
+		for name, text in shared.sections:
+			if name in selected:
+				digest.update(f"[{name}]{len(text)}:".encode('utf-8'))
+				digest.update(text.encode('utf-8'))
+		return f"{stage}-{digest.hexdigest()}"
+
+	def _entry_path(self, key: str) -> str:
+		return os.path.join(self.path, key + '.pickle')
+
+	def load(self, key: str, refs: ObjectRefs) -> Optional[Any]:
+		try:
+			with open(self._entry_path(key), 'rb') as fp:
+				return _RefUnpickler(fp, refs).load()
+		except FileNotFoundError:
+			return None
+		except Exception:
+			# truncated or incompatible entries are rebuilt and overwritten
+			return None
+
+	def store(self, key: str, value: Any, refs: ObjectRefs) -> None:
+		os.makedirs(self.path, exist_ok=True)
+		path = self._entry_path(key)
+		tmp_path = f"{path}.{os.getpid()}.tmp"
+		with open(tmp_path, 'wb') as fp:
+			_RefPickler(fp, refs).dump(value)
+		os.replace(tmp_path, path)
@@ -26,6 +26,10 @@ class SharedGrammar:
 		self.term_error: Optional[Terminal] = None
 		self.term_eof: Optional[Terminal] = None
 		self.base_dir: str = ""
+		self.sections: List[Tuple[str, str]] = []
+
+	def add_section(self, name: str, text: str) -> None:
+		self.sections.append((name, text))
 
 	def add_terminal(self, loc: SrcLoc, name: str, lang_name: str, tags: List[Tuple[str, Optional[int]]]) -> None:
 		if name in self.terminals:
@@ -66,31 +66,36 @@ class ProjectParser(ParserBase):
 				self.skip_inline_ws()
 				self.expect(']')
 				self.skip_empty_line()
-				if section_name == "lexer.fragments":
-					self.section_lexer_fragments()
-				elif section_name == "lexer.grammar":
-					self.section_lexer_grammar()
-				elif section_name == "parser.types":
-					self.section_parser_types()
-				elif section_name == "parser.vm_args":
-					self.section_parser_vm_args()
-				elif section_name == "parser.vm_actions":
-					self.section_parser_vm_actions()
-				elif section_name == "parser.grammar":
-					self.section_parser_grammar()
-				elif section_name == "parser.expose":
-					self.section_parser_expose()
-				elif section_name == "parser.header":
-					self.project.set_parser_header(self.loc(), self.section_code())
-				elif section_name == "parser.source":
-					self.project.set_parser_source(self.loc(), self.section_code())
-				elif section_name == "terminals":
-					self.section_terminals()
-				else:
-					self.report(f"unknown section {section_name}")
+				section_begin = self.save().pos
+				self.parse_section(section_name)
+				self.project.add_section(section_name, self.input.text(section_begin, self.save().pos))
 			else:
 				self.report("expected section")
 
+	def parse_section(self, section_name: str) -> None:
+		if section_name == "lexer.fragments":
+			self.section_lexer_fragments()
+		elif section_name == "lexer.grammar":
+			self.section_lexer_grammar()
+		elif section_name == "parser.types":
+			self.section_parser_types()
+		elif section_name == "parser.vm_args":
+			self.section_parser_vm_args()
+		elif section_name == "parser.vm_actions":
+			self.section_parser_vm_actions()
+		elif section_name == "parser.grammar":
+			self.section_parser_grammar()
+		elif section_name == "parser.expose":
+			self.section_parser_expose()
+		elif section_name == "parser.header":
+			self.project.set_parser_header(self.loc(), self.section_code())
+		elif section_name == "parser.source":
+			self.project.set_parser_source(self.loc(), self.section_code())
+		elif section_name == "terminals":
+			self.section_terminals()
+		else:
+			self.report(f"unknown section {section_name}")
+
 	def section_code(self) -> str:
 		s = []
 		line_is_clear = True
@@ -6,6 +6,7 @@ from jellycc.parser.run import ParserGenerator
 from jellycc.parser.template import TemplateExpr, TemplateSymbol, TemplateAction
 from jellycc.project.grammar import CodeBlock, SharedGrammar
 from jellycc.utils.error import CCError
+from jellycc.utils.profile import profiler
 from jellycc.utils.source import SrcLoc
 
 
@@ -15,6 +16,9 @@ class Project:
 		self.parser_generator: ParserGenerator = ParserGenerator(self.grammar)
 		self.lexer_generator: LexerGenerator = LexerGenerator(self.grammar)
 
+	def add_section(self, name: str, text: str) -> None:
+		self.grammar.add_section(name, text)
+
 	def add_lexer_fragment(self, loc: SrcLoc, name: str, re: Re) -> None:
 		self.lexer_generator.nfa_ctx.add_fragment(loc, name, re)
 
@@ -60,10 +64,14 @@ class Project:
 			raise CCError(loc, f"parser.source block already defined at {self.parser_generator.grammar.parser_source.loc}")
 		self.parser_generator.grammar.parser_source = CodeBlock(loc, contents)
 
-	def process(self) -> None:
+	def process(self, lexer: bool = True, parser: bool = True) -> None:
 		self._construct()
-		self.lexer_generator.construct()
-		self.parser_generator.construct()
+		if lexer:
+			with profiler.stage("lexer.construct"):
+				self.lexer_generator.construct()
+		if parser:
+			with profiler.stage("parser.construct"):
+				self.parser_generator.construct()
 
 	def _construct(self) -> None:
 		self._assign_terminal_values()
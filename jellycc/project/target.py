@@ -0,0 +1,130 @@
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple, List
+
+from jellycc.lexer.grammar import DefaultOffsetWidth, LoopUnrolled, TableDense
+from jellycc.parser.ll.codegen import DispatchDense
+from jellycc.parser.lr.lalr import LookaheadsPropagate
+from jellycc.parser.run import BackendLH
+from jellycc.project.cache import ArtifactCache
+from jellycc.project.parser import parse_project
+from jellycc.project.project import Project
+from jellycc.utils.error import CCError
+from jellycc.utils.profile import profiler, StageStats
+from jellycc.utils.source import source_file
+
+
+class BuildTarget:
+	def __init__(self, input: str) -> None:
+		self.input: str = input
+		self.lexer_header: Optional[str] = None
+		self.lexer_source: Optional[str] = None
+		self.lexer_tables: Optional[str] = None
+		self.lexer_offsets: int = DefaultOffsetWidth
+		self.lexer_loop: str = LoopUnrolled
+		self.lexer_layout: str = TableDense
+		self.lexer_parallel: bool = False
+		self.parser_header: Optional[str] = None
+		self.parser_source: Optional[str] = None
+		self.parser_tables: Optional[str] = None
+		self.lexer_ns: str = 'll'
+		self.lexer_prefix: str = 'LL'
+		self.parser_ns: str = 'pp'
+		self.parser_prefix: str = 'PP'
+		self.parser_dispatch: str = DispatchDense
+		self.parser_backend: str = BackendLH
+		self.lalr_lookaheads: str = LookaheadsPropagate
+		self.base_dir: Optional[str] = None
+		self.cache_dir: Optional[str] = None
+		self.parallel: bool = False
+
+	def has_lexer(self) -> bool:
+		return bool(self.lexer_header or self.lexer_source or self.lexer_tables)
+
+	def has_parser(self) -> bool:
+		return bool(self.parser_header or self.parser_source or self.parser_tables)
+
+
+def load_project(target: BuildTarget, lexer: bool = True, parser: bool = True) -> Project:
+	with profiler.stage("parse"):
+		project: Project = parse_project(source_file(target.input))
+	project.process(lexer, parser)
+
+	project.grammar.base_dir = target.base_dir if target.base_dir else os.getcwd()
+
+	if target.cache_dir:
+		cache = ArtifactCache(target.cache_dir)
+		project.lexer_generator.cache = cache
+		project.parser_generator.cache = cache
+
+	lexer_grammar = project.lexer_generator.lexer_grammar
+	lexer_grammar.prefix = target.lexer_prefix
+	lexer_grammar.namespace = target.lexer_ns
+	lexer_grammar.header_path = target.lexer_header
+	lexer_grammar.source_path = target.lexer_source
+	lexer_grammar.tables_path = target.lexer_tables
+	lexer_grammar.offset_width = target.lexer_offsets
+	lexer_grammar.loop = target.lexer_loop
+	lexer_grammar.table_layout = target.lexer_layout
+	lexer_grammar.parallel = target.lexer_parallel
+
+	parser_grammar = project.parser_generator.grammar
+	parser_grammar.prefix = target.parser_prefix
+	parser_grammar.ns = target.parser_ns
+	parser_grammar.core_header_path = target.parser_header
+	parser_grammar.core_source_path = target.parser_source
+	parser_grammar.tables_path = target.parser_tables
+	project.parser_generator.lh_dispatch = target.parser_dispatch
+	project.parser_generator.backend = target.parser_backend
+	project.parser_generator.lalr_lookaheads = target.lalr_lookaheads
+
+	return project
+
+
+def run_lexer_process(target: BuildTarget, profile: bool) -> Tuple[Optional[str], List[StageStats]]:
+	# the project is parsed again from the target instead of shipping the lexer state between processes
+	if profile:
+		profiler.enable()
+	try:
+		project = load_project(target, parser=False)
+		with profiler.stage("lexer"):
+			project.lexer_generator.run()
+	except CCError as e:
+		return str(e), []
+	sys.stdout.flush()
+	return None, list(profiler.stages.values())
+
+
+def build_target(target: BuildTarget) -> None:
+	if target.parallel and target.has_lexer() and target.has_parser():
+		with ProcessPoolExecutor(max_workers=1) as executor:
+			lexer_future = executor.submit(run_lexer_process, target, profiler.enabled)
+			project = load_project(target, lexer=False)
+			print("WARNING! Parser generation is incomplete and should not be used")
+			with profiler.stage("parser"):
+				codegen = project.parser_generator.build()
+			with profiler.stage("lexer_process"):
+				error, stages = lexer_future.result()
+				profiler.merge(stages)
+		# the parser outputs are only written once the lexer is known to have succeeded
+		if error is not None:
+			raise CCError(None, error)
+		with profiler.stage("parser"):
+			project.parser_generator.write(codegen)
+		return
+
+	# a lexer-only build does not need the parser sections to be complete, a dry run checks everything
+	project = load_project(target, parser=target.has_parser() or not target.has_lexer())
+
+	if target.has_lexer():
+		with profiler.stage("lexer"):
+			project.lexer_generator.run()
+
+	if target.has_parser():
+		print("WARNING! Parser generation is incomplete and should not be used")
+		with profiler.stage("parser"):
+			project.parser_generator.run()
+
+	if not target.has_lexer() and not target.has_parser():
+		print("Dry run: no files generated")
@@ -1,8 +1,10 @@
-from jellycc.project.parser import parse_project
-from jellycc.project.project import Project
-from jellycc.utils.source import source_file
+from jellycc.lexer.grammar import OffsetWidths, DefaultOffsetWidth, LoopModes, LoopUnrolled, TableLayouts, TableDense
+from jellycc.parser.ll.codegen import DispatchLayouts, DispatchDense
+from jellycc.parser.lr.lalr import LookaheadEngines, LookaheadsPropagate
+from jellycc.parser.run import Backends, BackendLH
+from jellycc.project.target import BuildTarget, build_target
+from jellycc.utils.profile import profiler
 import argparse
-import os
 
 
 parser = argparse.ArgumentParser(
@@ -11,58 +13,61 @@ parser = argparse.ArgumentParser(
 
 parser.add_argument('--lexer-header', dest='lexer_header', nargs=1, help='path to lexer header')
 parser.add_argument('--lexer-source', dest='lexer_source', nargs=1, help='path to lexer source')
+parser.add_argument('--lexer-tables', dest='lexer_tables', nargs=1, help='path to lexer tables as JSON, for jellycc.lexer.runtime')
+parser.add_argument('--lexer-offsets', dest='lexer_offsets', type=int, choices=OffsetWidths, default=DefaultOffsetWidth, help='bits in lexer token offsets, 64 for inputs of 4 GiB and more')
+parser.add_argument('--lexer-loop', dest='lexer_loop', choices=LoopModes, default=LoopUnrolled, help='variant of the generated lexer loop')
+parser.add_argument('--lexer-layout', dest='lexer_layout', choices=TableLayouts, default=TableDense, help='layout of the lexer transition table, comb packs sparse rows')
+parser.add_argument('--lexer-parallel', dest='lexer_parallel', action='store_true', help='add run_parallel to the lexer, which lexes chunks of the input on several threads')
 parser.add_argument('--parser-header', dest='parser_header', nargs=1, help='path to parser header')
 parser.add_argument('--parser-source', dest='parser_source', nargs=1, help='path to parser source')
+parser.add_argument('--parser-tables', dest='parser_tables', nargs=1, help='path to parser tables as JSON, for jellycc.parser.ll.runtime')
 parser.add_argument('--base-dir', dest='base_dir', nargs=1, help='overrides the base location for #line directives')
 parser.add_argument('--lexer-ns', dest='lexer_ns', default='ll')
 parser.add_argument('--lexer-prefix', dest='lexer_prefix', default='LL')
 parser.add_argument('--parser-ns', dest='parser_ns', default='pp')
 parser.add_argument('--parser-prefix', dest='parser_prefix', default='PP')
+parser.add_argument('--parser-dispatch', dest='parser_dispatch', choices=DispatchLayouts, default=DispatchDense, help='layout of the parser token dispatch tables')
+parser.add_argument('--backend', dest='parser_backend', choices=Backends, default=BackendLH, help='parser backend, lh tables with error correction and recovery or lr for compressed LALR(1) tables, which only recover by discarding states and skipping tokens')
+parser.add_argument('--lalr-lookaheads', dest='lalr_lookaheads', choices=LookaheadEngines, default=LookaheadsPropagate, help='LALR(1) lookahead engine of the lr backend, deremer-pennello is faster on large grammars')
+parser.add_argument('--cache-dir', dest='cache_dir', nargs=1, help='reuse lexer and parser tables stored in this directory')
+parser.add_argument('--profile', dest='profile', nargs=1, help='write a JSON report with time and memory used by each stage, - for stdout')
+parser.add_argument('--serial', dest='serial', action='store_true', help='generate lexer and parser in this process one after another')
 parser.add_argument('input', metavar='input', type=str, nargs=1, help='grammar file')
 
 
-args = parser.parse_args()
-
-
-input_file = args.input
-
-project: Project = parse_project(source_file(input_file[0]))
-project.process()
-
-if args.base_dir:
-	project.grammar.base_dir = args.base_dir[0]
-else:
-	project.grammar.base_dir = os.getcwd()
-
-dry_run = True
-
-if args.lexer_header or args.lexer_source:
-	dry_run = False
-
-	project.lexer_generator.lexer_grammar.prefix = args.lexer_prefix
-	project.lexer_generator.lexer_grammar.namespace = args.lexer_ns
-
-	if args.lexer_header:
-		project.lexer_generator.lexer_grammar.header_path = args.lexer_header[0]
-	if args.lexer_source:
-		project.lexer_generator.lexer_grammar.source_path = args.lexer_source[0]
-
-	project.lexer_generator.run()
-
-
-if args.parser_header or args.parser_source:
-	dry_run = False
-	print("WARNING! Parser generation is incomplete and should not be used")
-
-	project.parser_generator.grammar.prefix = args.parser_prefix
-	project.parser_generator.grammar.ns = args.parser_ns
-
-	if args.parser_header:
-		project.parser_generator.grammar.core_header_path = args.parser_header[0]
-	if args.parser_source:
-		project.parser_generator.grammar.core_source_path = args.parser_source[0]
-
-	project.parser_generator.run_lh()
-
-if dry_run:
-	print("Dry run: no files generated")
+def main() -> None:
+	args = parser.parse_args()
+
+	if args.profile:
+		profiler.enable()
+
+	target = BuildTarget(args.input[0])
+	target.lexer_header = args.lexer_header[0] if args.lexer_header else None
+	target.lexer_source = args.lexer_source[0] if args.lexer_source else None
+	target.lexer_tables = args.lexer_tables[0] if args.lexer_tables else None
+	target.parser_header = args.parser_header[0] if args.parser_header else None
+	target.parser_source = args.parser_source[0] if args.parser_source else None
+	target.parser_tables = args.parser_tables[0] if args.parser_tables else None
+	target.lexer_offsets = args.lexer_offsets
+	target.lexer_loop = args.lexer_loop
+	target.lexer_layout = args.lexer_layout
+	target.lexer_parallel = args.lexer_parallel
+	target.lexer_ns = args.lexer_ns
+	target.lexer_prefix = args.lexer_prefix
+	target.parser_ns = args.parser_ns
+	target.parser_prefix = args.parser_prefix
+	target.parser_dispatch = args.parser_dispatch
+	target.parser_backend = args.parser_backend
+	target.lalr_lookaheads = args.lalr_lookaheads
+	target.base_dir = args.base_dir[0] if args.base_dir else None
+	target.cache_dir = args.cache_dir[0] if args.cache_dir else None
+	target.parallel = not args.serial
+
+	build_target(target)
+
+	if args.profile:
+		profiler.write(args.profile[0])
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,23 @@
+from typing import Iterable, TypeVar, Callable, Generator, List, Set
+
+T = TypeVar('T')
+
+
+def depth_first(
+	roots: Iterable[T],
+	walker: Callable[[T], Iterable[T]]
+) -> Generator[T, None, None]:
+	# yields nodes in the same preorder as a recursive traversal, without recursing
+	visited: Set[T] = set()
+	stack: List[T] = []
+	for root in roots:
+		stack.append(root)
+		while len(stack) > 0:
+			node = stack.pop()
+			if node in visited:
+				continue
+			visited.add(node)
+			yield node
+			targets = list(walker(node))
+			targets.reverse()
+			stack.extend(targets)
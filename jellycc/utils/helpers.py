@@ -23,3 +23,10 @@ def chunked(itr: Iterable[T], max_len: int) -> Generator[List[T], None, None]:
 			if len(list) > 0:
 				yield list
 			return
+
+
+def iter_bits(mask: int) -> Generator[int, None, None]:
+	while mask:
+		low = mask & -mask
+		yield low.bit_length() - 1
+		mask ^= low
@@ -0,0 +1,120 @@
+import functools
+import gc
+import json
+import time
+import tracemalloc
+from typing import Dict, List, Any, Iterator, Callable, TypeVar, cast
+from contextlib import contextmanager
+
+
+F = TypeVar('F', bound=Callable[..., Any])
+
+
+class StageStats:
+	def __init__(self, name: str) -> None:
+		self.name: str = name
+		self.calls: int = 0
+		self.seconds: float = 0.0
+		self.peak_bytes: int = 0
+		self.objects: int = 0
+		self.objects_delta: int = 0
+
+	def to_json(self) -> Dict[str, Any]:
+		return {
+			"name": self.name,
+			"calls": self.calls,
+			"seconds": self.seconds,
+			"peak_bytes": self.peak_bytes,
+			"objects": self.objects,
+			"objects_delta": self.objects_delta
+		}
+
+
+class Profiler:
+	def __init__(self) -> None:
+		self.enabled: bool = False
+		self.stages: Dict[str, StageStats] = dict()
+		self.stack: List[StageStats] = []
+		self.started: float = 0.0
+		self.peak_bytes: int = 0
+
+	def enable(self) -> None:
+		self.enabled = True
+		self.started = time.perf_counter()
+		if not tracemalloc.is_tracing():
+			tracemalloc.start()
+
+	def _flush_peak(self) -> None:
+		# the peak since the last flush belongs to every stage that is currently open
+		peak = tracemalloc.get_traced_memory()[1]
+		self.peak_bytes = max(self.peak_bytes, peak)
+		for stats in self.stack:
+			stats.peak_bytes = max(stats.peak_bytes, peak)
+		if hasattr(tracemalloc, 'reset_peak'):
+			tracemalloc.reset_peak()
+
+	@contextmanager
+	def stage(self, name: str) -> Iterator[None]:
+		if not self.enabled:
+			yield
+			return
+		path = f"{self.stack[-1].name}/{name}" if self.stack else name
+		stats = self.stages.get(path, None)
+		if stats is None:
+			stats = StageStats(path)
+			self.stages[path] = stats
+		# object counts are taken outside the measured window, the list they build is not part of the stage
+		objects_before = len(gc.get_objects())
+		self._flush_peak()
+		self.stack.append(stats)
+		begin = time.perf_counter()
+		try:
+			yield
+		finally:
+			stats.seconds += time.perf_counter() - begin
+			stats.calls += 1
+			self._flush_peak()
+			self.stack.pop()
+			objects = len(gc.get_objects())
+			stats.objects = objects
+			stats.objects_delta += objects - objects_before
+
+	def merge(self, stages: List[StageStats]) -> None:
+		# stages recorded by a worker process, nested under the stage that is open here
+		prefix = f"{self.stack[-1].name}/" if self.stack else ""
+		for stats in stages:
+			stats.name = prefix + stats.name
+			self.stages[stats.name] = stats
+			self.peak_bytes = max(self.peak_bytes, stats.peak_bytes)
+
+	def report(self) -> Dict[str, Any]:
+		if self.enabled:
+			self._flush_peak()
+		return {
+			"total_seconds": time.perf_counter() - self.started if self.enabled else 0.0,
+			"peak_bytes": self.peak_bytes,
+			"stages": [stats.to_json() for stats in self.stages.values()]
+		}
+
+	def write(self, path: str) -> None:
+		text = json.dumps(self.report(), indent='\t')
+		if path == '-':
+			print(text)
+		else:
+			with open(path, 'w') as fp:
+				fp.write(text)
+				fp.write('\n')
+
+
+# disabled until enable() is called, so stages cost almost nothing in normal runs
+profiler = Profiler()
+
+
+def profiled(name: str) -> Callable[[F], F]:
+	def decorator(fn: F) -> F:
+		@functools.wraps(fn)
+		def wrapper(*args: Any, **kwargs: Any) -> Any:
+			with profiler.stage(name):
+				return fn(*args, **kwargs)
+		return cast(F, wrapper)
+	return decorator
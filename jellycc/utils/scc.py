@@ -1,12 +1,13 @@
-from typing import Iterable, TypeVar, Callable, Generator, List, Optional, Dict
+from typing import Iterable, Iterator, TypeVar, Callable, Generator, List, Dict, Tuple, Generic
 
 T = TypeVar('T')
 
 
-class _SCCInfo:
+class _SCCInfo(Generic[T]):
 	def __init__(self, node: T):
-		self.index: Optional[int] = None
-		self.lowlink: Optional[int] = None
+		# index and lowlink are -1 until the node is entered
+		self.index: int = -1
+		self.lowlink: int = -1
 		self.onstack: bool = False
 		self.node: T = node
 
@@ -15,56 +16,65 @@ def topological_sort(
 	nodes: Iterable[T],
 	walker: Callable[
 		[T],
-		Generator[T, None, None]
+		Iterable[T]
 	]
 ) -> Generator[List[T], None, None]:
 	index: int = 0
-	stack: List[_SCCInfo] = []
-	data: Dict[T, _SCCInfo] = dict()
-	worklist: List[_SCCInfo] = []
+	stack: List[_SCCInfo[T]] = []
+	data: Dict[T, _SCCInfo[T]] = dict()
+	worklist: List[_SCCInfo[T]] = []
+	# explicit call stack of tarjan's strongconnect, each frame holds the node and its remaining edges
+	frames: List[Tuple[_SCCInfo[T], Iterator[T]]] = []
 
-	def get_info(node):
+	def get_info(node: T) -> _SCCInfo[T]:
 		if node not in data:
 			v = _SCCInfo(node)
 			worklist.append(v)
 			data[node] = v
 		return data[node]
 
-	def strongconnect(v):
+	def enter(v: _SCCInfo[T]) -> None:
 		nonlocal index
 		v.index = index
 		v.lowlink = index
 		index += 1
 		stack.append(v)
 		v.onstack = True
-
-		for node in walker(v.node):
-			w = get_info(node)
-			if w.index is None:
-				yield from strongconnect(w)
-				v.lowlink = min(v.lowlink, w.lowlink)
-			elif w.onstack:
-				v.lowlink = min(v.lowlink, w.index)
-
-		if v.lowlink == v.index:
-			scc = []
-
-			while True:
-				w = stack.pop()
-				w.onstack = False
-				scc.append(w.node)
-				w.scc = scc
-				if w == v:
-					break
-
-			yield scc
+		frames.append((v, iter(walker(v.node))))
 
 	for node in nodes:
 		get_info(node)
 
 	i = 0
 	while i < len(worklist):
-		v = worklist[i]
-		if v.index is None:
-			yield from strongconnect(v)
+		root = worklist[i]
 		i += 1
+		if root.index >= 0:
+			continue
+		enter(root)
+		while len(frames) > 0:
+			v, edges = frames[-1]
+			for node in edges:
+				w = get_info(node)
+				if w.index < 0:
+					enter(w)
+					break
+				elif w.onstack:
+					v.lowlink = min(v.lowlink, w.index)
+			else:
+				frames.pop()
+				if len(frames) > 0:
+					parent = frames[-1][0]
+					parent.lowlink = min(parent.lowlink, v.lowlink)
+
+				if v.lowlink == v.index:
+					scc: List[T] = []
+
+					while True:
+						w = stack.pop()
+						w.onstack = False
+						scc.append(w.node)
+						if w == v:
+							break
+
+					yield scc
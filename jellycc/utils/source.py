@@ -34,6 +34,9 @@ class SourceInput:
 	def loc(self) -> SrcLoc:
 		return SrcLoc(self.path, self._line, self._col)
 
+	def text(self, begin: int, end: int) -> str:
+		return self._contents[begin:end]
+
 	def peek(self) -> Optional[str]:
 		if self._pos >= len(self._contents):
 			return None
@@ -0,0 +1,80 @@
+import os
+from typing import Dict, List, Optional, Tuple
+
+import pytest
+
+from jellycc.lexer.dfa import Builder, DFA, NoState
+from jellycc.lexer.dfa_minimize import MinimizeDFA, HopcroftMinimizeDFA
+from jellycc.project.grammar import Terminal
+from jellycc.project.parser import parse_project
+from jellycc.utils.source import SourceInput, source_file
+
+
+ExamplesDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples")
+
+# keywords share prefixes with each other and with identifiers, so minimization has states to merge
+KeywordGrammar = """[terminals]
+
+"if": K_if;
+"in": K_in;
+"int": K_int;
+"for": K_for;
+"format": K_format;
+identifier: Identifier;
+decimal_lit: Decimal;
+space: "Space" {skip};
+eof: "EoF" {eof};
+error: "Error" {error};
+
+[lexer.grammar]
+
+"if";
+"in";
+"int";
+"for";
+"format";
+identifier: [a-zA-Z_] [a-zA-Z0-9_]*;
+decimal_lit: [0-9]+;
+space: [ \\t\\r\\n]+;
+"""
+
+
+def build_dfa(input: SourceInput) -> DFA:
+	project = parse_project(input)
+	project.process(parser=False)
+	generator = project.lexer_generator
+	assert generator.shared.term_error is not None
+	return Builder(generator.shared.term_error, generator.nfa_rules, 0).build(generator.nfa_init)
+
+
+def canonical(dfa: DFA) -> List[Tuple[Optional[Terminal], Tuple[int, ...]]]:
+	# states renumbered in breadth first order from the initial state, two dfas over the same byte classes
+	# are isomorphic exactly when their canonical forms are equal
+	order: Dict[int, int] = {0: 0}
+	states = [0]
+	rows = []
+	for state in states:
+		targets = []
+		for target in dfa.row(state):
+			if target != NoState and target not in order:
+				order[target] = len(states)
+				states.append(target)
+			targets.append(NoState if target == NoState else order[target])
+		accept = dfa.accepts[state]
+		rows.append((None if accept is None else accept.terminal, tuple(targets)))
+	return rows
+
+
+@pytest.mark.parametrize("input", [
+	source_file(os.path.join(ExamplesDir, "test1.jcc")),
+	source_file(os.path.join(ExamplesDir, "jellyscript.jcc")),
+	SourceInput("<keywords>", KeywordGrammar),
+], ids=["test1", "jellyscript", "keywords"])
+def test_hopcroft_matches_pairwise(input: SourceInput) -> None:
+	dfa = build_dfa(input)
+	pairwise = MinimizeDFA().run(dfa)
+	hopcroft = HopcroftMinimizeDFA().run(dfa)
+	assert hopcroft.num_states == pairwise.num_states
+	assert hopcroft.num_states < dfa.num_states
+	assert hopcroft.classes == pairwise.classes
+	assert canonical(hopcroft) == canonical(pairwise)
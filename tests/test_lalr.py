@@ -0,0 +1,38 @@
+import os
+from typing import Any, Dict, List, Tuple
+
+from jellycc.parser.grammar import SymbolNonTerminal
+from jellycc.parser.lr.lalr import LALRBuilder, LRTable, LookaheadEngines
+from jellycc.parser.lr.lr1 import Shift
+from jellycc.project.parser import parse_project
+from jellycc.utils.source import source_file
+
+
+ExamplesDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples")
+
+
+def table_maps(table: LRTable) -> List[Tuple[Dict[str, Any], Dict[SymbolNonTerminal, int]]]:
+	# states of different builds are distinct objects, shift and goto targets are compared by state index;
+	# both builds share the grammar, so its symbols and productions compare as they are
+	index = {id(state): idx for idx, state in enumerate(table.states)}
+	maps = []
+	for state in table.states:
+		actions: Dict[str, Any] = dict()
+		for terminal, action in state.actions.items():
+			if isinstance(action, Shift):
+				actions[terminal.terminal.name] = ("shift", index[id(action.state)])
+			else:
+				actions[terminal.terminal.name] = action
+		gotos = {nt: index[id(target)] for nt, target in state.gotos.items()}
+		maps.append((actions, gotos))
+	return maps
+
+
+def test_lookahead_engines_agree_on_test1() -> None:
+	project = parse_project(source_file(os.path.join(ExamplesDir, "test1.jcc")))
+	project.process()
+	grammar = project.parser_generator.grammar
+	tables = [LALRBuilder(grammar, engine).build() for engine in LookaheadEngines]
+	assert len(tables[0].states) > 0
+	for table in tables[1:]:
+		assert table_maps(table) == table_maps(tables[0])